@@ -0,0 +1,164 @@
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+
+
+class IVFIndex:
+    """Inverted-file approximate nearest-neighbour index over normalized rows.
+
+    Spherical k-means centroids partition the rows into lists; a query only
+    scores the rows in its `nprobe` closest lists. Raising nprobe trades
+    latency for recall, and nprobe == n_lists is an exact scan. New rows are
+    assigned to their nearest centroid as they are inserted, without
+    retraining.
+
+    Recall depends on how the rows cluster, not just on nprobe. With the
+    default 2 * sqrt(rows) lists and nprobe=32, on synthetic 768-dim data
+    with 500 topic clusters (benchmarks/bench_ann.py), recall@5 against
+    the exact scan is about 0.85 at 20k rows, 0.96 at 50k and 0.99 at
+    100k. It is lower when there are fewer rows per topic: 100k rows in
+    1000 clusters give about 0.81. Check a sample of real embeddings
+    with bench_ann before lowering nprobe.
+    """
+
+    def __init__(self, n_lists: Optional[int] = None, nprobe: int = 32,
+                 train_iterations: int = 10, max_train_rows: int = 50_000, seed: int = 0):
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.train_iterations = train_iterations
+        self.max_train_rows = max_train_rows
+        self.seed = seed
+        self.centroids = None
+        self.trained_rows = 0
+        self._lists: List[List[int]] = []
+        self._arrays: List[Optional[np.ndarray]] = []
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def train(self, vectors: np.ndarray, total_rows: Optional[int] = None) -> None:
+        """Fit centroids with spherical k-means on (a sample of) the rows.
+
+        `total_rows` sizes the index when `vectors` is already a sample of a
+        larger set of rows.
+        """
+        rng = np.random.default_rng(self.seed)
+        total_rows = total_rows or len(vectors)
+        n_lists = self.n_lists or max(1, int(2 * np.sqrt(total_rows)))
+        n_lists = min(n_lists, len(vectors))
+
+        # ~40 rows per centroid is plenty for k-means to settle
+        sample_rows = min(self.max_train_rows, 40 * n_lists)
+        sample = vectors
+        if len(vectors) > sample_rows:
+            sample = vectors[np.sort(rng.choice(len(vectors), sample_rows, replace=False))]
+        sample = np.asarray(sample, dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), n_lists, replace=False)].copy()
+        for _ in range(self.train_iterations):
+            assignments = self._nearest(sample, centroids)
+            counts = np.bincount(assignments, minlength=n_lists)
+
+            # Per-list sums via one sort + reduceat; much faster than np.add.at
+            order = np.argsort(assignments, kind='stable')
+            occupied = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts[occupied])[:-1]))
+            sums = np.zeros_like(centroids)
+            sums[occupied] = np.add.reduceat(sample[order], starts, axis=0)
+
+            # Re-seed empty lists from random rows so every centroid stays useful
+            empty = counts == 0
+            if empty.any():
+                sums[empty] = sample[rng.choice(len(sample), int(empty.sum()), replace=False)]
+
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            centroids = sums / norms
+
+        self.centroids = centroids.astype(np.float32)
+        self.trained_rows = total_rows
+        self._lists = [[] for _ in range(n_lists)]
+        self._arrays = [None] * n_lists
+
+    @staticmethod
+    def _nearest(vectors: np.ndarray, centroids: np.ndarray, batch: int = 8192) -> np.ndarray:
+        """Index of the most similar centroid for each row."""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for i in range(0, len(vectors), batch):
+            assignments[i:i + batch] = np.argmax(vectors[i:i + batch] @ centroids.T, axis=1)
+        return assignments
+
+    def add(self, rows: np.ndarray, vectors: np.ndarray) -> None:
+        """Assign rows (with their normalized vectors) to their nearest lists."""
+        self.add_assigned(rows, self._nearest(vectors, self.centroids))
+
+    def add_assigned(self, rows: np.ndarray, assignments: np.ndarray) -> None:
+        """Insert rows whose list assignments are already known."""
+        for row, list_id in zip(np.asarray(rows).tolist(), np.asarray(assignments).tolist()):
+            self._lists[list_id].append(row)
+            self._arrays[list_id] = None
+
+    def _list_array(self, list_id: int) -> np.ndarray:
+        array = self._arrays[list_id]
+        if array is None:
+            array = self._arrays[list_id] = np.array(self._lists[list_id], dtype=np.int64)
+        return array
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """Row ids in the lists closest to the query."""
+        nprobe = min(nprobe or self.nprobe, len(self._lists))
+        similarity = self.centroids @ query
+        if nprobe < len(self._lists):
+            probe = np.argpartition(-similarity, nprobe - 1)[:nprobe]
+        else:
+            probe = np.arange(len(self._lists))
+        return np.concatenate([self._list_array(list_id) for list_id in probe])
+
+    def search(self, score_rows: Callable[[np.ndarray], np.ndarray], query: np.ndarray, top_n: int,
+               alive: Optional[np.ndarray] = None, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top_n (rows, scores) for a normalized query.
+
+        score_rows(rows) returns the query's similarity to each of the rows.
+        """
+        rows = self.candidates(query, nprobe)
+        if alive is not None:
+            rows = rows[alive[rows]]
+        if not len(rows):
+            return rows, np.empty(0, dtype=np.float32)
+
+        # Sorted row ids make the gather walk the matrix front to back
+        rows = np.sort(rows)
+        scores = score_rows(rows)
+        if top_n < len(rows):
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return rows[top], scores[top]
+
+    def state(self, rows: np.ndarray, total_rows: int) -> dict:
+        """Arrays needed to restore the index for `rows`, renumbered 0..len(rows)-1."""
+        assignment = np.full(total_rows, -1, dtype=np.int32)
+        for list_id, members in enumerate(self._lists):
+            if members:
+                assignment[members] = list_id
+        return {
+            'centroids': self.centroids,
+            'assignments': assignment[rows],
+            'trained_rows': np.int64(self.trained_rows)
+        }
+
+    def load_state(self, state: dict) -> np.ndarray:
+        """Restore from state(); returns the rows that had no list and still need add()."""
+        self.centroids = np.asarray(state['centroids'], dtype=np.float32)
+        self.trained_rows = int(state['trained_rows'])
+        self._lists = [[] for _ in range(len(self.centroids))]
+        self._arrays = [None] * len(self.centroids)
+
+        assignments = np.asarray(state['assignments'])
+        assigned = assignments >= 0
+        self.add_assigned(np.flatnonzero(assigned), assignments[assigned])
+        return np.flatnonzero(~assigned)
+
+    def __len__(self) -> int:
+        return sum(len(members) for members in self._lists)
@@ -0,0 +1,114 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from typing import Iterable, Optional, Sequence
+
+
+class AnswerCache:
+    """LRU + TTL cache of chat answers for repeated and near-duplicate questions.
+
+    Entries are keyed on the normalized query text, the corpus version and
+    the source filter, so an answer is never served for a corpus it was not
+    generated from. lookup() matches the exact normalized text; lookup_similar()
+    finds a cached question whose embedding is within similarity_threshold.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 3600, similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing punctuation."""
+        return re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!.').strip()
+
+    @staticmethod
+    def _key(query: str, corpus_version: int, sources: Optional[Iterable[str]]) -> tuple:
+        return (AnswerCache.normalize_query(query), corpus_version,
+                tuple(sorted(set(sources))) if sources is not None else None)
+
+    def _expired(self, entry: dict, now: float) -> bool:
+        return now - entry['created'] > self.ttl_seconds
+
+    def lookup(self, query: str, corpus_version: int, sources: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """Exact match on normalized query text; does not count a miss."""
+        key = self._key(query, corpus_version, sources)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry, now):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry['result']
+
+    def lookup_similar(self, query_embedding: Sequence[float], corpus_version: int,
+                       sources: Optional[Iterable[str]] = None) -> Optional[dict]:
+        """Best cached answer whose question embedding is close enough to this one."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query = query / norm
+        sources_key = tuple(sorted(set(sources))) if sources is not None else None
+        now = time.time()
+
+        with self._lock:
+            best_key, best_score = None, self.similarity_threshold
+            for key, entry in list(self._entries.items()):
+                if self._expired(entry, now):
+                    del self._entries[key]
+                    continue
+                if key[1] != corpus_version or key[2] != sources_key or entry['embedding'] is None:
+                    continue
+                score = float(entry['embedding'] @ query)
+                if score >= best_score:
+                    best_key, best_score = key, score
+
+            if best_key is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key]['result']
+
+    def put(self, query: str, corpus_version: int, result: dict,
+            query_embedding: Optional[Sequence[float]] = None, sources: Optional[Iterable[str]] = None) -> None:
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+
+        key = self._key(query, corpus_version, sources)
+        with self._lock:
+            self._entries[key] = {'result': result, 'embedding': embedding, 'created': time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'semantic_hits': self.semantic_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0
+        }
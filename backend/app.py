@@ -1,20 +1,34 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
-import tempfile
+import json
+import uuid
+import base64
+from datetime import datetime
 from werkzeug.utils import secure_filename
-import threading
-import time
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
 from flask_bcrypt import Bcrypt
-from database import db, User, ChatSession, ChatMessage
+from database import db, User, ChatSession, ChatMessage, IngestionJob
+
+from ingestion_queue import ACTIVE_STATUSES, IngestionQueue, QueueFullError
+from metrics import REGISTRY, collect_timings, timings_ms
 
 # Import your main RAG functions
 from main import (
-    process_uploaded_file,
     chat_query,
+    stream_chat_query,
     clear_database,
-    VECTOR_DB
+    delete_document,
+    list_documents,
+    sync_index,
+    VECTOR_DB,
+    EMBEDDER,
+    EMBEDDING_CACHE,
+    ANSWER_CACHE,
+    QUERY_BATCHER,
+    SESSION_CONTEXTS,
+    SESSION_RETRIEVAL,
+    RERANKER
 )
 
 app = Flask(__name__)
@@ -22,17 +36,27 @@ CORS(app, resources={
     r"/*": {
         "origins": "*",
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "allow_headers": ["Content-Type", "Authorization"],
+        "expose_headers": ["X-Next-Cursor"]
     }
 })
 
 # Configuration
 UPLOAD_FOLDER = 'uploads'
+STAGING_FOLDER = os.path.join(UPLOAD_FOLDER, '.staging')  # Uploads waiting to be ingested
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'docx'}
 MAX_FILE_SIZE = 16 * 1024 * 1024  # 16MB max file size
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))  # Documents ingested concurrently per process
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', 20))  # Queued + running jobs across all workers
+MAX_PENDING_JOBS_PER_USER = int(os.environ.get('MAX_PENDING_JOBS_PER_USER', 5))
+INGEST_JOB_TIMEOUT = float(os.environ.get('INGEST_JOB_TIMEOUT', 3600))  # Seconds before an active job counts as lost
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))  # Sessions or messages per history page
+HISTORY_MAX_PAGE_SIZE = 500
 
 # Database & Auth Config
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///chat.db'
+# Hosts such as Render hand out postgres:// URLs, which SQLAlchemy no longer accepts
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///chat.db').replace(
+    'postgres://', 'postgresql://', 1)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = 'super-secret-key-change-this-in-production'  # Change this!
 
@@ -42,18 +66,27 @@ bcrypt = Bcrypt(app)
 
 # Create uploads directory if it doesn't exist
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+os.makedirs(STAGING_FOLDER, exist_ok=True)
 
 # Create DB tables
 with app.app_context():
     db.create_all()
-
-# Global state to track processing
-processing_status = {
-    'is_processing': False,
-    'progress': 0,
-    'message': '',
-    'current_file': None
-}
+    # create_all() doesn't add columns to existing tables
+    job_columns = [column['name'] for column in db.inspect(db.engine).get_columns('ingestion_job')]
+    if 'stages' not in job_columns:
+        with db.engine.begin() as connection:
+            connection.execute(db.text('ALTER TABLE ingestion_job ADD COLUMN stages TEXT'))
+    # ...nor indexes, so chat.db files created before the history indexes get them here
+    for table in (ChatSession.__table__, ChatMessage.__table__):
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+# Background ingestion; job state is shared by all workers through the database
+ingestion_queue = IngestionQueue(app, INGEST_WORKERS, MAX_PENDING_JOBS, MAX_PENDING_JOBS_PER_USER,
+                                 INGEST_JOB_TIMEOUT)
+# Jobs left active by workers that died (restart, deploy, OOM) would hold their queue slots forever
+with app.app_context():
+    ingestion_queue.fail_stale_jobs(STAGING_FOLDER)
 
 
 def allowed_file(filename):
@@ -107,17 +140,66 @@ def get_me():
 
 # --- Chat History Endpoints ---
 
+def encode_cursor(created_at, row_id):
+    """Opaque keyset cursor for the row a page ended on."""
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{row_id}'.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """(created_at, id) from a cursor; raises ValueError if it is malformed."""
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|', 1)
+        return datetime.fromisoformat(created_at), row_id
+    except ValueError as e:  # Includes binascii.Error and UnicodeDecodeError
+        raise ValueError('Invalid cursor') from e
+
+
+def history_page(query, model, key_columns):
+    """One page of `query`, newest first, keyed on (created_at, id).
+
+    Reads `limit` and `before` (a cursor from X-Next-Cursor) from the request
+    and returns (rows, next cursor or None). Seeking past the cursor rather
+    than using OFFSET keeps every page an index range scan.
+    """
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), HISTORY_MAX_PAGE_SIZE)
+    before = request.args.get('before')
+    if before:
+        created_at, row_id = decode_cursor(before)
+        if model is ChatMessage:
+            row_id = int(row_id)
+        query = query.filter(db.or_(model.created_at < created_at,
+                                    db.and_(model.created_at == created_at, model.id < row_id)))
+
+    rows = query.with_entities(*key_columns).order_by(model.created_at.desc(), model.id.desc()) \
+        .limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].created_at, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def history_response(items, next_cursor):
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+
 @app.route('/api/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
+    """The user's sessions, newest first, a page at a time."""
     current_user_id = get_jwt_identity()
-    sessions = ChatSession.query.filter_by(user_id=int(current_user_id)).order_by(ChatSession.created_at.desc()).all()
-    
-    return jsonify([{
+    query = ChatSession.query.filter_by(user_id=int(current_user_id))
+    try:
+        sessions, next_cursor = history_page(query, ChatSession,
+                                             (ChatSession.id, ChatSession.title, ChatSession.created_at))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return history_response([{
         'id': s.id,
         'title': s.title or 'New Chat',
         'created_at': s.created_at.isoformat()
-    } for s in sessions])
+    } for s in sessions], next_cursor)
 
 @app.route('/api/history', methods=['POST'])
 @jwt_required()
@@ -131,19 +213,27 @@ def create_chat_session():
 @app.route('/api/history/<session_id>', methods=['GET'])
 @jwt_required()
 def get_session_messages(session_id):
+    """The session's latest messages in chronological order; `before` pages back to older ones."""
     current_user_id = get_jwt_identity()
-    session = ChatSession.query.filter_by(id=session_id, user_id=int(current_user_id)).first()
+    session = ChatSession.query.with_entities(ChatSession.id) \
+        .filter_by(id=session_id, user_id=int(current_user_id)).first()
     
     if not session:
         return jsonify({'error': 'Session not found'}), 404
-        
-    messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.created_at).all()
-    
-    return jsonify([{
+
+    query = ChatMessage.query.filter_by(session_id=session_id)
+    try:
+        messages, next_cursor = history_page(query, ChatMessage, (ChatMessage.id, ChatMessage.role,
+                                                                  ChatMessage.content, ChatMessage.created_at))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    return history_response([{
+        'id': m.id,
         'role': m.role,
         'content': m.content,
         'created_at': m.created_at.isoformat()
-    } for m in messages])
+    } for m in reversed(messages)], next_cursor)
 
 @app.route('/api/history/<session_id>', methods=['DELETE'])
 @jwt_required()
@@ -156,6 +246,8 @@ def delete_chat_session(session_id):
     
     db.session.delete(session)
     db.session.commit()
+    SESSION_CONTEXTS.discard(session_id)
+    SESSION_RETRIEVAL.discard(session_id)
     return jsonify({'message': 'Session deleted successfully'}), 200
 
 
@@ -164,26 +256,22 @@ def delete_chat_session(session_id):
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint."""
+    sync_index()
     return jsonify({
         'status': 'healthy',
         'message': 'RAG Chatbot API is running',
         'documents_loaded': len(VECTOR_DB) > 0,
-        'chunks_count': len(VECTOR_DB)
+        'chunks_count': len(VECTOR_DB),
+        'index_generation': VECTOR_DB.generation
     })
 
 
 @app.route('/api/upload', methods=['POST'])
 @jwt_required()
 def upload_file():
-    """Handle file upload and process it for RAG."""
-    global processing_status
-
+    """Handle file upload and queue it for RAG ingestion."""
     try:
-        # Check if a file is being processed
-        if processing_status['is_processing']:
-            return jsonify({
-                'error': 'Another file is currently being processed. Please wait.'
-            }), 429
+        current_user_id = get_jwt_identity()
 
         # Check if file is in request
         if 'file' not in request.files:
@@ -202,61 +290,26 @@ def upload_file():
         # Secure the filename
         filename = secure_filename(file.filename)
 
-        # Save file temporarily
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Stage the file under a unique name so concurrent uploads of the same
+        # document don't overwrite each other before they are processed
+        staged_path = os.path.join(STAGING_FOLDER, f'{uuid.uuid4().hex}-{filename}')
+        file.save(staged_path)
 
-        # Start processing in background thread
-        def process_file_background():
-            global processing_status
-            try:
-                processing_status.update({
-                    'is_processing': True,
-                    'progress': 0,
-                    'message': 'Starting file processing...',
-                    'current_file': filename
-                })
-
-                processing_status['message'] = 'Reading file...'
-                processing_status['progress'] = 25
-
-                # Process the file
-                success = process_uploaded_file(file_path)
-
-                processing_status['progress'] = 100
-
-                if success:
-                    processing_status['message'] = 'File processed successfully!'
-                else:
-                    processing_status['message'] = 'Failed to process file'
-
-                # Keep status for a few seconds then reset
-                time.sleep(2)
-                processing_status.update({
-                    'is_processing': False,
-                    'progress': 0,
-                    'message': '',
-                    'current_file': None
-                })
-
-            except Exception as e:
-                processing_status.update({
-                    'is_processing': False,
-                    'progress': 0,
-                    'message': f'Error: {str(e)}',
-                    'current_file': None
-                })
-
-        # Start background processing
-        thread = threading.Thread(target=process_file_background)
-        thread.daemon = True
-        thread.start()
+        try:
+            job = ingestion_queue.submit(int(current_user_id), filename, staged_path,
+                                         os.path.join(UPLOAD_FOLDER, filename))
+        except QueueFullError as e:
+            os.unlink(staged_path)
+            response = jsonify({'error': str(e)})
+            response.headers['Retry-After'] = '10'
+            return response, 429
 
         return jsonify({
             'message': 'File upload started. Processing in background...',
             'filename': filename,
-            'status': 'processing'
-        })
+            'status': job.status,
+            'job_id': job.id
+        }), 202
 
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
@@ -265,8 +318,84 @@ def upload_file():
 @app.route('/api/upload/status', methods=['GET'])
 @jwt_required()
 def upload_status():
-    """Get current upload/processing status."""
-    return jsonify(processing_status)
+    """Get the status of the current user's most recent upload."""
+    current_user_id = get_jwt_identity()
+    jobs = IngestionJob.query.filter_by(user_id=int(current_user_id))
+    latest = jobs.order_by(IngestionJob.created_at.desc()).first()
+    active = jobs.filter(IngestionJob.status.in_(ACTIVE_STATUSES)).order_by(IngestionJob.created_at).first()
+    job = active or latest
+
+    return jsonify({
+        'is_processing': active is not None,
+        'progress': job.progress if job else 0,
+        'message': job.message if job else '',
+        'current_file': active.filename if active else None,
+        'job_id': job.id if job else None,
+        'stages': json.loads(job.stages) if job and job.stages else None
+    })
+
+
+@app.route('/api/upload/status/<job_id>', methods=['GET'])
+@jwt_required()
+def upload_job_status(job_id):
+    """Get the status of a single ingestion job."""
+    current_user_id = get_jwt_identity()
+    job = IngestionJob.query.filter_by(id=job_id, user_id=int(current_user_id)).first()
+
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify(job.to_dict())
+
+
+def begin_chat_turn():
+    """Validate a chat request and save the user's message to its session.
+
+    Returns (user_message, session_id, sources, error_response); error_response
+    is None when the request is valid.
+    """
+    data = request.get_json()
+    current_user_id = get_jwt_identity()
+
+    if not data or 'message' not in data:
+        return None, None, None, (jsonify({'error': 'No message provided'}), 400)
+
+    user_message = data['message'].strip()
+    session_id = data.get('session_id')
+    sources = data.get('sources')
+
+    if not user_message:
+        return None, None, None, (jsonify({'error': 'Empty message'}), 400)
+
+    if sources is not None and (not isinstance(sources, list) or
+                                not all(isinstance(source, str) for source in sources)):
+        return None, None, None, (jsonify({'error': 'sources must be a list of filenames'}), 400)
+
+    # Verify session belongs to user if provided
+    if session_id:
+        session = ChatSession.query.filter_by(id=session_id, user_id=int(current_user_id)).first()
+        if not session:
+            return None, None, None, (jsonify({'error': 'Session not found'}), 404)
+
+        # Save user message
+        user_msg_db = ChatMessage(session_id=session_id, role='user', content=user_message)
+        db.session.add(user_msg_db)
+
+        # Update session title if it's the first message
+        if session.title == "New Chat":
+            session.title = user_message[:30] + "..." if len(user_message) > 30 else user_message
+
+        db.session.commit()
+
+    return user_message, session_id, sources, None
+
+
+def save_assistant_message(session_id, content):
+    """Store the assistant's reply in the chat session, if there is one."""
+    if session_id:
+        ai_msg_db = ChatMessage(session_id=session_id, role='assistant', content=content)
+        db.session.add(ai_msg_db)
+        db.session.commit()
 
 
 @app.route('/api/chat', methods=['POST'])
@@ -274,56 +403,58 @@ def upload_status():
 def chat():
     """Handle chat queries."""
     try:
-        data = request.get_json()
-        current_user_id = get_jwt_identity()
+        user_message, session_id, sources, error = begin_chat_turn()
+        if error:
+            return error
+
+        # Process the query; chat_query answers for an empty corpus once it has synced the index
+        with collect_timings() as timings:
+            result = chat_query(user_message, sources=sources, session_id=session_id)
 
-        if not data or 'message' not in data:
-            return jsonify({'error': 'No message provided'}), 400
-
-        user_message = data['message'].strip()
-        session_id = data.get('session_id')
-
-        if not user_message:
-            return jsonify({'error': 'Empty message'}), 400
-            
-        # Verify session belongs to user if provided
-        if session_id:
-            session = ChatSession.query.filter_by(id=session_id, user_id=int(current_user_id)).first()
-            if not session:
-                return jsonify({'error': 'Session not found'}), 404
-                
-            # Save user message
-            user_msg_db = ChatMessage(session_id=session_id, role='user', content=user_message)
-            db.session.add(user_msg_db)
-            
-            # Update session title if it's the first message
-            if session.title == "New Chat":
-                session.title = user_message[:30] + "..." if len(user_message) > 30 else user_message
-                
-            db.session.commit()
-
-        # Check if any documents are loaded
-        if len(VECTOR_DB) == 0:
-            return jsonify({
-                'response': 'No documents have been uploaded yet. Please upload a document first to ask questions.',
-                'sources': [],
-                'chunks_used': 0
-            })
-
-        # Process the query
-        result = chat_query(user_message)
-        
         # Save assistant response
-        if session_id:
-            ai_msg_db = ChatMessage(session_id=session_id, role='assistant', content=result['response'])
-            db.session.add(ai_msg_db)
-            db.session.commit()
+        save_assistant_message(session_id, result['response'])
 
-        return jsonify({
+        payload = {
             'response': result['response'],
             'sources': result['sources'],
             'chunks_used': result['chunks_used'],
+            'cached': result['cached'],
             'query': user_message
+        }
+        # ?timings=1 adds a per-stage breakdown in milliseconds
+        if request.args.get('timings') == '1':
+            payload['timings'] = timings_ms(timings)
+        return jsonify(payload)
+
+    except Exception as e:
+        return jsonify({'error': f'Chat processing failed: {str(e)}'}), 500
+
+
+@app.route('/api/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """Handle chat queries, streaming the answer as Server-Sent Events.
+
+    Emits a 'meta' event (sources, chunks_used), 'token' events as the model
+    generates, and a final 'done' event. The reply is saved to the session
+    once the stream completes; if the client disconnects, generation stops.
+    """
+    try:
+        user_message, session_id, sources, error = begin_chat_turn()
+        if error:
+            return error
+
+        def events():
+            for event in stream_chat_query(user_message, sources=sources, session_id=session_id):
+                if event['event'] == 'done':
+                    save_assistant_message(session_id, event['response'])
+                    event = {**event, 'query': user_message}
+                payload = {key: value for key, value in event.items() if key != 'event'}
+                yield f"event: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+
+        return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'  # Stop reverse proxies from buffering the stream
         })
 
     except Exception as e:
@@ -355,19 +486,72 @@ def clear_documents():
         return jsonify({'error': f'Failed to clear documents: {str(e)}'}), 500
 
 
+@app.route('/api/documents', methods=['GET'])
+@jwt_required()
+def get_documents():
+    """List loaded documents and their chunk counts."""
+    return jsonify(list_documents())
+
+
+@app.route('/api/documents/<path:filename>', methods=['DELETE'])
+@jwt_required()
+def remove_document(filename):
+    """Remove a single document from the corpus."""
+    try:
+        # Bulk-ingested documents may be named by a relative path
+        removed = delete_document(filename)
+        if not removed:
+            return jsonify({'error': 'Document not found'}), 404
+
+        # Uploads are saved under their secure_filename(); a path-like name that
+        # only maps onto one, such as dir/a.pdf onto dir_a.pdf, is not that upload
+        file_path = os.path.join(UPLOAD_FOLDER, filename)
+        if secure_filename(filename) == filename and os.path.isfile(file_path):
+            os.unlink(file_path)
+
+        return jsonify({
+            'message': f'Document {filename} removed',
+            'chunks_removed': removed,
+            'chunks_count': len(VECTOR_DB)
+        })
+
+    except Exception as e:
+        return jsonify({'error': f'Failed to remove document: {str(e)}'}), 500
+
+
 @app.route('/api/info', methods=['GET'])
 def get_info():
     """Get current system information."""
+    # Another worker may have saved a newer generation
+    sync_index()
+    active_job = IngestionJob.query.filter(IngestionJob.status.in_(ACTIVE_STATUSES)) \
+        .order_by(IngestionJob.created_at).first()
     return jsonify({
         'documents_loaded': len(VECTOR_DB) > 0,
         'chunks_count': len(VECTOR_DB),
-        'current_file': processing_status.get('current_file'),
-        'is_processing': processing_status.get('is_processing'),
+        'index_generation': VECTOR_DB.generation,
+        'vector_memory': VECTOR_DB.memory_usage(),
+        'documents_count': len(list_documents()),
+        'current_file': active_job.filename if active_job else None,
+        'is_processing': active_job is not None,
         'supported_formats': list(ALLOWED_EXTENSIONS),
-        'max_file_size_mb': MAX_FILE_SIZE // (1024 * 1024)
+        'max_file_size_mb': MAX_FILE_SIZE // (1024 * 1024),
+        'embedding_cache': EMBEDDING_CACHE.stats(),
+        'embedding_backend': EMBEDDER.stats(),
+        'answer_cache': ANSWER_CACHE.stats(),
+        'query_batcher': QUERY_BATCHER.stats(),
+        'session_retrieval': SESSION_RETRIEVAL.stats(),
+        'reranker': RERANKER.stats()
     })
 
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, token throughput, corpus size and cache counters for Prometheus."""
+    sync_index()
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
 @app.errorhandler(413)
 def too_large(e):
     """Handle file too large error."""
@@ -394,10 +578,15 @@ if __name__ == '__main__':
     print("\nAPI Endpoints:")
     print("  POST /api/upload     - Upload documents")
     print("  POST /api/chat       - Send chat messages")
+    print("  POST /api/chat/stream - Stream chat responses (SSE)")
     print("  GET  /api/info       - Get system info")
     print("  GET  /api/health     - Health check")
     print("  POST /api/clear      - Clear all documents")
+    print("  GET  /api/documents  - List loaded documents")
+    print("  DELETE /api/documents/<name> - Remove a document")
     print("  GET  /api/upload/status - Get upload status")
+    print("  GET  /metrics        - Prometheus metrics")
+    print("  GET  /api/upload/status/<job_id> - Get status of one upload job")
     print("  POST /api/auth/register - Register new user")
     print("  POST /api/auth/login    - Login user")
     print("  DELETE /api/history/<id> - Delete chat session")
@@ -0,0 +1,179 @@
+"""ASGI entry point: chat on asyncio, every other route through the Flask app.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 5000 --workers 2
+
+POST /api/chat and /api/chat/stream are served by async_rag, so any number
+of chats can wait on Ollama without holding a thread. Auth, history,
+uploads and health run the Flask app on a thread pool, so they stay
+responsive while answers are being generated.
+"""
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from asgiref.sync import ThreadSensitiveContext
+from asgiref.wsgi import WsgiToAsgi
+from flask_jwt_extended import verify_jwt_in_request
+
+import async_rag
+from app import app, begin_chat_turn, save_assistant_message
+from metrics import collect_timings, timings_ms
+
+CORS_HEADERS = [(b'access-control-allow-origin', b'*')]
+
+
+wsgi_application = WsgiToAsgi(app)
+
+
+async def flask_application(scope, receive, send):
+    # WsgiToAsgi runs the app as thread-sensitive code, which shares one thread
+    # across requests unless each request has its own ThreadSensitiveContext
+    async with ThreadSensitiveContext():
+        await wsgi_application(scope, receive, send)
+
+
+async def _read_body(receive) -> bytes:
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+async def _send_json(send, status: int, payload: dict) -> None:
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json')] + CORS_HEADERS
+    })
+    await send({'type': 'http.response.body', 'body': json.dumps(payload).encode()})
+
+
+def _begin_turn(scope, body: bytes):
+    """Authenticate and validate a chat request with the Flask app's own logic.
+
+    Returns ((user_message, session_id, sources), None) or (None, (status, payload)).
+    """
+    headers = {name.decode('latin-1'): value.decode('latin-1') for name, value in scope['headers']}
+    with app.test_request_context(scope['path'], method='POST', headers=headers, data=body):
+        try:
+            verify_jwt_in_request()
+            user_message, session_id, sources, error = begin_chat_turn()
+        except Exception as e:
+            try:
+                # JWT errors have handlers registered by JWTManager
+                error = app.handle_user_exception(e)
+            except Exception:
+                return None, (500, {'error': f'Chat processing failed: {str(e)}'})
+
+        if error:
+            response = app.make_response(error)
+            return None, (response.status_code, response.get_json())
+        return (user_message, session_id, sources), None
+
+
+def _save_reply(session_id, content: str) -> None:
+    with app.app_context():
+        save_assistant_message(session_id, content)
+
+
+async def chat(scope, receive, send) -> None:
+    """Async POST /api/chat."""
+    turn, error = await asyncio.to_thread(_begin_turn, scope, await _read_body(receive))
+    if error:
+        await _send_json(send, *error)
+        return
+    user_message, session_id, sources = turn
+
+    try:
+        with collect_timings() as timings:
+            result = await async_rag.chat_query(user_message, sources=sources, session_id=session_id)
+        await asyncio.to_thread(_save_reply, session_id, result['response'])
+    except Exception as e:
+        await _send_json(send, 500, {'error': f'Chat processing failed: {str(e)}'})
+        return
+
+    payload = {
+        'response': result['response'],
+        'sources': result['sources'],
+        'chunks_used': result['chunks_used'],
+        'cached': result['cached'],
+        'query': user_message
+    }
+    # ?timings=1 adds a per-stage breakdown in milliseconds
+    if parse_qs(scope.get('query_string', b'').decode('latin-1')).get('timings') == ['1']:
+        payload['timings'] = timings_ms(timings)
+    await _send_json(send, 200, payload)
+
+
+async def chat_stream(scope, receive, send) -> None:
+    """Async POST /api/chat/stream; stops generating when the client disconnects."""
+    turn, error = await asyncio.to_thread(_begin_turn, scope, await _read_body(receive))
+    if error:
+        await _send_json(send, *error)
+        return
+    user_message, session_id, sources = turn
+
+    async def stream_events():
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')
+            ] + CORS_HEADERS
+        })
+        events = async_rag.stream_chat_query(user_message, sources=sources, session_id=session_id)
+        try:
+            async for event in events:
+                if event['event'] == 'done':
+                    await asyncio.to_thread(_save_reply, session_id, event['response'])
+                    event = {**event, 'query': user_message}
+                payload = {key: value for key, value in event.items() if key != 'event'}
+                chunk = f"event: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+                await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+        finally:
+            await events.aclose()
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def wait_for_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    streaming = asyncio.ensure_future(stream_events())
+    disconnected = asyncio.ensure_future(wait_for_disconnect())
+    await asyncio.wait([streaming, disconnected], return_when=asyncio.FIRST_COMPLETED)
+    # Cancelling the stream closes the Ollama request, which stops generation
+    for task in (streaming, disconnected):
+        task.cancel()
+    for result in await asyncio.gather(streaming, disconnected, return_exceptions=True):
+        if isinstance(result, Exception):
+            print(f"Error streaming chat: {result}")
+
+
+async def lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_rag.close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+ASYNC_ROUTES = {
+    '/api/chat': chat,
+    '/api/chat/stream': chat_stream
+}
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['method'] == 'POST' and scope['path'] in ASYNC_ROUTES:
+        await ASYNC_ROUTES[scope['path']](scope, receive, send)
+    else:
+        await flask_application(scope, receive, send)
@@ -0,0 +1,194 @@
+"""Asyncio versions of the chat functions in main.py.
+
+Used by the ASGI server (asgi.py). Generation awaits a pooled
+ollama.AsyncClient and query embeddings await main.QUERY_BATCHER, so a
+request waiting on the model holds no thread. Everything else, from the
+answer cache to retrieval and prompt building, is main.py's (see
+main.ChatTurn); this module only awaits where main.py would block.
+"""
+import asyncio
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+
+import httpx
+import ollama
+
+from metrics import observe, record_generation, timed
+
+from main import (
+    EMBEDDING_CACHE,
+    EMBEDDER,
+    QUERY_BATCHER,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_MAX_CONNECTIONS,
+    OLLAMA_READ_TIMEOUT,
+    QUERY_EMBED_TIMEOUT,
+    ChatTurn,
+    build_prompt,
+    generation_args,
+    local_query_embedding,
+    remember_context,
+    result_events,
+    sync_index
+)
+
+CHAT_TIMEOUT = float(os.environ.get('CHAT_TIMEOUT', 120))  # Max seconds to generate one answer
+
+_client: Optional[ollama.AsyncClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_client() -> ollama.AsyncClient:
+    """The pooled Ollama client for the running event loop."""
+    global _client, _client_loop
+    loop = asyncio.get_running_loop()
+    # httpx connections belong to the loop that opened them
+    if _client is None or _client_loop is not loop:
+        _client = ollama.AsyncClient(
+            timeout=httpx.Timeout(OLLAMA_READ_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=OLLAMA_MAX_CONNECTIONS,
+                                max_keepalive_connections=OLLAMA_MAX_CONNECTIONS)
+        )
+        _client_loop = loop
+    return _client
+
+
+async def close_client() -> None:
+    """Close pooled connections; called on server shutdown."""
+    global _client, _client_loop
+    if _client is not None:
+        await _client.close()
+    _client, _client_loop = None, None
+
+
+async def embed_query(query: str) -> List[float]:
+    """Async main.embed_query."""
+    with timed('query_embed'):
+        # The cache is SQLite shared with the other workers, and a local backend embeds on the CPU
+        query_embedding = await asyncio.to_thread(local_query_embedding, query)
+        if query_embedding is None:
+            # Batched with concurrent queries from every thread and coroutine in this process;
+            # shielded so a timeout here doesn't cancel the request other callers share
+            query_embedding = await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(QUERY_BATCHER.submit(query))), QUERY_EMBED_TIMEOUT)
+            await asyncio.to_thread(EMBEDDING_CACHE.put, EMBEDDER.model, query, query_embedding)
+    return query_embedding
+
+
+async def _turn_embedding(query: str) -> Optional[List[float]]:
+    """Async main._turn_embedding."""
+    try:
+        return await embed_query(query)
+    except Exception as e:
+        print(f"Error embedding query: {e!r}")
+        return None
+
+
+async def generate_response(query: str, retrieved_chunks: List[Tuple[str, float, str]],
+                            session_id: Optional[str] = None) -> str:
+    """Generate response using the language model, giving up after CHAT_TIMEOUT."""
+    if not retrieved_chunks:
+        return "I don't have enough information to answer that question."
+
+    prompt = build_prompt(query, retrieved_chunks)
+
+    try:
+        with timed('generate'):
+            response = await asyncio.wait_for(
+                get_client().generate(**generation_args(prompt, session_id), stream=False),
+                CHAT_TIMEOUT
+            )
+        record_generation(response)
+        remember_context(session_id, response)
+        return response['response']
+    except asyncio.TimeoutError:
+        return f"Error generating response: no answer within {CHAT_TIMEOUT:g}s"
+    except Exception as e:
+        return f"Error generating response: {e}"
+
+
+async def stream_response(query: str, retrieved_chunks: List[Tuple[str, float, str]],
+                          session_id: Optional[str] = None) -> AsyncIterator[str]:
+    """Yield response tokens as the language model produces them.
+
+    Generation stops after CHAT_TIMEOUT; closing or cancelling the generator
+    closes the HTTP stream to Ollama.
+    """
+    if not retrieved_chunks:
+        yield "I don't have enough information to answer that question."
+        return
+
+    prompt = build_prompt(query, retrieved_chunks)
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    deadline = start + CHAT_TIMEOUT
+
+    try:
+        stream = await get_client().generate(**generation_args(prompt, session_id), stream=True)
+    except Exception as e:
+        yield f"Error generating response: {e}"
+        return
+
+    try:
+        while True:
+            try:
+                part = await asyncio.wait_for(stream.__anext__(), deadline - loop.time())
+            except StopAsyncIteration:
+                break
+            if part['response']:
+                yield part['response']
+            if part.get('done'):
+                record_generation(part)
+                remember_context(session_id, part)
+    except asyncio.TimeoutError:
+        yield f"Error generating response: no answer within {CHAT_TIMEOUT:g}s"
+    except Exception as e:
+        yield f"Error generating response: {e}"
+    finally:
+        await stream.aclose()
+        observe('generate', loop.time() - start)
+
+
+async def _prepare_turn(query: str, sources: Optional[List[str]],
+                        session_id: Optional[str]) -> Tuple[ChatTurn, Optional[dict]]:
+    """Async main._prepare_turn; index reloads and searches run off the event loop."""
+    await asyncio.to_thread(sync_index)
+    turn = ChatTurn(query, sources, session_id)
+    result = turn.early_result()
+    if result is None:
+        result = turn.similar_result(await _turn_embedding(query))
+    if result is None:
+        # Large exact scans take milliseconds
+        result = await asyncio.to_thread(turn.retrieve)
+    return turn, result
+
+
+async def chat_query(query: str, sources: Optional[List[str]] = None, session_id: Optional[str] = None) -> dict:
+    """Async main.chat_query."""
+    turn, result = await _prepare_turn(query, sources, session_id)
+    if result is not None:
+        return result
+    return turn.finish(await generate_response(query, turn.retrieved_chunks, session_id))
+
+
+async def stream_chat_query(query: str, sources: Optional[List[str]] = None,
+                            session_id: Optional[str] = None) -> AsyncIterator[dict]:
+    """Async main.stream_chat_query; yields the same meta/token/done events."""
+    turn, result = await _prepare_turn(query, sources, session_id)
+    if result is not None:
+        for event in result_events(result):
+            yield event
+        return
+
+    yield {"event": "meta", **turn.meta(), "cached": False}
+
+    tokens = []
+    response_stream = stream_response(query, turn.retrieved_chunks, session_id)
+    try:
+        async for token in response_stream:
+            tokens.append(token)
+            yield {"event": "token", "token": token}
+    finally:
+        await response_stream.aclose()
+
+    yield {"event": "done", "response": turn.finish(''.join(tokens))["response"]}
@@ -0,0 +1,87 @@
+"""Compare IVF approximate search with exact brute force on synthetic data.
+
+Builds a clustered corpus of unit vectors (768-dim by default, like
+nomic-embed-text), then reports recall@k against the exact scan and
+p50/p99 query latency for several nprobe settings.
+
+Recall depends on how many rows each topic has, so vary --clusters as
+well as --rows. With the defaults, 768 dims and 500 clusters, nprobe=32
+gives recall@5 of about 0.85 at 20k rows, 0.96 at 50k and 0.99 at 100k.
+
+    python benchmarks/bench_ann.py --rows 200000 --nprobe 4,8,16,32
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from ann_index import IVFIndex  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def synthetic_corpus(rows: int, dim: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random topic centres, so there is structure to index."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, rows)
+    vectors = centres[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+    return VectorStore.normalize(vectors)
+
+
+def percentile_ms(samples, q):
+    return float(np.percentile(samples, q)) * 1000
+
+
+def run_queries(search, queries):
+    """Time each query; returns (results, latencies in seconds)."""
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    return results, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='IVF recall vs latency benchmark')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=500, help='Topic clusters in the synthetic data')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--nprobe', default='1,4,8,16,32')
+    parser.add_argument('--lists', type=int, default=0, help='IVF lists; 0 for the default 2 * sqrt(rows)')
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows} x {args.dim} corpus...")
+    vectors = synthetic_corpus(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, args.rows, args.queries)
+    queries = VectorStore.normalize(vectors[picks] + 0.3 * rng.standard_normal((args.queries, args.dim)))
+
+    start = time.perf_counter()
+    store = VectorStore(ann_factory=lambda: IVFIndex(n_lists=args.lists or None), ann_min_rows=1)
+    store.add_many([str(i) for i in range(args.rows)], vectors, ['synthetic'] * args.rows)
+    print(f"Inserted and trained IVF with {len(store.ann.centroids)} lists in {time.perf_counter() - start:.1f}s\n")
+
+    exact, latencies = run_queries(lambda q: store.search(q, args.top_k, exact=True), queries)
+    truth = [{chunk for chunk, _, _ in result} for result in exact]
+
+    print(f"{'mode':>12} {'recall@' + str(args.top_k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'exact':>12} {1.0:>10.3f} {percentile_ms(latencies, 50):>8.2f} {percentile_ms(latencies, 99):>8.2f}")
+
+    for nprobe in map(int, args.nprobe.split(',')):
+        results, latencies = run_queries(lambda q: store.search(q, args.top_k, nprobe=nprobe), queries)
+        recall = np.mean([len(truth[i] & {chunk for chunk, _, _ in result}) / args.top_k
+                          for i, result in enumerate(results)])
+        print(f"{'nprobe=' + str(nprobe):>12} {recall:>10.3f} "
+              f"{percentile_ms(latencies, 50):>8.2f} {percentile_ms(latencies, 99):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
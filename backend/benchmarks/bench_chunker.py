@@ -0,0 +1,89 @@
+"""Compare the TextChunker with the previous rfind-based chunker.
+
+Chunks a synthetic text (50 MB by default) and prints chunks per second
+and peak Python memory for each mode. Peak memory is measured in a
+separate tracemalloc run so it doesn't skew the timings.
+
+    python benchmarks/bench_chunker.py --megabytes 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from document_processor import TextChunker  # noqa: E402
+
+
+def synthetic_text(megabytes: int, seed: int = 0) -> str:
+    """Cleaned-looking prose with sentences of varying length."""
+    rng = random.Random(seed)
+    words = ['pump', 'valve', 'pressure', 'the', 'operator', 'checks', 'XR-2201', 'manual', 'and', 'flow',
+             'safety', 'procedure', 'is', 'closed', 'before', 'maintenance', 'of', 'each', 'unit', 'line']
+    sentences = [' '.join(rng.choice(words) for _ in range(rng.randint(3, 40))) + '.' for _ in range(5000)]
+    block = ' '.join(sentences)
+    return (block + ' ') * (megabytes * 1024 * 1024 // (len(block) + 1) + 1)
+
+
+def legacy_chunk_text(text: str, chunk_size: int = 500, overlap: int = 50):
+    """The previous chunker: a stripped copy per chunk and a backward rfind for sentence ends."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        if end < len(text):
+            sentence_end = text.rfind('.', start, end)
+            if sentence_end > start + chunk_size // 2:
+                end = sentence_end + 1
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        start = end - overlap
+    return chunks
+
+
+def measure(run):
+    """(chunks, seconds) for a timed run, then peak traced bytes for a second run."""
+    start = time.perf_counter()
+    count = run()
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chunker throughput and memory benchmark')
+    parser.add_argument('--megabytes', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=500, help='Characters (or tokens for the token mode)')
+    parser.add_argument('--overlap', type=int, default=50)
+    parser.add_argument('--token-size', type=int, default=128, help='Chunk size for the token mode')
+    args = parser.parse_args()
+
+    text = synthetic_text(args.megabytes)
+    print(f"Chunking {len(text) / 1024 / 1024:.0f} MB of text\n")
+
+    chars = TextChunker(args.chunk_size, args.overlap, 'chars')
+    tokens = TextChunker(args.token_size, args.token_size // 10, 'tokens')
+    modes = [
+        ('legacy strings', lambda: len(legacy_chunk_text(text, args.chunk_size, args.overlap))),
+        ('spans (chars)', lambda: sum(1 for _ in chars.spans(text))),
+        ('strings (chars)', lambda: len([text[start:end] for start, end in chars.spans(text)])),
+        ('spans (tokens)', lambda: sum(1 for _ in tokens.spans(text))),
+    ]
+
+    print(f"{'mode':>16} {'chunks':>9} {'seconds':>8} {'chunks/s':>10} {'peak MB':>8}")
+    for name, run in modes:
+        count, elapsed, peak = measure(run)
+        print(f"{name:>16} {count:>9} {elapsed:>8.2f} {count / elapsed:>10.0f} {peak / 1024 / 1024:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
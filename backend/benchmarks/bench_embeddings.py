@@ -0,0 +1,66 @@
+"""Compare embedding backends: vectors per second and single-query latency.
+
+The Ollama backend talks to the fake server, so its numbers are the
+client and HTTP overhead plus --embed-latency per request, not a model's.
+Chunk texts come from the synthetic corpus bench_ingest.py writes.
+
+    python benchmarks/bench_embeddings.py --chunks 2000 --batch-sizes 1,32
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_ingest import write_corpus  # noqa: E402
+from document_processor import load_document  # noqa: E402
+from embedding_backends import create_backend  # noqa: E402
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Embedding backend throughput benchmark')
+    parser.add_argument('--chunks', type=int, default=2000, help='Approximate number of chunks to embed')
+    parser.add_argument('--batch-sizes', default='1,32')
+    parser.add_argument('--queries', type=int, default=200, help='Single-text calls timed for latency')
+    parser.add_argument('--embed-latency', type=float, default=0.0, help='Fake seconds per Ollama embed request')
+    parser.add_argument('--backends', default='ollama,hashing,stub')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(embed_latency=args.embed_latency)
+    server.start_background()
+    os.environ['OLLAMA_HOST'] = server.url
+
+    with tempfile.TemporaryDirectory(prefix='rag-embed-') as workdir:
+        corpus = os.path.join(workdir, 'corpus.txt')
+        write_corpus(corpus, args.chunks)
+        chunks = load_document(corpus)
+    queries = [f"What are the safety checks for procedure {i}?" for i in range(args.queries)]
+
+    print(f"{len(chunks)} chunks\n")
+    print(f"{'backend':>8} {'batch':>6} {'vectors/s':>10} {'query p50 ms':>13} {'query p99 ms':>13}")
+    for name in args.backends.split(','):
+        for batch_size in (int(size) for size in args.batch_sizes.split(',')):
+            backend = create_backend(name, 'nomic-embed-text')
+            for start in range(0, len(chunks), batch_size):
+                backend.embed(chunks[start:start + batch_size])
+            throughput = backend.stats()['vectors_per_second']
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                backend.embed([query])
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"{name:>8} {batch_size:>6} {throughput:>10.0f} {np.percentile(latencies, 50):>13.3f} "
+                  f"{np.percentile(latencies, 99):>13.3f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
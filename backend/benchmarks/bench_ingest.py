@@ -0,0 +1,69 @@
+"""Measure ingestion throughput against the fake Ollama server.
+
+Runs process_uploaded_file on a synthetic text document for several
+batch-size / worker combinations and prints chunks per second.
+
+    python benchmarks/bench_ingest.py --chunks 2000 --embed-latency 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+
+def write_corpus(path: str, chunks: int) -> None:
+    """Write a text file that chunks into roughly `chunks` pieces."""
+    sentence = "Section {i} describes procedure {i} and its safety checks in detail. "
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(chunks * 7):
+            f.write(sentence.format(i=i))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline ingestion throughput benchmark')
+    parser.add_argument('--chunks', type=int, default=1000, help='Approximate number of chunks')
+    parser.add_argument('--embed-latency', type=float, default=0.02, help='Fake seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.002, help='Fake seconds per embedded text')
+    parser.add_argument('--batch-sizes', default='1,16,64')
+    parser.add_argument('--workers', default='1,4')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(embed_latency=args.embed_latency, embed_item_latency=args.embed_item_latency)
+    server.start_background()
+    os.environ['OLLAMA_HOST'] = server.url
+
+    workdir = tempfile.mkdtemp(prefix='rag-bench-')
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'index')
+    os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embedding_cache.db')
+
+    import main as rag  # Imported late so it picks up OLLAMA_HOST and the index dir
+
+    corpus = os.path.join(workdir, 'corpus.txt')
+    write_corpus(corpus, args.chunks)
+
+    print(f"{'batch':>6} {'workers':>8} {'chunks':>8} {'seconds':>8} {'chunks/s':>9}")
+    for batch_size in map(int, args.batch_sizes.split(',')):
+        for workers in map(int, args.workers.split(',')):
+            rag.EMBED_BATCH_SIZE = batch_size
+            rag.EMBED_WORKERS = workers
+            rag.EMBEDDING_CACHE.clear()  # Measure cold ingestion, not cache hits
+            rag.clear_database()  # ...and a fresh upload, not a no-op replace
+
+            start = time.perf_counter()
+            rag.process_uploaded_file(corpus)
+            elapsed = time.perf_counter() - start
+
+            count = len(rag.VECTOR_DB)
+            print(f"{batch_size:>6} {workers:>8} {count:>8} {elapsed:>8.2f} {count / elapsed:>9.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
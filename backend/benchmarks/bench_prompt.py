@@ -0,0 +1,109 @@
+"""Measure prompt evaluation per chat request under different prompt layouts.
+
+Runs chat sessions, interleaved turn by turn, against the fake Ollama
+server, which charges --prompt-eval-latency per prompt token not already
+in one of its prompt-cache slots (like Ollama's KV cache reuse). Each
+question's chunks are retrieved once, so every layout sees the same ones:
+
+- legacy: instructions around the context in one prompt, as before
+  prompt assembly
+- assembled: merged and packed context after a fixed system prompt
+- sessions: assembled, continuing each session's previous context
+
+    python benchmarks/bench_prompt.py --sessions 8 --turns 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_ingest import write_corpus  # noqa: E402
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+
+def legacy_prompt(query, retrieved_chunks):
+    """The prompt generate_response sent before prompt assembly."""
+    context = '\n'.join([f'- {chunk}' for chunk, _, _ in retrieved_chunks])
+    return f"""You are a helpful AI assistant. Answer the question based only on the following context information:
+
+Context:
+{context}
+
+Question: {query}
+
+Instructions:
+- Answer based only on the provided context
+- If the context doesn't contain relevant information, say "I don't have enough information to answer that question based on the provided documents."
+- Be concise and accurate
+- Use Portuguese if the question is in Portuguese, otherwise use English
+
+Answer:"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prompt evaluation per request benchmark')
+    parser.add_argument('--chunks', type=int, default=2000, help='Approximate corpus size in chunks')
+    parser.add_argument('--sessions', type=int, default=8, help='Concurrent chat sessions, interleaved')
+    parser.add_argument('--turns', type=int, default=5, help='Questions per session')
+    parser.add_argument('--cache-slots', type=int, default=4, help='Prompt cache slots on the fake server')
+    parser.add_argument('--prompt-eval-latency', type=float, default=0.0005,
+                        help='Fake seconds per uncached prompt token')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(prompt_eval_latency=args.prompt_eval_latency, cache_slots=args.cache_slots)
+    server.start_background()
+
+    workdir = tempfile.mkdtemp(prefix='rag-prompt-')
+    os.environ['OLLAMA_HOST'] = server.url
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'index')
+    os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embedding_cache.db')
+    os.environ.setdefault('SESSION_CONTEXT_MAX_SESSIONS', str(args.sessions))  # Off by default
+
+    import ollama
+    import main as rag  # Imported late so it picks up OLLAMA_HOST and the index dir
+    from metrics import PROMPT_TOKENS, collect_timings, record_generation
+
+    corpus = os.path.join(workdir, 'corpus.txt')
+    write_corpus(corpus, args.chunks)
+    rag.process_uploaded_file(corpus)
+
+    rng = np.random.default_rng(0)
+    turns = [(f'session-{s}', f"What are the safety checks for procedure {n}?")
+             for t in range(args.turns) for s in range(args.sessions)
+             for n in [rng.integers(0, args.chunks * 7)]]
+    retrieved = {question: rag.retrieve(question) for _, question in turns}
+
+    def legacy(session_id, question):
+        response = ollama.generate(model=rag.LANGUAGE_MODEL, prompt=legacy_prompt(question, retrieved[question]))
+        record_generation(response)
+
+    layouts = {
+        'legacy': legacy,
+        'assembled': lambda session_id, question: rag.generate_response(question, retrieved[question]),
+        'sessions': lambda session_id, question: rag.generate_response(question, retrieved[question], session_id)
+    }
+
+    print(f"{len(turns)} requests: {args.sessions} sessions x {args.turns} turns, "
+          f"{args.cache_slots} prompt cache slots\n")
+    print(f"{'layout':>10} {'tokens/req':>11} {'prompt eval ms/req':>19} {'p95 ms':>8}")
+    for name, generate in layouts.items():
+        server.evaluate_prompt([], [])  # Different layouts share no prefix; start each from a cold cache
+        tokens_before = PROMPT_TOKENS._value
+        prompt_eval = []
+        for session_id, question in turns:
+            with collect_timings() as timings:
+                generate(session_id, question)
+            prompt_eval.append(timings.get('prompt_eval', 0.0) * 1000)
+        tokens = (PROMPT_TOKENS._value - tokens_before) / len(turns)
+        print(f"{name:>10} {tokens:>11.0f} {np.mean(prompt_eval):>19.1f} {np.percentile(prompt_eval, 95):>8.1f}")
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
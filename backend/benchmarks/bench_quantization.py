@@ -0,0 +1,71 @@
+"""Compare float32, float16 and int8 embedding storage on synthetic data.
+
+Each store is saved and reloaded, so queries run against the memory-mapped
+generation as they do in the server. For each storage mode, with and
+without rescoring, it reports the embedding memory, recall@k against
+exact float32 search and p50/p99 query latency. Expect float16 to be
+several times slower than float32: numpy decodes half precision slowly.
+
+    python benchmarks/bench_quantization.py --rows 200000 --rescore 0,2,4
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_ann import percentile_ms, run_queries, synthetic_corpus  # noqa: E402
+from vector_store import VectorStore  # noqa: E402
+
+
+def build(vectors: np.ndarray, storage: str, rescore_factor: int, directory: str) -> VectorStore:
+    store = VectorStore(storage=storage, rescore_factor=rescore_factor)
+    store.add_many([str(i) for i in range(len(vectors))], vectors, ['synthetic'] * len(vectors))
+    store.save(directory)
+    store = VectorStore(storage=storage, rescore_factor=rescore_factor)
+    store.load(directory)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Quantized embedding storage: memory vs recall benchmark')
+    parser.add_argument('--rows', type=int, default=100_000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--clusters', type=int, default=500, help='Topic clusters in the synthetic data')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--rescore', default='0,4', help='Rescore factors to try for quantized storage')
+    args = parser.parse_args()
+
+    print(f"Generating {args.rows} x {args.dim} corpus...")
+    vectors = synthetic_corpus(args.rows, args.dim, args.clusters)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, args.rows, args.queries)
+    queries = VectorStore.normalize(vectors[picks] + 0.3 * rng.standard_normal((args.queries, args.dim)))
+
+    modes = [('float32', 0)] + [(storage, int(factor)) for storage in ('float16', 'int8')
+                                for factor in args.rescore.split(',')]
+    truth = None
+
+    print(f"\n{'storage':>8} {'rescore':>8} {'MB':>8} {'saved':>7} {'recall@' + str(args.top_k):>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    for storage, factor in modes:
+        with tempfile.TemporaryDirectory(prefix='rag-quant-') as directory:
+            store = build(vectors, storage, factor, directory)
+            results, latencies = run_queries(lambda q: store.search(q, args.top_k, exact=True), queries)
+            found = [{chunk for chunk, _, _ in result} for result in results]
+            if truth is None:
+                truth = found
+            recall = np.mean([len(truth[i] & found[i]) / args.top_k for i in range(len(found))])
+            memory = store.memory_usage()
+            print(f"{storage:>8} {factor or '-':>8} {memory['embedding_bytes'] / 2 ** 20:>8.1f} "
+                  f"{memory['saved_bytes'] / memory['float32_bytes']:>7.0%} {recall:>10.3f} "
+                  f"{percentile_ms(latencies, 50):>8.2f} {percentile_ms(latencies, 99):>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""End-to-end offline benchmark suite: ingestion, retrieval and /api/chat.
+
+Everything runs in this process against the fake Ollama server, whose
+embeddings are seeded from the text, so runs are repeatable. For each
+corpus size it reports:
+
+- ingest: process_uploaded_file on a synthetic document, cold caches
+  (sizes up to --ingest-max; larger stores are filled directly with
+  synthetic clustered vectors, reported as build)
+- retrieve: retrieve() latency for distinct queries, including the query embedding
+- chat: POST /api/chat through the Flask test client, distinct questions
+
+with throughput, p50/p95/p99 latency and the process's peak RSS so far
+(a high-water mark, so sizes run smallest first). Results are written as
+JSON; --compare flags metrics that regressed against an earlier run and
+exits non-zero if any did.
+
+    python benchmarks/bench_suite.py --sizes 1000,10000,100000 --output bench.json
+    python benchmarks/bench_suite.py --sizes 1000,10000,100000 --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows: peak RSS is not reported
+    resource = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from bench_ingest import write_corpus  # noqa: E402
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+BUILD_BLOCK = 50_000  # Rows generated and inserted at a time when filling a store directly
+
+# Metrics where a higher value is better; every other compared metric is a latency
+HIGHER_IS_BETTER = ('chunks_per_second', 'requests_per_second')
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1)
+
+
+def latency_summary(latencies, wall_seconds: float) -> dict:
+    samples = np.asarray(latencies) * 1000
+    return {
+        'requests': len(latencies),
+        'requests_per_second': round(len(latencies) / wall_seconds, 1),
+        'p50_ms': round(float(np.percentile(samples, 50)), 2),
+        'p95_ms': round(float(np.percentile(samples, 95)), 2),
+        'p99_ms': round(float(np.percentile(samples, 99)), 2)
+    }
+
+
+def timed_calls(call, arguments, concurrency: int) -> dict:
+    """Run call(argument) for each argument on `concurrency` threads and summarise latencies."""
+    def run(argument):
+        start = time.perf_counter()
+        call(argument)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(run, arguments))
+    return latency_summary(latencies, time.perf_counter() - start)
+
+
+def questions(count: int, size: int, seed: int):
+    """Distinct questions, so neither the embedding nor the answer cache short-circuits them."""
+    rng = np.random.default_rng(seed)
+    return [f"What are the safety checks for procedure {n} (query {i})?"
+            for i, n in enumerate(rng.integers(0, size * 7, count))]
+
+
+def build_store(rag, size: int, dim: int) -> float:
+    """Fill the vector store with `size` synthetic chunks and clustered vectors; returns seconds taken."""
+    rng = np.random.default_rng(size)
+    centres = rng.standard_normal((max(size // 200, 1), dim)).astype(np.float32)
+    start = time.perf_counter()
+    for offset in range(0, size, BUILD_BLOCK):
+        rows = min(BUILD_BLOCK, size - offset)
+        labels = rng.integers(0, len(centres), rows)
+        vectors = centres[labels] + 0.6 * rng.standard_normal((rows, dim)).astype(np.float32)
+        texts = [f"Section {i} describes procedure {i} and its safety checks in detail."
+                 for i in range(offset, offset + rows)]
+        rag.VECTOR_DB.add_many(texts, vectors, ['synthetic.txt'] * rows)
+    return time.perf_counter() - start
+
+
+def run_size(rag, client, headers, size: int, args, workdir: str) -> dict:
+    result = {}
+    rag.clear_database()
+    rag.EMBEDDING_CACHE.clear()
+
+    if size <= args.ingest_max:
+        corpus = os.path.join(workdir, f'corpus-{size}.txt')
+        write_corpus(corpus, size)
+        start = time.perf_counter()
+        rag.process_uploaded_file(corpus)
+        elapsed = time.perf_counter() - start
+        result['ingest'] = {
+            'chunks': len(rag.VECTOR_DB),
+            'seconds': round(elapsed, 3),
+            'chunks_per_second': round(len(rag.VECTOR_DB) / elapsed, 1)
+        }
+    else:
+        elapsed = build_store(rag, size, args.dim)
+        result['build'] = {'chunks': len(rag.VECTOR_DB), 'seconds': round(elapsed, 3)}
+    result['chunks'] = len(rag.VECTOR_DB)
+
+    result['retrieve'] = timed_calls(rag.retrieve, questions(args.queries, size, seed=1), args.concurrency)
+
+    def chat(question):
+        response = client.post('/api/chat', headers=headers, json={'message': question})
+        if response.status_code != 200:
+            raise RuntimeError(f"/api/chat returned {response.status_code}: {response.get_data(as_text=True)}")
+
+    result['chat'] = timed_calls(chat, questions(args.chat_requests, size, seed=2), args.concurrency)
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+def flatten(results: dict) -> dict:
+    """{'10000 retrieve p95_ms': value, ...} for the metrics worth comparing."""
+    flat = {}
+    for size, phases in results.items():
+        for phase, metrics in phases.items():
+            if not isinstance(metrics, dict):
+                continue
+            for name, value in metrics.items():
+                if name in HIGHER_IS_BETTER or name.endswith('_ms'):
+                    flat[f'{size} {phase} {name}'] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> int:
+    """Print changes against a baseline run; returns the number of regressions."""
+    before, after = flatten(baseline['results']), flatten(current['results'])
+    print(f"\nCompared with {baseline['commit']} ({baseline['timestamp']}):")
+    print(f"{'metric':>36} {'before':>10} {'after':>10} {'change':>8}")
+    regressions = 0
+    for key in sorted(before.keys() & after.keys(), key=lambda key: (int(key.split()[0]), key)):
+        old, new = before[key], after[key]
+        if not old:
+            continue
+        change = (new - old) / old
+        worse = -change if key.endswith(HIGHER_IS_BETTER) else change
+        flag = ''
+        if worse > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+        print(f"{key:>36} {old:>10} {new:>10} {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline ingestion, retrieval and chat benchmark suite')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000', help='Corpus sizes in chunks')
+    parser.add_argument('--ingest-max', type=int, default=10_000,
+                        help='Largest size ingested through process_uploaded_file; larger stores are filled directly')
+    parser.add_argument('--queries', type=int, default=200, help='retrieve() calls per size')
+    parser.add_argument('--chat-requests', type=int, default=50, help='/api/chat requests per size')
+    parser.add_argument('--concurrency', type=int, default=1, help='Threads issuing retrieve and chat calls')
+    parser.add_argument('--dim', type=int, default=768, help='Embedding dimension')
+    parser.add_argument('--embed-latency', type=float, default=0.005, help='Fake seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.0005, help='Fake seconds per embedded text')
+    parser.add_argument('--generate-latency', type=float, default=0.05, help='Fake seconds per generation')
+    parser.add_argument('--output', help='Write results to this JSON file')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Relative change counted as a regression')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(dim=args.dim, embed_latency=args.embed_latency,
+                              embed_item_latency=args.embed_item_latency, generate_latency=args.generate_latency)
+    server.start_background()
+
+    workdir = tempfile.mkdtemp(prefix='rag-suite-')
+    os.environ['OLLAMA_HOST'] = server.url
+    os.environ['VECTOR_INDEX_DIR'] = os.path.join(workdir, 'index')
+    os.environ['EMBEDDING_CACHE_PATH'] = os.path.join(workdir, 'embedding_cache.db')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'chat.db')
+
+    # Imported late so they pick up the environment above
+    import main as rag
+    from app import app
+
+    client = app.test_client()
+    client.post('/api/auth/register', json={'username': 'bench', 'password': 'bench'})
+    token = client.post('/api/auth/login', json={'username': 'bench', 'password': 'bench'}).get_json()['token']
+    headers = {'Authorization': f'Bearer {token}'}
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'settings': vars(args),
+        'results': {}
+    }
+
+    for size in sorted(map(int, args.sizes.split(','))):
+        print(f"\n== {size} chunks ==")
+        result = run_size(rag, client, headers, size, args, workdir)
+        report['results'][str(size)] = result
+        print(json.dumps(result, indent=2))
+
+    server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(json.load(f), report, args.threshold)
+        if regressions:
+            print(f"\n{regressions} metric(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+"""Ingest a whole document library from the command line.
+
+    python bulk_ingest.py ~/library
+    python bulk_ingest.py "manuals/**/*.pdf" --workers 8
+
+Documents are hashed, parsed and chunked on a process pool and embedded
+on a shared pool of EMBED_WORKERS threads, with a bounded number of parse
+results and embedding batches in flight. Finished documents are committed
+together, one generation every --checkpoint-seconds, because each save
+rewrites the whole index.
+
+A state file next to the index records the size, mtime and SHA-256 of
+every committed file. Files whose size and mtime have not changed are
+skipped without being read, and so are files whose contents hash the same.
+The state is written only once the generation holding its documents is
+saved, so an interrupted run can simply be started again: documents
+finished since the last checkpoint are parsed again, and their embeddings
+come from the embedding cache.
+"""
+import argparse
+import glob
+import hashlib
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from document_processor import PDF_WORKERS, Chunk, iter_document_chunks
+from ingest_pipeline import StageStats
+from vector_store import index_lock
+
+SUPPORTED_SUFFIXES = ('.txt', '.docx', '.pdf')
+STATE_FILE = 'bulk_ingest_state.json'
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class SourceFile(NamedTuple):
+    """A file to ingest and the document name it is stored under."""
+    source: str
+    path: str
+    size: int
+    mtime_ns: int
+
+
+def file_digest(path: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def parse_file(path: str, known_digest: Optional[str]) -> Tuple[str, Optional[List[Chunk]], float]:
+    """(digest, chunks, seconds) for a file; chunks is None if its digest is known_digest.
+
+    Runs in a worker process, so PDF pages are extracted in-process.
+    """
+    start = time.perf_counter()
+    digest = file_digest(path)
+    if digest == known_digest:
+        return digest, None, time.perf_counter() - start
+    chunks = list(iter_document_chunks(path, pdf_workers=1))
+    return digest, chunks, time.perf_counter() - start
+
+
+def _ignore_interrupts() -> None:
+    """Leave Ctrl-C to the main process, which stops the workers once it has saved."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _glob_base(pattern: str) -> str:
+    """The directory a glob pattern starts from: its leading components without wildcards."""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts) or os.curdir
+
+
+def scan(pattern: str, relative_names: bool = False) -> List[SourceFile]:
+    """Supported files under a directory, or matching a glob, sorted by path.
+
+    Documents are named by their basename, as uploads are, or with
+    relative_names by their path below the directory. Raises ValueError if
+    two files would get the same name.
+    """
+    if os.path.isdir(pattern):
+        base = pattern
+        paths = [os.path.join(root, name) for root, _, names in os.walk(pattern) for name in names]
+    else:
+        base = _glob_base(pattern)
+        paths = glob.glob(pattern, recursive=True)
+    paths = sorted(path for path in paths if path.lower().endswith(SUPPORTED_SUFFIXES) and os.path.isfile(path))
+
+    files: Dict[str, SourceFile] = {}
+    duplicates = []
+    for path in paths:
+        source = os.path.relpath(path, base).replace(os.sep, '/') if relative_names else os.path.basename(path)
+        if source in files:
+            duplicates.append(f"{files[source].path} and {path}")
+            continue
+        stat = os.stat(path)
+        files[source] = SourceFile(source, path, stat.st_size, stat.st_mtime_ns)
+    if duplicates:
+        raise ValueError('Files with the same document name: ' + '; '.join(duplicates))
+    return list(files.values())
+
+
+class IngestState:
+    """What was last committed for each document: its file's size, mtime and digest."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get('files', {})
+
+    def unchanged(self, file: SourceFile) -> bool:
+        """Whether the file's size and mtime match what was committed."""
+        entry = self.files.get(file.source)
+        return entry is not None and entry['size'] == file.size and entry['mtime_ns'] == file.mtime_ns
+
+    def digest(self, source: str) -> Optional[str]:
+        entry = self.files.get(source)
+        return entry['sha256'] if entry else None
+
+    def record(self, file: SourceFile, digest: str, chunks: int) -> None:
+        self.files[file.source] = {'path': file.path, 'size': file.size, 'mtime_ns': file.mtime_ns,
+                                   'sha256': digest, 'chunks': chunks}
+
+    def save(self) -> None:
+        """Atomically replace the state file."""
+        partial = self.path + '.partial'
+        with open(partial, 'w', encoding='utf-8') as f:
+            json.dump({'files': self.files}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, self.path)
+
+
+class BulkIngest:
+    """Parse -> embed -> commit for many files at once, checkpointing as it goes."""
+
+    def __init__(self, rag, state: IngestState, workers: int, embed_workers: int, checkpoint_seconds: float):
+        self.rag = rag
+        self.state = state
+        self.workers = workers
+        self.embed_workers = embed_workers
+        self.checkpoint_seconds = checkpoint_seconds
+        self.stats = {name: StageStats(name) for name in ('parse', 'embed', 'commit')}
+        self.ingested: List[SourceFile] = []
+        self.unchanged = 0
+        self.failed: List[Tuple[str, str]] = []  # (path, reason)
+        self.chunks = 0
+        self.bytes = 0
+        self.generations = 0
+        self._ready: Dict[str, Tuple[SourceFile, str, List[Chunk]]] = {}  # Embedded, awaiting commit
+        self._state_changed = False
+
+    def _embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        start = time.perf_counter()
+        embeddings = self.rag.embed_cached(texts)
+        self.stats['embed'].record(len(texts), time.perf_counter() - start)
+        return embeddings
+
+    def checkpoint(self) -> None:
+        """Commit the embedded documents in one generation, then record them in the state file."""
+        if self._ready:
+            start = time.perf_counter()
+            self.rag.commit_documents({source: chunks for source, (_, _, chunks) in self._ready.items()})
+            for file, digest, chunks in self._ready.values():
+                self.state.record(file, digest, len(chunks))
+                self.ingested.append(file)
+                self.chunks += len(chunks)
+                self.bytes += file.size
+            self.stats['commit'].record(len(self._ready), time.perf_counter() - start)
+            self.generations += 1
+            print(f"Committed {len(self._ready)} documents ({len(self.ingested)} so far)")
+            self._ready.clear()
+            self._state_changed = True
+        if self._state_changed:
+            with index_lock(self.rag.INDEX_DIR):
+                self.state.save()
+            self._state_changed = False
+
+    def run(self, files: List[SourceFile]) -> None:
+        queue = iter(files)
+        parsing = {}  # future -> file
+        batches = {}  # future -> source
+        documents = {}  # source -> (file, digest, chunks), while its batches are embedded
+        batches_left: Dict[str, int] = {}
+        last_checkpoint = time.monotonic()
+        exhausted = False
+
+        with ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_interrupts) as parse_pool, \
+                ThreadPoolExecutor(max_workers=self.embed_workers, thread_name_prefix='embed') as embed_pool:
+            try:
+                while True:
+                    # Parse ahead only while the embedders keep up
+                    while not exhausted and len(parsing) < self.workers * 2 and len(batches) < self.embed_workers * 4:
+                        file = next(queue, None)
+                        if file is None:
+                            exhausted = True
+                            break
+                        parsing[parse_pool.submit(parse_file, file.path, self.state.digest(file.source))] = file
+                    if not parsing and not batches:
+                        break
+
+                    done, _ = wait(list(parsing) + list(batches), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future in parsing:
+                            file = parsing.pop(future)
+                            try:
+                                digest, chunks, seconds = future.result()
+                            except Exception as e:
+                                self._fail(file, e)
+                                continue
+                            self.stats['parse'].record(1, seconds)
+                            if chunks is None:
+                                # Touched but not modified: just remember the new mtime
+                                self.state.record(file, digest, self.state.files[file.source]['chunks'])
+                                self._state_changed = True
+                                self.unchanged += 1
+                            elif not chunks:
+                                self._ready[file.source] = (file, digest, chunks)
+                            else:
+                                documents[file.source] = (file, digest, chunks)
+                                batch_size = self.rag.EMBED_BATCH_SIZE
+                                batches_left[file.source] = 0
+                                for start in range(0, len(chunks), batch_size):
+                                    texts = [chunk.text for chunk in chunks[start:start + batch_size]]
+                                    batches[embed_pool.submit(self._embed, texts)] = file.source
+                                    batches_left[file.source] += 1
+                            continue
+
+                        source = batches.pop(future)
+                        if source not in documents:
+                            continue  # An earlier batch of this document failed
+                        try:
+                            complete = all(embedding is not None for embedding in future.result())
+                        except Exception as e:
+                            print(f"Error embedding {documents[source][0].path}: {e}")
+                            complete = False
+                        if not complete:
+                            self._fail(documents.pop(source)[0], 'some chunks could not be embedded')
+                            continue
+                        batches_left[source] -= 1
+                        if not batches_left[source]:
+                            # All its chunks are in the embedding cache now, where the commit takes them from
+                            self._ready[source] = documents.pop(source)
+
+                    if time.monotonic() - last_checkpoint >= self.checkpoint_seconds:
+                        self.checkpoint()
+                        last_checkpoint = time.monotonic()
+            except KeyboardInterrupt:
+                print("\nInterrupted; saving finished documents. Run the same command again to resume.")
+                parse_pool.shutdown(wait=False, cancel_futures=True)
+                embed_pool.shutdown(wait=False, cancel_futures=True)
+                self.checkpoint()
+                raise
+        self.checkpoint()
+
+    def _fail(self, file: SourceFile, reason) -> None:
+        print(f"Failed to ingest {file.path}: {reason}")
+        self.failed.append((file.path, str(reason)))
+
+    def summary(self, scanned: int, elapsed: float) -> str:
+        megabytes = self.bytes / 2 ** 20
+        lines = [
+            f"Scanned {scanned} files: {len(self.ingested)} ingested, {self.unchanged} unchanged, "
+            f"{len(self.failed)} failed",
+            f"Ingested {self.chunks} chunks, {megabytes:.1f} MB in {elapsed:.1f} s: "
+            f"{len(self.ingested) / elapsed:.2f} files/s, {self.chunks / elapsed:.1f} chunks/s, "
+            f"{megabytes / elapsed:.2f} MB/s",
+            f"Busy time: parse {self.stats['parse'].busy_seconds:.1f} s on {self.workers} processes, "
+            f"embed {self.stats['embed'].busy_seconds:.1f} s on {self.embed_workers} threads, "
+            f"commit {self.stats['commit'].busy_seconds:.1f} s in {self.generations} generations"
+        ]
+        lines += [f"  failed: {path}: {reason}" for path, reason in self.failed]
+        return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Ingest every TXT, DOCX and PDF file in a directory or glob')
+    parser.add_argument('pattern', help='Directory (searched recursively) or glob pattern; quote globs, ** is recursive')
+    parser.add_argument('--workers', type=int, default=PDF_WORKERS, help='Processes hashing and parsing files')
+    parser.add_argument('--embed-workers', type=int, help='Concurrent embedding requests (default: EMBED_WORKERS)')
+    parser.add_argument('--checkpoint-seconds', type=float, default=60,
+                        help='Commit finished documents this often; each commit rewrites the index')
+    parser.add_argument('--relative-names', action='store_true',
+                        help='Name documents by their path below the directory instead of their basename')
+    parser.add_argument('--state', help=f'State file (default: {STATE_FILE} in the index directory)')
+    parser.add_argument('--force', action='store_true', help='Ingest every file, even if unchanged')
+    parser.add_argument('--dry-run', action='store_true', help='List new and modified files, then exit')
+    args = parser.parse_args(argv)
+
+    try:
+        files = scan(args.pattern, args.relative_names)
+    except ValueError as e:
+        print(f"{e}\nUse --relative-names to keep both.")
+        return 2
+    if not files:
+        print(f"No {', '.join(SUPPORTED_SUFFIXES)} files found for {args.pattern}")
+        return 1
+
+    import main as rag  # Imported here so parse workers don't load the index
+
+    state = IngestState(args.state or os.path.join(rag.INDEX_DIR, STATE_FILE))
+    rag.sync_index()
+    stored = rag.VECTOR_DB.documents()
+    todo = []
+    for file in files:
+        entry = state.files.get(file.source)
+        # A recorded file is only skipped while its document is still in the index
+        if entry is not None and (args.force or (entry['chunks'] and file.source not in stored)):
+            del state.files[file.source]
+        if not state.unchanged(file):
+            todo.append(file)
+    print(f"{len(files)} files found, {len(files) - len(todo)} unchanged since the last run")
+
+    if args.dry_run:
+        for file in todo:
+            print(f"  {file.source} ({file.path})")
+        return 0
+    if not todo:
+        return 0
+
+    ingest = BulkIngest(rag, state, max(1, args.workers), max(1, args.embed_workers or rag.EMBED_WORKERS),
+                        args.checkpoint_seconds)
+    ingest.unchanged = len(files) - len(todo)
+    start = time.perf_counter()
+    try:
+        ingest.run(todo)
+    except KeyboardInterrupt:
+        print(ingest.summary(len(files), time.perf_counter() - start))
+        return 130
+    print(ingest.summary(len(files), time.perf_counter() - start))
+    return 1 if ingest.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,350 @@
+import os
+import re
+from bisect import bisect_right
+from itertools import islice
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+# For document processing
+from docx import Document
+import PyPDF2
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))  # Processes extracting PDF pages
+PDF_PAGES_PER_TASK = 16  # Pages each worker extracts per task
+TXT_BLOCK_SIZE = 1024 * 1024  # Characters read per TXT block
+
+# Chunk sizing; CHUNK_UNIT is 'chars' or 'tokens'. Changing these re-embeds documents on their next upload
+CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 500))
+CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 50))
+CHUNK_UNIT = os.environ.get('CHUNK_UNIT', 'chars')
+
+_TOKEN_RE = re.compile(r'\w+|[^\w\s]')
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in `text` as TextChunker counts them: word runs and single punctuation marks."""
+    return sum(1 for _ in _TOKEN_RE.finditer(text))
+
+
+class Chunk(NamedTuple):
+    """A chunk of document text and the page it starts on (None if unpaged)."""
+    text: str
+    page: Optional[int] = None
+
+
+# A segment is a piece of raw document text and its page number
+Segment = Tuple[Optional[int], str]
+
+
+def _extract_pdf_pages(task: Tuple[str, int, int]) -> List[Segment]:
+    """Extract pages [start, stop) of a PDF. Runs in a worker process."""
+    file_path, start, stop = task
+    with open(file_path, 'rb') as file:
+        pdf_reader = PyPDF2.PdfReader(file)
+        return [(number + 1, pdf_reader.pages[number].extract_text() or '') for number in range(start, stop)]
+
+
+class TextChunker:
+    """Cuts text into overlapping chunks, returned as (start, end) offsets.
+
+    Chunks are `size` characters, or `size` tokens when `unit` is 'tokens',
+    ending after the last '.' in their second half when there is one.
+    Neighbours share `overlap` characters or tokens. Tokens are runs of
+    word characters and single punctuation marks; the embedding model's
+    WordPiece tokenizer splits at least this finely, so leave it some
+    headroom when sizing chunks to its context window.
+
+    Sentence ends are found by one forward scan over the text: a chunk never
+    ends before the previous one, which is why overlap is capped at half
+    the chunk size.
+    """
+
+    def __init__(self, size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP, unit: str = CHUNK_UNIT):
+        if unit not in ('chars', 'tokens'):
+            raise ValueError(f"Unknown chunk unit: {unit}")
+        if size <= 0:
+            raise ValueError(f"Chunk size must be positive, got {size}")
+        if not 0 <= overlap <= size // 2:
+            raise ValueError(f"Chunk overlap must be between 0 and half the chunk size, got {overlap} of {size}")
+        self.size = size
+        self.overlap = overlap
+        self.tokens = unit == 'tokens'
+
+    def spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """(start, end) offsets of the chunks of `text`, with surrounding whitespace excluded."""
+        buffer = _ChunkBuffer(self)
+        buffer.append(text, separator='')
+        return buffer.cut(final=True)
+
+
+class _ChunkBuffer:
+    """Text waiting to be chunked, and where the TextChunker has got to in it."""
+
+    def __init__(self, chunker: TextChunker):
+        self.chunker = chunker
+        self.text = ''
+        self.start = 0  # Where the next chunk starts
+        self.dot_scan = 0  # Every '.' before this offset has been seen...
+        self.last_dot = -1  # ...and this is the last of them
+        self.emitted = False
+
+    def append(self, text: str, separator: str = ' ') -> int:
+        """Add a segment; returns its offset in the buffer."""
+        if self.text:
+            self.text += separator
+        offset = len(self.text)
+        self.text += text
+        return offset
+
+    def cut(self, final: bool) -> Iterator[Tuple[int, int]]:
+        """Yield the chunks that can be placed now; with `final`, all the rest."""
+        text = self.text
+        length = len(text)
+        size, overlap, tokens = self.chunker.size, self.chunker.overlap, self.chunker.tokens
+
+        if final and not self.emitted:
+            units = sum(1 for _ in islice(_TOKEN_RE.finditer(text), size + 1)) if tokens else length
+            if units <= size:
+                self.emitted = True
+                yield 0, length
+                return
+
+        start, dot_scan, last_dot = self.start, self.dot_scan, self.last_dot
+        try:
+            while start < length:
+                if tokens:
+                    # Token ends from here to one past a full chunk; bounded, so memory stays flat
+                    ends = [match.end() for match in islice(_TOKEN_RE.finditer(text, start), size + 1)]
+                    end = ends[size - 1] if len(ends) > size else length
+                else:
+                    end = start + size
+
+                if end < length:
+                    # Each stretch of text is searched for '.' once, since chunk ends only move forward
+                    if end > dot_scan:
+                        dot = text.rfind('.', dot_scan, end)
+                        if dot >= 0:
+                            last_dot = dot
+                        dot_scan = end
+                    if last_dot > start + (end - start) // 2:
+                        end = last_dot + 1
+                elif not final:
+                    # Only cut chunks whose end is known to be inside the text
+                    break
+                else:
+                    end = length
+
+                first, stop = start, end
+                while first < stop and text[first].isspace():
+                    first += 1
+                while stop > first and text[stop - 1].isspace():
+                    stop -= 1
+                if first < stop:
+                    self.emitted = True
+                    yield first, stop
+
+                if end == length:
+                    # Anything after an overlap step would lie inside this chunk
+                    start = end
+                    break
+                if not overlap:
+                    start = end
+                    continue
+                if tokens:
+                    last = bisect_right(ends, end) - 1
+                    next_start = ends[last - overlap] if last >= overlap else start
+                else:
+                    next_start = end - overlap
+                # Never step backwards, whatever a short sentence cut left us
+                start = next_start if next_start > start else end
+        finally:
+            self.start, self.dot_scan, self.last_dot = start, dot_scan, last_dot
+
+    def trim(self) -> int:
+        """Drop text before the next chunk start; returns how far offsets shifted."""
+        shift = self.start
+        if not shift:
+            return 0
+        self.text = self.text[shift:]
+        self.start = 0
+        self.dot_scan = max(self.dot_scan - shift, 0)
+        self.last_dot = self.last_dot - shift if self.last_dot >= shift else -1
+        return shift
+
+
+class DocumentProcessor:
+    """Handle different document types and text processing.
+
+    Documents are read as a stream of segments (PDF pages, DOCX paragraphs,
+    TXT blocks) that are cleaned and chunked one at a time, so memory use is
+    bounded by the segment size rather than the document size.
+    """
+
+    @staticmethod
+    def chunk_text(text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                   unit: str = CHUNK_UNIT) -> List[str]:
+        """Split text into overlapping chunks."""
+        return [text[start:end] for start, end in TextChunker(chunk_size, overlap, unit).spans(text)]
+
+    @staticmethod
+    def iter_chunks(segments: Iterable[Segment], chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP,
+                    unit: str = CHUNK_UNIT) -> Iterator[Chunk]:
+        """Chunk a stream of cleaned segments, carrying only a partial chunk between them.
+
+        Segments are joined with a space; see TextChunker for how chunks are cut.
+        """
+        buffer = _ChunkBuffer(TextChunker(chunk_size, overlap, unit))
+        # (offset in buffer, page) for every segment that starts in the buffer
+        page_marks: deque = deque()
+
+        def page_at(offset: int) -> Optional[int]:
+            while len(page_marks) > 1 and page_marks[1][0] <= offset:
+                page_marks.popleft()
+            return page_marks[0][1] if page_marks else None
+
+        for page, text in segments:
+            if not text:
+                continue
+            page_marks.append((buffer.append(text), page))
+            for start, end in buffer.cut(final=False):
+                yield Chunk(buffer.text[start:end], page_at(start))
+
+            # Drop text that no future chunk can reach
+            shift = buffer.trim()
+            if shift:
+                page_marks = deque((offset - shift, page) for offset, page in page_marks)
+
+        for start, end in buffer.cut(final=True):
+            yield Chunk(buffer.text[start:end], page_at(start))
+
+    @staticmethod
+    def iter_txt_blocks(file_path: str, block_size: int = TXT_BLOCK_SIZE) -> Iterator[Segment]:
+        """Read a TXT file in blocks that end on whitespace."""
+        carry = ''
+        with open(file_path, 'r', encoding='utf-8') as file:
+            while True:
+                block = file.read(block_size)
+                if not block:
+                    break
+                block = carry + block
+                # Hold back a trailing partial word so cleaning never splits it
+                cut = max(block.rfind(' '), block.rfind('\n'), block.rfind('\t'))
+                if cut <= 0 and len(block) < 4 * block_size:
+                    carry = block
+                    continue
+                if cut <= 0:
+                    cut = len(block)
+                carry = block[cut:]
+                yield None, block[:cut]
+        if carry:
+            yield None, carry
+
+    @staticmethod
+    def iter_docx_blocks(file_path: str) -> Iterator[Segment]:
+        """Yield the paragraphs, then the table rows, of a DOCX file."""
+        doc = Document(file_path)
+
+        for paragraph in doc.paragraphs:
+            if paragraph.text.strip():
+                yield None, paragraph.text.strip()
+
+        # Also extract text from tables
+        for table in doc.tables:
+            for row in table.rows:
+                row_text = []
+                for cell in row.cells:
+                    if cell.text.strip():
+                        row_text.append(cell.text.strip())
+                if row_text:
+                    yield None, ' | '.join(row_text)
+
+    @staticmethod
+    def iter_pdf_pages(file_path: str, workers: int = PDF_WORKERS) -> Iterator[Segment]:
+        """Yield (page number, text) for each PDF page, in order.
+
+        Pages are extracted by a process pool in PDF_PAGES_PER_TASK ranges,
+        with a bounded number of ranges in flight.
+        """
+        with open(file_path, 'rb') as file:
+            page_count = len(PyPDF2.PdfReader(file).pages)
+
+        tasks = [(str(file_path), start, min(start + PDF_PAGES_PER_TASK, page_count))
+                 for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+        if workers <= 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield from _extract_pdf_pages(task)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = deque()
+            tasks = iter(tasks)
+            for task in tasks:
+                pending.append(pool.submit(_extract_pdf_pages, task))
+                if len(pending) >= workers * 2:
+                    break
+            while pending:
+                pages = pending.popleft().result()
+                next_task = next(tasks, None)
+                if next_task is not None:
+                    pending.append(pool.submit(_extract_pdf_pages, next_task))
+                yield from pages
+
+    @staticmethod
+    def load_txt_file(file_path: str) -> str:
+        """Load text from a TXT file."""
+        with open(file_path, 'r', encoding='utf-8') as file:
+            return file.read()
+
+    @staticmethod
+    def load_docx_file(file_path: str) -> str:
+        """Load text from a DOCX file."""
+        return '\n'.join(text for _, text in DocumentProcessor.iter_docx_blocks(file_path))
+
+    @staticmethod
+    def load_pdf_file(file_path: str) -> str:
+        """Load text from a PDF file."""
+        return '\n'.join(text.strip() for _, text in DocumentProcessor.iter_pdf_pages(file_path) if text.strip())
+
+    @staticmethod
+    def clean_text(text: str) -> str:
+        """Clean and normalize text."""
+        # Remove extra whitespace
+        text = re.sub(r'\s+', ' ', text)
+        # Remove special characters but keep basic punctuation
+        text = re.sub(r'[^\w\s.,!?;:()\-"]', '', text)
+        return text.strip()
+
+
+def iter_document_segments(file_path: str, pdf_workers: int = PDF_WORKERS) -> Iterator[Segment]:
+    """Raw text segments of a supported document."""
+    file_path = Path(file_path)
+
+    if not file_path.exists():
+        raise FileNotFoundError(f"File not found: {file_path}")
+
+    processor = DocumentProcessor()
+
+    # Determine file type and load content
+    if file_path.suffix.lower() == '.txt':
+        return processor.iter_txt_blocks(file_path)
+    elif file_path.suffix.lower() == '.docx':
+        return processor.iter_docx_blocks(file_path)
+    elif file_path.suffix.lower() == '.pdf':
+        return processor.iter_pdf_pages(file_path, pdf_workers)
+    else:
+        raise ValueError(f"Unsupported file type: {file_path.suffix}")
+
+
+def iter_document_chunks(file_path: str, pdf_workers: int = PDF_WORKERS) -> Iterator[Chunk]:
+    """Stream a document through extract -> clean -> chunk."""
+    segments = iter_document_segments(file_path, pdf_workers)
+    cleaned = ((page, DocumentProcessor.clean_text(text)) for page, text in segments)
+    return DocumentProcessor.iter_chunks(cleaned)
+
+
+def load_document(file_path: str) -> List[str]:
+    """Load and process a document into chunks."""
+    return [chunk.text for chunk in iter_document_chunks(file_path)]
@@ -0,0 +1,174 @@
+"""Embedding backends: where chunk and query embeddings come from.
+
+- OllamaEmbeddings: the embedding model served by Ollama, over one pooled
+  HTTP client so requests reuse keep-alive connections
+- HashingEmbeddings: feature-hashed words, word pairs and character
+  trigrams, computed in-process on the CPU. No model download and no
+  network round trip, but it matches wording rather than meaning
+- StubEmbeddings: a deterministic unit vector per text, for tests and
+  benchmarks that need no server; the same vectors as fake_ollama serves
+
+Vectors from different backends (or dimensions) are not comparable, so
+each backend has its own `model` name, which keys the embedding cache.
+Switching backends needs the documents to be ingested again.
+"""
+import hashlib
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import List, Sequence, Tuple
+
+import httpx
+import numpy as np
+import ollama
+
+from lexical_index import tokenize
+
+
+class EmbeddingBackend(ABC):
+    """Embeds batches of texts and counts the vectors it made and the time it took.
+
+    Subclasses implement _embed() and set `model`.
+    """
+
+    model = ''
+    remote = False  # Whether each call is a network round trip, worth batching across queries
+
+    def __init__(self):
+        self.calls = 0
+        self.vectors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """One embedding per text, in order."""
+        start = time.perf_counter()
+        embeddings = self._embed(list(texts))
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.calls += 1
+            self.vectors += len(texts)
+            self.busy_seconds += elapsed
+        return embeddings
+
+    @abstractmethod
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """One embedding per text, in order, without the bookkeeping."""
+
+    def stats(self) -> dict:
+        return {
+            'backend': type(self).__name__,
+            'model': self.model,
+            'calls': self.calls,
+            'vectors': self.vectors,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'vectors_per_second': round(self.vectors / self.busy_seconds, 1) if self.busy_seconds else 0.0
+        }
+
+
+class OllamaEmbeddings(EmbeddingBackend):
+    """An Ollama embedding model, through /api/embed on a pooled client (OLLAMA_HOST)."""
+
+    remote = True
+
+    def __init__(self, model: str, max_connections: int = 32, connect_timeout: float = 5.0,
+                 read_timeout: float = 60.0):
+        super().__init__()
+        self.model = model
+        self.client = ollama.Client(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(model=self.model, input=texts)['embeddings']
+
+
+class HashingEmbeddings(EmbeddingBackend):
+    """Signed feature hashing of lowercased words, adjacent word pairs and the words' character trigrams.
+
+    Trigrams (of the word wrapped in < and >) let inflections and typos
+    still share most features. crc32 is used rather than hash(), which is
+    salted per process, so vectors are the same in every worker and run.
+    """
+
+    def __init__(self, dim: int = 768, trigram_weight: float = 0.5):
+        super().__init__()
+        self.dim = dim
+        self.trigram_weight = trigram_weight
+        self.model = f'hashing-{dim}'
+        # Per instance: the cache keeps a reference to self
+        self._word_features = lru_cache(maxsize=100_000)(self._word_features)
+
+    def _feature(self, feature: str) -> Tuple[int, float]:
+        """(bucket, sign) of a feature."""
+        h = zlib.crc32(feature.encode('utf-8'))
+        return h % self.dim, 1.0 if (h >> 31) & 1 else -1.0
+
+    def _word_features(self, word: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Buckets and signed weights of a word and its trigrams."""
+        wrapped = f'<{word}>'
+        features = [self._feature(word)] + [self._feature(wrapped[i:i + 3]) for i in range(len(wrapped) - 2)]
+        buckets = np.array([bucket for bucket, _ in features], dtype=np.int64)
+        weights = np.array([sign for _, sign in features])
+        weights[1:] *= self.trigram_weight
+        return buckets, weights
+
+    def embed_one(self, text: str) -> np.ndarray:
+        words = tokenize(text)
+        if not words:
+            return np.zeros(self.dim)
+        features = [self._word_features(word) for word in words]
+        buckets = [buckets for buckets, _ in features]
+        weights = [weights for _, weights in features]
+        pairs = [self._feature(f'{first} {second}') for first, second in zip(words, words[1:])]
+        if pairs:
+            buckets.append(np.array([bucket for bucket, _ in pairs], dtype=np.int64))
+            weights.append(np.array([sign for _, sign in pairs]))
+        vector = np.bincount(np.concatenate(buckets), weights=np.concatenate(weights), minlength=self.dim)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_one(text).tolist() for text in texts]
+
+
+def stub_embedding(text: str, dim: int = 768) -> np.ndarray:
+    """Deterministic unit vector seeded from the text's sha256, as fake_ollama.fake_embedding serves."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class StubEmbeddings(EmbeddingBackend):
+    """Random but reproducible vectors: equal texts match exactly, nothing else is similar."""
+
+    def __init__(self, dim: int = 768):
+        super().__init__()
+        self.dim = dim
+        self.model = f'stub-{dim}'
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        return [stub_embedding(text, self.dim).tolist() for text in texts]
+
+
+BACKENDS = {
+    'ollama': OllamaEmbeddings,
+    'hashing': HashingEmbeddings,
+    'stub': StubEmbeddings
+}
+
+
+def create_backend(name: str, model: str, dim: int = 768, **ollama_options) -> EmbeddingBackend:
+    """The backend called `name`.
+
+    `model` and ollama_options (connection pool and timeouts) apply to the
+    Ollama backend, `dim` to the in-process ones.
+    """
+    if name == 'ollama':
+        return OllamaEmbeddings(model, **ollama_options)
+    if name in BACKENDS:
+        return BACKENDS[name](dim)
+    raise ValueError(f"Unknown embedding backend {name!r}; expected one of {', '.join(BACKENDS)}")
@@ -0,0 +1,146 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+from typing import List, Optional, Sequence
+
+
+def text_hash(text: str) -> str:
+    """Content address of a chunk of text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model, sha256 of the text).
+
+    Vectors are stored as float32 blobs in a SQLite table. A hit refreshes
+    the row's last_used time if it is more than refresh_interval seconds old,
+    so repeated lookups stay read-only and don't take the write lock every
+    worker shares. Once the table grows past max_entries the least recently
+    used rows are evicted down to 90% of the limit.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000, refresh_interval: float = 3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.refresh_interval = refresh_interval
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        ''')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS ix_embedding_cache_last_used ON embedding_cache (last_used)')
+        self._conn.commit()
+        self._entries = self._count()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up several texts; misses come back as None."""
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        stale = []
+        now = time.time()
+
+        with self._lock:
+            # Stay well under SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                batch = hashes[i:i + 500]
+                placeholders = ','.join('?' * len(batch))
+                rows = self._conn.execute(
+                    'SELECT text_hash, vector, last_used FROM embedding_cache '
+                    f'WHERE model = ? AND text_hash IN ({placeholders})',
+                    [model, *batch]
+                ).fetchall()
+                for h, vector, last_used in rows:
+                    found[h] = vector
+                    if now - last_used > self.refresh_interval:
+                        stale.append(h)
+
+            if stale:
+                self._conn.executemany(
+                    'UPDATE embedding_cache SET last_used = ? WHERE model = ? AND text_hash = ?',
+                    [(now, model, h) for h in stale]
+                )
+                self._conn.commit()
+
+            results = [np.frombuffer(found[h], dtype=np.float32) if h in found else None for h in hashes]
+            hit_count = sum(result is not None for result in results)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        return self.get_many(model, [text])[0]
+
+    def put_many(self, model: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        """Store embeddings for several texts, evicting old entries if over capacity."""
+        now = time.time()
+        rows = [
+            (model, text_hash(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            # Same model and text always give the same vector, so existing rows are kept
+            before = self._conn.total_changes
+            self._conn.executemany(
+                'INSERT OR IGNORE INTO embedding_cache (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)',
+                rows
+            )
+            if self._conn.total_changes > before:
+                # Other workers insert into the same file, so count the table itself
+                self._entries = self._count()
+                if self._entries > self.max_entries:
+                    self._evict()
+            self._conn.commit()
+
+    def put(self, model: str, text: str, vector: Sequence[float]) -> None:
+        self.put_many(model, [text], [vector])
+
+    def _count(self) -> int:
+        return self._conn.execute('SELECT COUNT(*) FROM embedding_cache').fetchone()[0]
+
+    def _evict(self) -> None:
+        """Drop least recently used rows down to 90% of capacity. Caller holds the lock and commits."""
+        excess = self._entries - int(self.max_entries * 0.9)
+        self._conn.execute(
+            'DELETE FROM embedding_cache WHERE rowid IN '
+            '(SELECT rowid FROM embedding_cache ORDER BY last_used LIMIT ?)',
+            (excess,)
+        )
+        self._entries -= excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM embedding_cache')
+            self._conn.commit()
+            self._entries = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': self._entries,
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,216 @@
+"""Minimal stand-in for the Ollama HTTP API, for offline benchmarking.
+
+Serves deterministic embeddings (seeded from the text's hash) and canned
+generations with configurable latency, so ingestion and chat throughput
+can be measured without a model. Point the backend at it with
+OLLAMA_HOST=http://127.0.0.1:<port>.
+
+Prompt evaluation is modelled like Ollama's prompt cache: words are
+tokens, each of a few slots keeps the tokens it last evaluated, and a
+request only pays --prompt-eval-latency for the tokens after the longest
+prefix it shares with a slot. `system` and `context` are honoured, and
+the returned context is the prompt plus the answer.
+
+    python fake_ollama.py --port 11435 --embed-latency 0.05 --generate-latency 1.0
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+
+# Kept free of backend imports: benchmarks import this module before pointing OLLAMA_HOST at the server
+def fake_embedding(text: str, dim: int = 768) -> list:
+    """Deterministic unit vector derived from the text's sha256; the same as embedding_backends.stub_embedding."""
+    seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    vector /= np.linalg.norm(vector)
+    return vector.tolist()
+
+
+def fake_tokens(text: str) -> list:
+    return [zlib.crc32(word.encode('utf-8')) for word in text.split()]
+
+
+def common_prefix(first: list, second: list) -> int:
+    length = 0
+    for a, b in zip(first, second):
+        if a != b:
+            break
+        length += 1
+    return length
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    """Handle the subset of Ollama endpoints the backend calls."""
+
+    server_version = 'FakeOllama/1.0'
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, payload: dict, status: int = 200) -> None:
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json({'version': 'fake'})
+        elif self.path == '/api/tags':
+            self._send_json({'models': []})
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def do_POST(self):
+        data = self._read_json()
+        self.server.count_request(self.path)
+
+        if self.path == '/api/embed':
+            inputs = data.get('input', [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.server.embed_latency + self.server.embed_item_latency * len(inputs))
+            self._send_json({
+                'model': data.get('model'),
+                'embeddings': [fake_embedding(text, self.server.dim) for text in inputs]
+            })
+        elif self.path == '/api/embeddings':
+            time.sleep(self.server.embed_latency + self.server.embed_item_latency)
+            self._send_json({'embedding': fake_embedding(data.get('prompt', ''), self.server.dim)})
+        elif self.path == '/api/generate':
+            self._generate(data)
+        else:
+            self._send_json({'error': 'not found'}, 404)
+
+    def _generate(self, data: dict) -> None:
+        words = ['This', 'is', 'a', 'fake', 'answer', 'from', 'the', 'benchmark', 'server.']
+        prompt = list(data.get('context') or []) + fake_tokens(data.get('system') or '') + \
+            fake_tokens(data.get('prompt', ''))
+        evaluated = len(prompt) - self.server.evaluate_prompt(prompt, fake_tokens(' '.join(words)))
+        prompt_eval_seconds = self.server.prompt_eval_latency * evaluated
+        time.sleep(prompt_eval_seconds)
+        final = {
+            'model': data.get('model'),
+            'done': True,
+            'prompt_eval_count': evaluated,
+            'prompt_eval_duration': int(prompt_eval_seconds * 1e9),
+            'eval_count': len(words),
+            'context': prompt + fake_tokens(' '.join(words))
+        }
+
+        if not data.get('stream', True):
+            time.sleep(self.server.generate_latency)
+            self._send_json({**final, 'response': ' '.join(words)})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        delay = self.server.generate_latency / len(words)
+        try:
+            for i, word in enumerate(words):
+                time.sleep(delay)
+                self._write_chunk({'model': data.get('model'), 'response': word if i == 0 else ' ' + word, 'done': False})
+            self._write_chunk({**final, 'response': ''})
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            self.server.count_request('cancelled')
+            self.close_connection = True
+
+    def _write_chunk(self, payload: dict) -> None:
+        line = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(f'{len(line):x}\r\n'.encode('ascii') + line + b'\r\n')
+        self.wfile.flush()
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """Threaded HTTP server carrying the latency settings and request counters."""
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, dim: int = 768,
+                 embed_latency: float = 0.0, embed_item_latency: float = 0.0,
+                 generate_latency: float = 0.0, verbose: bool = False,
+                 prompt_eval_latency: float = 0.0, cache_slots: int = 4):
+        super().__init__((host, port), FakeOllamaHandler)
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.embed_item_latency = embed_item_latency
+        self.generate_latency = generate_latency
+        self.prompt_eval_latency = prompt_eval_latency
+        self.verbose = verbose
+        self.request_counts = {}
+        self._slots = [[] for _ in range(cache_slots)]  # Most recently used first
+        self._lock = threading.Lock()
+
+    def evaluate_prompt(self, prompt: list, answer: list) -> int:
+        """Run a prompt through the slot sharing its longest prefix; returns the tokens found cached."""
+        with self._lock:
+            index = max(range(len(self._slots)), key=lambda i: common_prefix(self._slots[i], prompt))
+            cached = common_prefix(self._slots[index], prompt)
+            if cached < len(self._slots[index]):
+                # Like Ollama, copy the shared prefix into the least recently used slot rather than
+                # overwrite a slot holding more than this prompt uses
+                index = len(self._slots) - 1
+            self._slots.pop(index)
+            self._slots.insert(0, prompt + answer)
+            return cached
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count_request(self, path: str) -> None:
+        with self._lock:
+            self.request_counts[path] = self.request_counts.get(path, 0) + 1
+
+    def start_background(self) -> threading.Thread:
+        """Serve from a daemon thread, e.g. inside a benchmark process."""
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Ollama server for offline benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--dim', type=int, default=768, help='Embedding dimension')
+    parser.add_argument('--embed-latency', type=float, default=0.0, help='Seconds per embed request')
+    parser.add_argument('--embed-item-latency', type=float, default=0.0, help='Extra seconds per embedded text')
+    parser.add_argument('--generate-latency', type=float, default=0.0, help='Seconds per generation')
+    parser.add_argument('--prompt-eval-latency', type=float, default=0.0, help='Seconds per uncached prompt token')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.dim, args.embed_latency,
+                              args.embed_item_latency, args.generate_latency, args.verbose,
+                              args.prompt_eval_latency)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping fake Ollama")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+from document_processor import Chunk, DocumentProcessor, Segment
+
+_DONE = object()  # End-of-stream marker passed down the queues
+
+
+class StageStats:
+    """Items processed by a pipeline stage and the time spent working on them."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items: int, seconds: float) -> None:
+        with self._lock:
+            self.items += items
+            self.busy_seconds += seconds
+
+    def as_dict(self) -> dict:
+        return {
+            'items': self.items,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'items_per_second': round(self.items / self.busy_seconds, 1) if self.busy_seconds else 0.0
+        }
+
+
+class IngestPipeline:
+    """Extract -> chunk -> embed stages on threads, joined by bounded queues.
+
+    Iterating the pipeline yields (chunks, embeddings) batches as they are
+    embedded; the caller is the insert stage. Full queues block the stage
+    feeding them, so at most ~queue_size segments and batches are in memory
+    whatever the document size. Chunks for which needs_embedding() is False
+    are recorded in `chunks` but not embedded. Batches are embedded
+    concurrently but yielded in document order; the chunk stage waits while
+    embed_workers + 2 * queue_size batches are not yet yielded, which bounds
+    the ones held back behind a slow batch.
+    """
+
+    def __init__(self, segments: Iterable[Segment], embed_batch: Callable[[List[str]], List[Optional[List[float]]]],
+                 needs_embedding: Callable[[str], bool] = lambda text: True, batch_size: int = 32,
+                 embed_workers: int = 4, queue_size: int = 8):
+        self.segments = segments
+        self.embed_batch = embed_batch
+        self.needs_embedding = needs_embedding
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.chunks: List[Chunk] = []
+        self.chunking_done = False
+        self.to_embed = 0
+        self.stats = {name: StageStats(name) for name in ('extract', 'chunk', 'embed', 'insert')}
+        self._segment_queue = queue.Queue(maxsize=queue_size)
+        self._batch_queue = queue.Queue(maxsize=queue_size)
+        self._embedded_queue = queue.Queue(maxsize=queue_size)
+        self._in_flight = threading.Semaphore(embed_workers + 2 * queue_size)
+        self._stop = threading.Event()
+        self._errors: List[BaseException] = []
+        self._started = None
+
+    def _put(self, q: queue.Queue, item) -> bool:
+        """Blocking put that gives up once the pipeline is stopped."""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q: queue.Queue):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _acquire_slot(self) -> bool:
+        """Wait for room for another unyielded batch; False once the pipeline is stopped."""
+        while not self._stop.is_set():
+            if self._in_flight.acquire(timeout=0.1):
+                return True
+        return False
+
+    def _fail(self, error: BaseException) -> None:
+        self._errors.append(error)
+        self._stop.set()
+
+    def _extract(self) -> None:
+        segments = iter(self.segments)
+        try:
+            while True:
+                start = time.perf_counter()
+                segment = next(segments, _DONE)
+                if segment is _DONE:
+                    break
+                self.stats['extract'].record(1, time.perf_counter() - start)
+                if not self._put(self._segment_queue, segment):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            # Shuts down the PDF extraction pool if we stopped early
+            if hasattr(segments, 'close'):
+                segments.close()
+            self._put(self._segment_queue, _DONE)
+
+    def _queued_segments(self) -> Iterator[Segment]:
+        while True:
+            segment = self._get(self._segment_queue)
+            if segment is _DONE:
+                return
+            page, text = segment
+            yield page, DocumentProcessor.clean_text(text)
+
+    def _chunk(self) -> None:
+        try:
+            batch: List[Chunk] = []
+            sequence = 0
+            start = time.perf_counter()
+            for chunk in DocumentProcessor.iter_chunks(self._queued_segments()):
+                self.chunks.append(chunk)
+                self.stats['chunk'].record(1, time.perf_counter() - start)
+                if self.needs_embedding(chunk.text):
+                    self.to_embed += 1
+                    batch.append(chunk)
+                    if len(batch) >= self.batch_size:
+                        if not self._acquire_slot() or not self._put(self._batch_queue, (sequence, batch)):
+                            return
+                        sequence += 1
+                        batch = []
+                start = time.perf_counter()
+            if batch and self._acquire_slot():
+                self._put(self._batch_queue, (sequence, batch))
+            self.chunking_done = True
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.embed_workers):
+                self._put(self._batch_queue, _DONE)
+
+    def _embed(self) -> None:
+        try:
+            while True:
+                item = self._get(self._batch_queue)
+                if item is _DONE:
+                    break
+                sequence, batch = item
+                start = time.perf_counter()
+                embeddings = self.embed_batch([chunk.text for chunk in batch])
+                self.stats['embed'].record(len(batch), time.perf_counter() - start)
+                if not self._put(self._embedded_queue, (sequence, batch, embeddings)):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(self._embedded_queue, _DONE)
+
+    def __iter__(self) -> Iterator[Tuple[List[Chunk], List[Optional[List[float]]]]]:
+        self._started = time.perf_counter()
+        threads = [threading.Thread(target=self._extract, name='ingest-extract', daemon=True),
+                   threading.Thread(target=self._chunk, name='ingest-chunk', daemon=True)]
+        threads += [threading.Thread(target=self._embed, name=f'ingest-embed-{i}', daemon=True)
+                    for i in range(self.embed_workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            finished = 0
+            # Batches that finished ahead of an earlier one, by sequence number
+            waiting = {}
+            next_sequence = 0
+            while finished < self.embed_workers:
+                item = self._get(self._embedded_queue)
+                if item is _DONE:
+                    # Either an embed worker finished or the pipeline was stopped
+                    finished = self.embed_workers if self._stop.is_set() else finished + 1
+                    continue
+                sequence, batch, embeddings = item
+                waiting[sequence] = (batch, embeddings)
+                while next_sequence in waiting:
+                    yield waiting.pop(next_sequence)
+                    next_sequence += 1
+                    self._in_flight.release()
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+        if self._errors:
+            raise self._errors[0]
+
+    def stage_stats(self) -> dict:
+        """Per-stage throughput so far, for progress reporting."""
+        stats = {name: stage.as_dict() for name, stage in self.stats.items()}
+        stats['elapsed_seconds'] = round(time.perf_counter() - self._started, 3) if self._started else 0.0
+        return stats
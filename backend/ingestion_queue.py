@@ -0,0 +1,166 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from database import db, IngestionJob
+from main import process_uploaded_file
+
+ACTIVE_STATUSES = ('queued', 'processing')
+
+
+class QueueFullError(Exception):
+    """Raised when accepting another upload would exceed the queue limits."""
+
+
+class IngestionQueue:
+    """Runs document ingestion jobs on a bounded worker pool.
+
+    Job state lives in the IngestionJob table, so any gunicorn worker can
+    answer status requests for any job. Backpressure limits are counted
+    from the table too, across all workers: at most max_pending active jobs
+    overall and max_pending_per_user per user.
+
+    A job still active job_timeout seconds after it was queued (or started)
+    is presumed lost with a worker that died, and no longer counts against
+    the limits; fail_stale_jobs() marks such jobs failed.
+    """
+
+    def __init__(self, app, max_workers: int = 2, max_pending: int = 20, max_pending_per_user: int = 5,
+                 job_timeout: float = 3600):
+        self.app = app
+        self.max_pending = max_pending
+        self.max_pending_per_user = max_pending_per_user
+        self.job_timeout = job_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ingest')
+        self._submit_lock = threading.Lock()
+        # Jobs for the same document run one at a time so their diffs don't interleave
+        self._source_locks = {}
+        self._source_locks_lock = threading.Lock()
+
+    def submit(self, user_id: int, filename: str, file_path: str, upload_path: str) -> IngestionJob:
+        """Queue `file_path` for ingestion as document `filename`.
+
+        The file is moved to `upload_path` once processed. Raises
+        QueueFullError if the backpressure limits are reached.
+        """
+        with self._submit_lock:
+            try:
+                # Count and insert in one transaction that excludes other workers' submits
+                self._lock_jobs_table()
+                active = self._active_jobs()
+                if active.count() >= self.max_pending:
+                    raise QueueFullError('Too many documents are being processed. Please try again shortly.')
+                if active.filter_by(user_id=user_id).count() >= self.max_pending_per_user:
+                    raise QueueFullError('You already have the maximum number of uploads in progress.')
+
+                job = IngestionJob(user_id=user_id, filename=filename, status='queued', message='Waiting to start...')
+                db.session.add(job)
+                db.session.commit()
+            except BaseException:
+                db.session.rollback()
+                raise
+
+        self._executor.submit(self._run, job.id, filename, file_path, upload_path)
+        return job
+
+    def fail_stale_jobs(self, staging_folder: str) -> int:
+        """Mark jobs orphaned by a dead worker as failed and delete their staged files.
+
+        Staged files are only named after their upload, not their job, so
+        any older than job_timeout are removed. Returns the number of jobs
+        failed. Needs an app context.
+        """
+        cutoff = self._stale_cutoff()
+        stale = IngestionJob.query.filter(IngestionJob.status.in_(ACTIVE_STATUSES),
+                                          db.func.coalesce(IngestionJob.started_at, IngestionJob.created_at) < cutoff)
+        failed = stale.update({'status': 'failed', 'finished_at': datetime.utcnow(),
+                               'message': 'Processing was interrupted. Please upload the file again.'},
+                              synchronize_session=False)
+        db.session.commit()
+
+        cutoff_timestamp = time.time() - self.job_timeout
+        for entry in os.scandir(staging_folder):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff_timestamp:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Finished (or cleaned up by another worker) meanwhile
+        return failed
+
+    def _stale_cutoff(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self.job_timeout)
+
+    def _active_jobs(self):
+        """Queued and processing jobs that are not yet stale."""
+        return IngestionJob.query.filter(
+            IngestionJob.status.in_(ACTIVE_STATUSES),
+            db.func.coalesce(IngestionJob.started_at, IngestionJob.created_at) >= self._stale_cutoff()
+        )
+
+    def _lock_jobs_table(self) -> None:
+        """Start the session's transaction holding the database's write lock on the job table.
+
+        SQLite takes its single write lock up front with BEGIN IMMEDIATE;
+        PostgreSQL locks the table against concurrent writers. Other
+        databases only get the per-process _submit_lock.
+        """
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'sqlite':
+            db.session.execute(db.text('BEGIN IMMEDIATE'))
+        elif dialect == 'postgresql':
+            db.session.execute(db.text('LOCK TABLE ingestion_job IN SHARE ROW EXCLUSIVE MODE'))
+
+    def _source_lock(self, filename: str) -> threading.Lock:
+        with self._source_locks_lock:
+            return self._source_locks.setdefault(filename, threading.Lock())
+
+    def _update(self, job_id: str, **fields) -> None:
+        IngestionJob.query.filter_by(id=job_id).update(fields)
+        db.session.commit()
+
+    def _run(self, job_id: str, filename: str, file_path: str, upload_path: str) -> None:
+        with self.app.app_context():
+            try:
+                with self._source_lock(filename):
+                    self._update(job_id, status='processing', started_at=datetime.utcnow(),
+                                 message='Starting file processing...')
+
+                    last_update = {'progress': -1, 'time': 0.0}
+                    stages = {}
+
+                    def report_progress(progress, message):
+                        # Throttle writes: only on a new percentage, at most ~4 per second
+                        now = time.monotonic()
+                        if progress == last_update['progress'] or (progress < 100 and now - last_update['time'] < 0.25):
+                            return
+                        last_update.update(progress=progress, time=now)
+                        self._update(job_id, progress=progress, message=message,
+                                     stages=json.dumps(stages) if stages else None)
+
+                    def report_stages(stats):
+                        # Written along with the next progress update
+                        stages.update(stats)
+
+                    success = process_uploaded_file(file_path, progress_callback=report_progress, source=filename,
+                                                    stats_callback=report_stages)
+                    final_stages = json.dumps(stages) if stages else None
+
+                    if success:
+                        os.replace(file_path, upload_path)
+                        self._update(job_id, status='completed', progress=100, finished_at=datetime.utcnow(),
+                                     message='File processed successfully!', stages=final_stages)
+                    else:
+                        self._update(job_id, status='failed', finished_at=datetime.utcnow(),
+                                     message='Failed to process file', stages=final_stages)
+
+            except Exception as e:
+                db.session.rollback()
+                self._update(job_id, status='failed', finished_at=datetime.utcnow(), message=f'Error: {str(e)}'[:255])
+
+            finally:
+                if os.path.exists(file_path):
+                    os.unlink(file_path)
+                db.session.remove()
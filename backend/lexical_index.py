@@ -0,0 +1,174 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# Words, plus codes joined by '-' or '.' such as part numbers ("ab-1234.5")
+TOKEN_RE = re.compile(r'\w+(?:[-.]\w+)*')
+CODE_SEPARATORS = re.compile(r'[-.]')
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; a code like "xr-200" also yields "xr" and "200"."""
+    tokens = []
+    for token in TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        if not token.isalnum():
+            tokens.extend(part for part in CODE_SEPARATORS.split(token) if part)
+    return tokens
+
+
+class BM25Index:
+    """Inverted index over chunk text with Okapi BM25 scoring.
+
+    Rows are the VectorStore's row ids. Postings restored from disk stay in
+    flat CSR arrays; rows added afterwards go to per-term lists, so adding a
+    document only touches its own terms. Deleted rows are filtered with the
+    store's alive mask at query time and dropped on the next save.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._terms: Dict[str, int] = {}
+        # CSR postings from load_state(): term t owns rows[indptr[t]:indptr[t + 1]]
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._rows = np.zeros(0, dtype=np.int64)
+        self._tfs = np.zeros(0, dtype=np.float32)
+        # Postings added since then, and merged per-term arrays built on demand
+        self._added_rows: Dict[int, List[int]] = {}
+        self._added_tfs: Dict[int, List[int]] = {}
+        self._arrays: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        self._doc_len = np.zeros(0, dtype=np.float32)
+        self._size = 0
+        self.live_docs = 0
+        self.live_length = 0.0
+
+    def add(self, start_row: int, texts: Sequence[str]) -> None:
+        """Index texts as rows start_row, start_row + 1, ..."""
+        needed = start_row + len(texts)
+        if needed > len(self._doc_len):
+            grown = np.zeros(max(needed, 2 * len(self._doc_len), 1024), dtype=np.float32)
+            grown[:self._size] = self._doc_len[:self._size]
+            self._doc_len = grown
+
+        for row, text in enumerate(texts, start_row):
+            counts = Counter(tokenize(text))
+            length = sum(counts.values())
+            self._doc_len[row] = length
+            self.live_docs += 1
+            self.live_length += length
+            for token, tf in counts.items():
+                term = self._terms.setdefault(token, len(self._terms))
+                self._added_rows.setdefault(term, []).append(row)
+                self._added_tfs.setdefault(term, []).append(tf)
+                self._arrays.pop(term, None)
+        self._size = max(self._size, needed)
+
+    def remove(self, rows: Sequence[int]) -> None:
+        """Account for deleted rows in the corpus statistics."""
+        if len(rows):
+            self.live_docs -= len(rows)
+            self.live_length -= float(self._doc_len[np.asarray(rows, dtype=np.int64)].sum())
+
+    def _postings(self, term: int) -> Tuple[np.ndarray, np.ndarray]:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            rows, tfs = self._rows[:0], self._tfs[:0]
+            if term < len(self._indptr) - 1:
+                start, stop = self._indptr[term], self._indptr[term + 1]
+                rows, tfs = self._rows[start:stop], self._tfs[start:stop]
+            if term in self._added_rows:
+                rows = np.concatenate([rows, np.asarray(self._added_rows[term], dtype=np.int64)])
+                tfs = np.concatenate([tfs, np.asarray(self._added_tfs[term], dtype=np.float32)])
+            arrays = self._arrays[term] = (rows, tfs)
+        return arrays
+
+    def search(self, query: str, top_n: int, alive: Optional[np.ndarray] = None,
+               allowed: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_n (rows, BM25 scores) for a query string.
+
+        `alive` masks out deleted rows (and drives document frequencies);
+        `allowed` further restricts which rows may be returned.
+        """
+        terms = {self._terms[token] for token in tokenize(query) if token in self._terms}
+        if not terms or self.live_docs <= 0 or top_n <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        average_length = self.live_length / self.live_docs
+        matched_rows, matched_scores = [], []
+        for term in terms:
+            rows, tfs = self._postings(term)
+            if alive is not None:
+                keep = alive[rows]
+                rows, tfs = rows[keep], tfs[keep]
+            if not len(rows):
+                continue
+            idf = math.log(1 + (self.live_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self._doc_len[rows] / average_length)
+            matched_rows.append(rows)
+            matched_scores.append(idf * tfs * (self.k1 + 1) / (tfs + norm))
+
+        if not matched_rows:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        rows = np.concatenate(matched_rows)
+        scores = np.concatenate(matched_scores)
+        if allowed is not None:
+            keep = allowed[rows]
+            rows, scores = rows[keep], scores[keep]
+
+        # Sum the per-term contributions of each row
+        rows, inverse = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inverse, weights=scores).astype(np.float32)
+        if top_n < len(rows):
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return rows[top], scores[top]
+
+    def state(self, rows: np.ndarray, total_rows: int) -> dict:
+        """Arrays needed to restore the index for `rows`, renumbered 0..len(rows)-1."""
+        remap = np.full(total_rows, -1, dtype=np.int64)
+        remap[rows] = np.arange(len(rows))
+
+        # Flatten base and added postings into (term, row, tf) triples
+        base_terms = np.repeat(np.arange(len(self._indptr) - 1), np.diff(self._indptr))
+        added = sorted(self._added_rows)
+        added_terms = np.repeat(np.array(added, dtype=np.int64),
+                                [len(self._added_rows[term]) for term in added]).astype(np.int64)
+        terms = np.concatenate([base_terms, added_terms])
+        old_rows = np.concatenate([self._rows] + [np.asarray(self._added_rows[term], dtype=np.int64)
+                                                  for term in added])
+        tfs = np.concatenate([self._tfs] + [np.asarray(self._added_tfs[term], dtype=np.float32)
+                                            for term in added])
+
+        # Drop deleted rows, then terms left without postings
+        new_rows = remap[old_rows] if len(old_rows) else old_rows
+        keep = new_rows >= 0
+        terms, new_rows, tfs = terms[keep], new_rows[keep], tfs[keep]
+        used = np.unique(terms)
+        term_ids = np.searchsorted(used, terms)
+        order = np.lexsort((new_rows, term_ids))
+        vocabulary = np.array(list(self._terms), dtype=str)
+
+        return {
+            'terms': vocabulary[used] if len(used) else np.zeros(0, dtype=str),
+            'indptr': np.concatenate(([0], np.cumsum(np.bincount(term_ids, minlength=len(used))))).astype(np.int64),
+            'rows': new_rows[order],
+            'tfs': tfs[order],
+            'doc_len': self._doc_len[rows]
+        }
+
+    def load_state(self, state: dict) -> None:
+        """Restore from state()."""
+        self._terms = {token: term for term, token in enumerate(state['terms'].tolist())}
+        self._indptr = np.asarray(state['indptr'], dtype=np.int64)
+        self._rows = np.asarray(state['rows'], dtype=np.int64)
+        self._tfs = np.asarray(state['tfs'], dtype=np.float32)
+        self._added_rows, self._added_tfs, self._arrays = {}, {}, {}
+        self._doc_len = np.asarray(state['doc_len'], dtype=np.float32).copy()
+        self._size = len(self._doc_len)
+        self.live_docs = self._size
+        self.live_length = float(self._doc_len.sum())
@@ -1,279 +1,832 @@
 import ollama
-from typing import List, Tuple, Optional
+from typing import Callable, Dict, Iterator, List, Tuple, Optional
 import time
 import os
-from pathlib import Path
-import re
-
-# For document processing
-from docx import Document
-import PyPDF2
-import json
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ann_index import IVFIndex
+from answer_cache import AnswerCache
+from document_processor import Chunk, iter_document_segments
+# Re-exported: these lived in main.py before document processing moved out
+from document_processor import DocumentProcessor, load_document  # noqa: F401
+from embedding_backends import create_backend
+from embedding_cache import EmbeddingCache
+from ingest_pipeline import IngestPipeline
+from metrics import REGISTRY, observe, record_generation, timed
+from prompt_builder import SYSTEM_PROMPT, SessionContexts, assemble_context, build_user_prompt, estimate_tokens
+from query_batcher import QueryEmbeddingBatcher
+from reranker import Reranker
+from session_retrieval import SessionRetrieval
+from vector_store import VectorStore, index_lock
 
 # Configuration
 EMBEDDING_MODEL = 'nomic-embed-text'  # Good local embedding model
+# Where embeddings come from: 'ollama' (EMBEDDING_MODEL), 'hashing' (in-process, lexical) or 'stub' (tests).
+# Vectors from different backends don't mix; re-ingest documents after switching
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'ollama')
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', 768))  # Vector size of the hashing and stub backends
 LANGUAGE_MODEL = 'llama3'  # Default local Llama3 model
+INDEX_DIR = os.environ.get('VECTOR_INDEX_DIR', 'vector_index')  # Persistent vector index location
+
+# Approximate search kicks in above ANN_MIN_ROWS chunks; exact brute force below that, where a
+# scan takes a few ms and IVF recall is at its lowest (see IVFIndex)
+ANN_MIN_ROWS = int(os.environ.get('ANN_MIN_ROWS', 50_000))
+ANN_NPROBE = int(os.environ.get('ANN_NPROBE', 32))  # IVF lists scanned per query: higher = better recall, slower
+ANN_LISTS = int(os.environ.get('ANN_LISTS', 0))  # IVF lists; 0 sizes them at 2 * sqrt(rows)
+
+# Embedding precision in memory: float32, float16 (half the memory) or int8 (about a quarter).
+# float16 makes brute-force search roughly 10x slower, int8 under 2x; prefer int8 to save memory
+# Quantized stores rerank VECTOR_RESCORE_FACTOR x top_n candidates on full-precision vectors; 0 disables it
+VECTOR_STORAGE = os.environ.get('VECTOR_STORAGE', 'float32')
+VECTOR_RESCORE_FACTOR = int(os.environ.get('VECTOR_RESCORE_FACTOR', 4))
+
+# Connection pool and timeouts for the Ollama host
+OLLAMA_MAX_CONNECTIONS = int(os.environ.get('OLLAMA_MAX_CONNECTIONS', 32))
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))  # Seconds
+OLLAMA_READ_TIMEOUT = float(os.environ.get('OLLAMA_READ_TIMEOUT', 60))  # Max seconds between response bytes
+
+# Ingestion embedding settings
+EMBED_BATCH_SIZE = int(os.environ.get('EMBED_BATCH_SIZE', 32))  # Chunks per /api/embed call
+EMBED_WORKERS = int(os.environ.get('EMBED_WORKERS', 4))  # Concurrent embed requests
+EMBED_MAX_RETRIES = 3
+EMBED_RETRY_BACKOFF = 0.5  # Seconds before the first retry, doubled each attempt
+INGEST_QUEUE_SIZE = int(os.environ.get('INGEST_QUEUE_SIZE', 8))  # Items buffered between pipeline stages
+# Partial uploads are saved every INGEST_CHECKPOINT_SECONDS, or less often once the index is large
+# enough that saves would take more than INGEST_CHECKPOINT_BUDGET of the ingestion time
+INGEST_CHECKPOINT_SECONDS = float(os.environ.get('INGEST_CHECKPOINT_SECONDS', 10))
+INGEST_CHECKPOINT_BUDGET = float(os.environ.get('INGEST_CHECKPOINT_BUDGET', 0.1))
+
+# Prompt assembly: retrieved passages are packed into PROMPT_CONTEXT_TOKENS of an LLM_NUM_CTX token window
+LLM_NUM_CTX = int(os.environ.get('LLM_NUM_CTX', 4096))
+PROMPT_CONTEXT_TOKENS = int(os.environ.get('PROMPT_CONTEXT_TOKENS', 2048))
+ANSWER_TOKEN_RESERVE = int(os.environ.get('ANSWER_TOKEN_RESERVE', 512))  # Window space left for the answer
+LLM_KEEP_ALIVE = os.environ.get('LLM_KEEP_ALIVE', '30m')  # Keeps the model, and its prompt cache, loaded
+# Chat sessions continue from their previous turn's Ollama context while it fits the window. Only cheap while
+# Ollama still holds that context: keep it under OLLAMA_NUM_PARALLEL active sessions. 0 disables
+SESSION_CONTEXT_MAX_SESSIONS = int(os.environ.get('SESSION_CONTEXT_MAX_SESSIONS', 0))
+
+# Follow-ups in a chat session search with their embedding blended with the conversation's topic, and
+# reuse the previous turn's chunks when they are within SESSION_REUSE_SIMILARITY of the previous question
+SESSION_RETRIEVAL_MAX_SESSIONS = int(os.environ.get('SESSION_RETRIEVAL_MAX_SESSIONS', 1024))
+SESSION_BLEND_WEIGHT = float(os.environ.get('SESSION_BLEND_WEIGHT', 0.3))
+SESSION_REUSE_SIMILARITY = float(os.environ.get('SESSION_REUSE_SIMILARITY', 0.92))
+
+# Concurrent chat queries are embedded together: each waits up to the window for others to join
+QUERY_BATCH_WINDOW_MS = float(os.environ.get('QUERY_BATCH_WINDOW_MS', 5))
+QUERY_BATCH_MAX_SIZE = int(os.environ.get('QUERY_BATCH_MAX_SIZE', 32))
+QUERY_EMBED_TIMEOUT = float(os.environ.get('QUERY_EMBED_TIMEOUT', 3))  # Seconds before falling back to BM25 only
+
+# Hybrid retrieval: the top HYBRID_CANDIDATES of the vector and BM25 rankings are fused with RRF
+HYBRID_CANDIDATES = int(os.environ.get('HYBRID_CANDIDATES', 50))
+RRF_K = int(os.environ.get('RRF_K', 60))
+
+# Reranking: the top RERANK_CANDIDATES fused results are reranked (cosine + lexical overlap, MMR), and as few
+# as RERANK_MIN_CHUNKS are kept when the rest score under RERANK_MIN_RELATIVE_SCORE of the best.
+# RERANK_CANDIDATES at or below top_n skips the stage
+RERANK_CANDIDATES = int(os.environ.get('RERANK_CANDIDATES', 50))
+RERANK_MIN_CHUNKS = int(os.environ.get('RERANK_MIN_CHUNKS', 1))
+RERANK_LEXICAL_WEIGHT = float(os.environ.get('RERANK_LEXICAL_WEIGHT', 0.3))
+RERANK_MMR_LAMBDA = float(os.environ.get('RERANK_MMR_LAMBDA', 0.7))  # 1 = relevance only, lower = more diversity
+RERANK_MIN_RELATIVE_SCORE = float(os.environ.get('RERANK_MIN_RELATIVE_SCORE', 0.6))
+RERANK_BUDGET_MS = float(os.environ.get('RERANK_BUDGET_MS', 10))
+
+# Embeddings keyed by (model, chunk hash), kept next to chat.db in the Flask instance folder
+EMBEDDING_CACHE_PATH = os.environ.get(
+    'EMBEDDING_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'embedding_cache.db')
+)
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get('EMBEDDING_CACHE_MAX_ENTRIES', 200_000))
+
+# Answers to repeated / near-duplicate questions, invalidated whenever the corpus changes
+ANSWER_CACHE_MAX_ENTRIES = int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 512))
+ANSWER_CACHE_TTL = float(os.environ.get('ANSWER_CACHE_TTL', 3600))  # Seconds
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.95))  # Cosine threshold for near-duplicates
+
+# Chunks, their normalized embeddings and source filenames, stored row-aligned
+VECTOR_DB = VectorStore(ann_factory=lambda: IVFIndex(n_lists=ANN_LISTS or None, nprobe=ANN_NPROBE), ann_min_rows=ANN_MIN_ROWS,
+                        storage=VECTOR_STORAGE, rescore_factor=VECTOR_RESCORE_FACTOR)
+
+EMBEDDING_CACHE = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+
+EMBEDDER = create_backend(EMBEDDING_BACKEND, EMBEDDING_MODEL, EMBEDDING_DIM, max_connections=OLLAMA_MAX_CONNECTIONS,
+                          connect_timeout=OLLAMA_CONNECT_TIMEOUT, read_timeout=OLLAMA_READ_TIMEOUT)
+
+ANSWER_CACHE = AnswerCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_SIMILARITY)
+
+SESSION_CONTEXTS = SessionContexts(SESSION_CONTEXT_MAX_SESSIONS)
+
+RERANKER = Reranker(RERANK_MIN_CHUNKS, RERANK_LEXICAL_WEIGHT, RERANK_MMR_LAMBDA, RERANK_MIN_RELATIVE_SCORE,
+                    RERANK_BUDGET_MS)
+
+SESSION_RETRIEVAL = SessionRetrieval(SESSION_RETRIEVAL_MAX_SESSIONS, SESSION_BLEND_WEIGHT, SESSION_REUSE_SIMILARITY)
 
-# Each element in the VECTOR_DB will be a tuple (chunk, embedding, source)
-VECTOR_DB: List[Tuple[str, List[float], str]] = []
-
-
-class DocumentProcessor:
-    """Handle different document types and text processing."""
-
-    @staticmethod
-    def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
-        """Split text into overlapping chunks."""
-        if len(text) <= chunk_size:
-            return [text]
-
-        chunks = []
-        start = 0
-
-        while start < len(text):
-            end = start + chunk_size
-
-            # Try to end at a sentence boundary
-            if end < len(text):
-                # Look for sentence endings near the chunk boundary
-                sentence_end = text.rfind('.', start, end)
-                if sentence_end > start + chunk_size // 2:
-                    end = sentence_end + 1
-
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-
-            start = end - overlap
-
-        return chunks
-
-    @staticmethod
-    def load_txt_file(file_path: str) -> str:
-        """Load text from a TXT file."""
-        with open(file_path, 'r', encoding='utf-8') as file:
-            return file.read()
-
-    @staticmethod
-    def load_docx_file(file_path: str) -> str:
-        """Load text from a DOCX file."""
-        doc = Document(file_path)
-        text_content = []
-
-        for paragraph in doc.paragraphs:
-            if paragraph.text.strip():
-                text_content.append(paragraph.text.strip())
-
-        # Also extract text from tables
-        for table in doc.tables:
-            for row in table.rows:
-                row_text = []
-                for cell in row.cells:
-                    if cell.text.strip():
-                        row_text.append(cell.text.strip())
-                if row_text:
-                    text_content.append(' | '.join(row_text))
-
-        return '\n'.join(text_content)
-
-    @staticmethod
-    def load_pdf_file(file_path: str) -> str:
-        """Load text from a PDF file."""
-        text_content = []
-
-        with open(file_path, 'rb') as file:
-            pdf_reader = PyPDF2.PdfReader(file)
-
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text.strip():
-                    text_content.append(text.strip())
-
-        return '\n'.join(text_content)
-
-    @staticmethod
-    def clean_text(text: str) -> str:
-        """Clean and normalize text."""
-        # Remove extra whitespace
-        text = re.sub(r'\s+', ' ', text)
-        # Remove special characters but keep basic punctuation
-        text = re.sub(r'[^\w\s.,!?;:()\-"]', '', text)
-        return text.strip()
-
-
-def load_document(file_path: str) -> List[str]:
-    """Load and process a document into chunks."""
-    file_path = Path(file_path)
-
-    if not file_path.exists():
-        raise FileNotFoundError(f"File not found: {file_path}")
-
-    processor = DocumentProcessor()
-
-    # Determine file type and load content
-    if file_path.suffix.lower() == '.txt':
-        raw_text = processor.load_txt_file(file_path)
-    elif file_path.suffix.lower() == '.docx':
-        raw_text = processor.load_docx_file(file_path)
-    elif file_path.suffix.lower() == '.pdf':
-        raw_text = processor.load_pdf_file(file_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_path.suffix}")
 
-    # Clean the text
-    clean_text = processor.clean_text(raw_text)
+def add_chunk_to_database(chunk: str, source: str) -> None:
+    """Add a text chunk to the vector database with its embedding."""
+    try:
+        embedding = EMBEDDING_CACHE.get(EMBEDDER.model, chunk)
+        if embedding is None:
+            # Generate embedding for the chunk
+            embedding = EMBEDDER.embed([chunk])[0]
+            EMBEDDING_CACHE.put(EMBEDDER.model, chunk, embedding)
+        VECTOR_DB.add(chunk, embedding, source)
+    except Exception as e:
+        print(f"Error processing chunk: {e}")
 
-    # Split into chunks
-    chunks = processor.chunk_text(clean_text)
 
-    return chunks
+def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed several texts with a single call to the embedding backend."""
+    return EMBEDDER.embed(texts)
 
 
-def add_chunk_to_database(chunk: str, source: str) -> None:
-    """Add a text chunk to the vector database with its embedding."""
+QUERY_BATCHER = QueryEmbeddingBatcher(embed_texts, QUERY_BATCH_WINDOW_MS / 1000, QUERY_BATCH_MAX_SIZE)
+
+
+def _embed_with_retry(texts: List[str]) -> List[List[float]]:
+    """Call embed_texts, retrying with exponential backoff on failure."""
+    for attempt in range(EMBED_MAX_RETRIES + 1):
+        try:
+            return embed_texts(texts)
+        except Exception as e:
+            if attempt == EMBED_MAX_RETRIES:
+                raise
+            delay = EMBED_RETRY_BACKOFF * (2 ** attempt)
+            print(f"Embedding failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def _embed_batch(batch: List[str]) -> List[Optional[List[float]]]:
+    """Embed one batch, falling back to per-chunk retries if the batch keeps failing."""
     try:
-        # Generate embedding for the chunk
-        response = ollama.embeddings(
-            model=EMBEDDING_MODEL,
-            prompt=chunk
-        )
-        embedding = response['embedding']
-        VECTOR_DB.append((chunk, embedding, source))
+        return _embed_with_retry(batch)
     except Exception as e:
-        print(f"Error processing chunk: {e}")
+        print(f"Batch of {len(batch)} chunks failed ({e}), retrying chunks individually")
+
+    embeddings = []
+    for chunk in batch:
+        try:
+            embeddings.append(_embed_with_retry([chunk])[0])
+        except Exception as e:
+            print(f"Error processing chunk: {e}")
+            embeddings.append(None)
+    return embeddings
+
+
+def embed_chunks(chunks: List[str],
+                 progress_callback: Optional[Callable[[int, int], None]] = None) -> List[Optional[List[float]]]:
+    """Embed chunks in batches on a bounded worker pool.
+
+    The result is aligned with `chunks` regardless of completion order; chunks
+    that could not be embedded after all retries come back as None. Chunks
+    already in the embedding cache are not sent to Ollama.
+    """
+    embeddings = EMBEDDING_CACHE.get_many(EMBEDDER.model, chunks)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    done = len(chunks) - len(missing)
+    if done and progress_callback:
+        progress_callback(done, len(chunks))
+
+    to_embed = [chunks[i] for i in missing]
+    batches = [to_embed[i:i + EMBED_BATCH_SIZE] for i in range(0, len(to_embed), EMBED_BATCH_SIZE)]
+    results: List[Optional[List[Optional[List[float]]]]] = [None] * len(batches)
+
+    with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as pool:
+        futures = {pool.submit(_embed_batch, batch): i for i, batch in enumerate(batches)}
+        for future in as_completed(futures):
+            i = futures[future]
+            results[i] = future.result()
+            done += len(batches[i])
+            if progress_callback:
+                progress_callback(done, len(chunks))
+
+    fresh = [embedding for batch in results for embedding in batch]
+    EMBEDDING_CACHE.put_many(
+        EMBEDDER.model,
+        [text for text, embedding in zip(to_embed, fresh) if embedding is not None],
+        [embedding for embedding in fresh if embedding is not None]
+    )
+    for i, embedding in zip(missing, fresh):
+        embeddings[i] = embedding
+    return embeddings
 
 
 def clear_database():
     """Clear the vector database."""
-    global VECTOR_DB
-    VECTOR_DB.clear()
+    with index_lock(INDEX_DIR):
+        VECTOR_DB.clear()
+        save_index()
 
 
-def cosine_similarity(a: List[float], b: List[float]) -> float:
-    """Calculate cosine similarity between two vectors."""
-    dot_product = sum(x * y for x, y in zip(a, b))
-    norm_a = sum(x ** 2 for x in a) ** 0.5
-    norm_b = sum(x ** 2 for x in b) ** 0.5
-    if norm_a == 0 or norm_b == 0:
-        return 0.0
-    return dot_product / (norm_a * norm_b)
+def save_index() -> None:
+    """Persist the vector database as a new generation; call under index_lock."""
+    # The corpus changed, so cached answers may be stale
+    ANSWER_CACHE.clear()
+    try:
+        generation = VECTOR_DB.save(INDEX_DIR)
+        print(f"Saved vector index generation {generation} ({len(VECTOR_DB)} chunks)")
+    except Exception as e:
+        print(f"Error saving vector index: {e}")
 
 
-def retrieve(query: str, top_n: int = 5) -> List[Tuple[str, float, str]]:
-    """Retrieve top_n most similar chunks to the query."""
+def load_index() -> None:
+    """Memory-map the persisted vector index, if one exists."""
     try:
-        # Get embedding for the query
-        response = ollama.embeddings(
-            model=EMBEDDING_MODEL,
-            prompt=query
-        )
-        query_embedding = response['embedding']
+        if VECTOR_DB.load(INDEX_DIR):
+            print(f"Loaded vector index generation {VECTOR_DB.generation} ({len(VECTOR_DB)} chunks)")
+    except Exception as e:
+        print(f"Error loading vector index: {e}")
 
-        # Calculate similarities
-        similarities = []
-        for chunk, embedding, source in VECTOR_DB:
-            similarity = cosine_similarity(query_embedding, embedding)
-            similarities.append((chunk, similarity, source))
 
-        # Sort by similarity and return top_n
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        return similarities[:top_n]
+def sync_index() -> None:
+    """Switch to the latest generation if another worker has saved one."""
+    try:
+        if VECTOR_DB.refresh(INDEX_DIR):
+            print(f"Reloaded vector index generation {VECTOR_DB.generation} ({len(VECTOR_DB)} chunks)")
+    except Exception as e:
+        print(f"Error reloading vector index: {e}")
+
+
+def local_query_embedding(query: str) -> Optional[List[float]]:
+    """A query's embedding if it needs no wait on the embedding service.
+
+    That is a cached one, or one from an in-process backend, which gains
+    nothing from waiting to batch. None means the query has to go to
+    QUERY_BATCHER.
+    """
+    query_embedding = EMBEDDING_CACHE.get(EMBEDDER.model, query)
+    if query_embedding is None and not EMBEDDER.remote:
+        query_embedding = EMBEDDER.embed([query])[0]
+        EMBEDDING_CACHE.put(EMBEDDER.model, query, query_embedding)
+    return query_embedding
+
+
+def embed_query(query: str) -> List[float]:
+    """Embedding for a query, from the embedding cache or a batch shared with concurrent queries."""
+    with timed('query_embed'):
+        query_embedding = local_query_embedding(query)
+        if query_embedding is None:
+            # Raises TimeoutError if the embedding service is slower than QUERY_EMBED_TIMEOUT
+            query_embedding = QUERY_BATCHER.submit(query).result(timeout=QUERY_EMBED_TIMEOUT)
+            EMBEDDING_CACHE.put(EMBEDDER.model, query, query_embedding)
+    return query_embedding
+
+
+def retrieve(query: str, top_n: int = 5, sources: Optional[List[str]] = None,
+             query_embedding: Optional[List[float]] = None,
+             lexical_only: bool = False) -> List[Tuple[str, float, str]]:
+    """Retrieve up to top_n chunks for the query, optionally only from `sources`.
+
+    BM25 and vector rankings are fused with reciprocal-rank fusion, and the
+    top RERANK_CANDIDATES are reranked down to the chunks worth sending. If
+    the query can't be embedded in time, or `lexical_only` is set, BM25
+    answers alone.
+    """
+    try:
+        # Get embedding for the query
+        if query_embedding is None and not lexical_only:
+            try:
+                query_embedding = embed_query(query)
+            except Exception as e:
+                print(f"Embedding unavailable, using lexical search only: {e!r}")
+
+        if RERANK_CANDIDATES <= top_n:
+            with timed('search'):
+                return VECTOR_DB.hybrid_search(query, query_embedding, top_n, sources=sources,
+                                               candidates=HYBRID_CANDIDATES, rrf_k=RRF_K)
+
+        with timed('search'):
+            candidates, vectors = VECTOR_DB.hybrid_candidates(
+                query, query_embedding, RERANK_CANDIDATES, sources=sources,
+                candidates=max(HYBRID_CANDIDATES, RERANK_CANDIDATES), rrf_k=RRF_K)
+        with timed('rerank'):
+            return RERANKER.rerank(query, query_embedding, candidates, vectors, top_n)
     except Exception as e:
         print(f"Error during retrieval: {e}")
         return []
 
 
-def generate_response(query: str, retrieved_chunks: List[Tuple[str, float, str]]) -> str:
-    """Generate response using the language model."""
-    if not retrieved_chunks:
-        return "I don't have enough information to answer that question."
+def build_prompt(query: str, retrieved_chunks: List[Tuple[str, float, str]]) -> str:
+    """Build the per-request prompt from the question and retrieved chunks.
+
+    Overlapping chunks are merged and the context is packed into
+    PROMPT_CONTEXT_TOKENS; the instructions are sent separately as
+    SYSTEM_PROMPT (see generation_args).
+    """
+    with timed('prompt'):
+        return build_user_prompt(query, assemble_context(retrieved_chunks, PROMPT_CONTEXT_TOKENS))
+
 
-    # Build context from retrieved chunks
-    context = '\n'.join([f'- {chunk}' for chunk, _, _ in retrieved_chunks])
+def generation_args(prompt: str, session_id: Optional[str] = None) -> dict:
+    """Keyword arguments for Ollama's generate.
 
-    prompt = f"""You are a helpful AI assistant. Answer the question based only on the following context information:
+    A session's next turn continues from the context its previous turn
+    returned, whose prefix Ollama still has evaluated, as long as the window
+    has room for it; otherwise the fixed system prompt starts a new one.
+    """
+    args = {
+        'model': LANGUAGE_MODEL,
+        'prompt': prompt,
+        'keep_alive': LLM_KEEP_ALIVE,
+        'options': {'num_ctx': LLM_NUM_CTX}
+    }
+    context = SESSION_CONTEXTS.get(session_id) if session_id else None
+    if context and len(context) + estimate_tokens(prompt) + ANSWER_TOKEN_RESERVE <= LLM_NUM_CTX:
+        args['context'] = context
+    else:
+        args['system'] = SYSTEM_PROMPT
+    return args
 
-Context:
-{context}
 
-Question: {query}
+def remember_context(session_id: Optional[str], response) -> None:
+    """Keep the context a final generate response returned, for the session's next turn."""
+    if session_id and response.get('context'):
+        SESSION_CONTEXTS.put(session_id, list(response['context']))
 
-Instructions:
-- Answer based only on the provided context
-- If the context doesn't contain relevant information, say "I don't have enough information to answer that question based on the provided documents."
-- Be concise and accurate
-- Use Portuguese if the question is in Portuguese, otherwise use English
 
-Answer:"""
+def generate_response(query: str, retrieved_chunks: List[Tuple[str, float, str]],
+                      session_id: Optional[str] = None) -> str:
+    """Generate response using the language model, continuing `session_id`'s context if given."""
+    if not retrieved_chunks:
+        return "I don't have enough information to answer that question."
+
+    prompt = build_prompt(query, retrieved_chunks)
 
     try:
         # Generate response (non-streaming for API compatibility)
-        response = ollama.generate(
-            model=LANGUAGE_MODEL,
-            prompt=prompt,
-            stream=False
-        )
+        with timed('generate'):
+            response = ollama.generate(**generation_args(prompt, session_id), stream=False)
+        record_generation(response)
+        remember_context(session_id, response)
         return response['response']
     except Exception as e:
         return f"Error generating response: {e}"
 
 
-def process_uploaded_file(file_path: str) -> bool:
-    """Process an uploaded file and add it to the database."""
-    try:
-        print(f"Processing file: {file_path}")
+def stream_response(query: str, retrieved_chunks: List[Tuple[str, float, str]],
+                    session_id: Optional[str] = None) -> Iterator[str]:
+    """Yield response tokens as the language model produces them.
 
-        # Clear existing database
-        clear_database()
+    Closing the generator closes the HTTP stream to Ollama, which stops
+    generation for a client that has gone away.
+    """
+    if not retrieved_chunks:
+        yield "I don't have enough information to answer that question."
+        return
 
-        # Load and process the document
-        chunks = load_document(file_path)
-        print(f"Document split into {len(chunks)} chunks")
+    prompt = build_prompt(query, retrieved_chunks)
+    start = time.perf_counter()
 
-        # Add chunks to database
-        for i, chunk in enumerate(chunks, 1):
-            add_chunk_to_database(chunk, os.path.basename(file_path))
-            if i % 10 == 0 or i == len(chunks):
-                print(f'Processed {i}/{len(chunks)} chunks')
+    try:
+        stream = ollama.generate(**generation_args(prompt, session_id), stream=True)
+    except Exception as e:
+        yield f"Error generating response: {e}"
+        return
 
-        print(f"Successfully processed {len(chunks)} chunks from {file_path}")
+    try:
+        for part in stream:
+            if part['response']:
+                yield part['response']
+            if part.get('done'):
+                record_generation(part)
+                remember_context(session_id, part)
+    except Exception as e:
+        yield f"Error generating response: {e}"
+    finally:
+        stream.close()
+        # Includes time the client took to read the tokens
+        observe('generate', time.perf_counter() - start)
+
+
+def process_uploaded_file(file_path: str,
+                          progress_callback: Optional[Callable[[int, str], None]] = None,
+                          source: Optional[str] = None,
+                          stats_callback: Optional[Callable[[dict], None]] = None) -> bool:
+    """Add a document to the corpus, or replace it if its filename is already loaded.
+
+    Extraction, chunking, embedding and insertion run as an IngestPipeline,
+    so the first chunks are embedded while later pages are still being
+    parsed. Each embedded batch is searchable in this process as soon as it
+    is inserted, and a generation is saved every INGEST_CHECKPOINT_SECONDS
+    so other workers see it too. Each save rewrites the whole index, so the
+    interval grows with the time the last one took, keeping checkpoints to
+    INGEST_CHECKPOINT_BUDGET of the ingestion time.
+
+    On replace, chunk text already stored for the document is not embedded
+    again; once the whole document is in, rows no longer in it are deleted.
+    A failed ingestion keeps the chunks inserted so far, and uploading the
+    file again only embeds the rest.
+
+    progress_callback, if given, is called with (percent, message) and
+    stats_callback with the pipeline's per-stage throughput. `source` names
+    the document; it defaults to the file's basename.
+    """
+    def report(progress: int, message: str) -> None:
+        if progress_callback:
+            progress_callback(progress, message)
+
+    print(f"Processing file: {file_path}")
+    source = source or os.path.basename(file_path)
+    pipeline = None
+    inserted: List[Chunk] = []
+
+    try:
+        report(5, 'Reading file...')
+        segments = iter_document_segments(file_path)
+
+        # Chunk text already stored for this document, counted so repeated chunks line up
+        sync_index()
+        stored = Counter(VECTOR_DB.chunks[row] for row in VECTOR_DB.source_rows(source))
+
+        def needs_embedding(text: str) -> bool:
+            if stored[text]:
+                stored[text] -= 1
+                return False
+            return True
+
+        pipeline = IngestPipeline(segments, embed_cached, needs_embedding, batch_size=EMBED_BATCH_SIZE,
+                                  embed_workers=EMBED_WORKERS, queue_size=INGEST_QUEUE_SIZE)
+        report(10, 'Embedding chunks...')
+        last_checkpoint = time.monotonic()
+        checkpoint_interval = INGEST_CHECKPOINT_SECONDS
+        done = 0
+
+        for batch, embeddings in pipeline:
+            start = time.perf_counter()
+            embedded = [(chunk, embedding) for chunk, embedding in zip(batch, embeddings) if embedding is not None]
+            VECTOR_DB.add_many([chunk.text for chunk, _ in embedded],
+                               [embedding for _, embedding in embedded],
+                               [source] * len(embedded),
+                               pages=[chunk.page for chunk, _ in embedded])
+            inserted.extend(chunk for chunk, _ in embedded)
+            # New chunks may change answers, even before the next generation is saved
+            ANSWER_CACHE.clear()
+
+            if time.monotonic() - last_checkpoint >= checkpoint_interval:
+                checkpoint_start = time.monotonic()
+                _commit_source(source, inserted, final=False)
+                last_checkpoint = time.monotonic()
+                checkpoint_interval = max(INGEST_CHECKPOINT_SECONDS,
+                                          (last_checkpoint - checkpoint_start) / INGEST_CHECKPOINT_BUDGET)
+            pipeline.stats['insert'].record(len(batch), time.perf_counter() - start)
+
+            done += len(batch)
+            total = pipeline.to_embed
+            if pipeline.chunking_done:
+                report(10 + 85 * done // total, f'Embedded {done}/{total} chunks')
+            else:
+                # The total is still growing: fill the first part of the bar only
+                report(10 + 40 * done // total, f'Embedded {done} of {total} chunks found so far')
+            if stats_callback:
+                stats_callback(pipeline.stage_stats())
+
+        print(f"Document split into {len(pipeline.chunks)} chunks, {pipeline.to_embed} new")
+        observe('parse', pipeline.stats['extract'].busy_seconds)
+        observe('chunk', pipeline.stats['chunk'].busy_seconds)
+
+        # Commit under the index lock, re-diffing in case another worker
+        # saved a generation while we were embedding
+        report(95, 'Saving index...')
+        _commit_source(source, pipeline.chunks, final=True)
+        if stats_callback:
+            stats_callback(pipeline.stage_stats())
+
+        print(f"Successfully processed {len(inserted)}/{pipeline.to_embed} new chunks from {file_path}")
+        report(100, 'File processed successfully!')
         return True
 
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
+        if inserted:
+            # Share what was ingested so far with the other workers
+            try:
+                _commit_source(source, inserted, final=False)
+            except Exception as commit_error:
+                print(f"Error saving partially processed file {file_path}: {commit_error}")
+        if pipeline is not None and stats_callback:
+            stats_callback(pipeline.stage_stats())
         return False
 
 
-def chat_query(query: str) -> dict:
-    """Process a chat query and return response with metadata."""
-    if not VECTOR_DB:
+def embed_cached(texts: List[str]) -> List[Optional[List[float]]]:
+    """Embed one batch, taking what it can from the embedding cache."""
+    embeddings = EMBEDDING_CACHE.get_many(EMBEDDER.model, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    if missing:
+        with timed('embed'):
+            fresh = _embed_batch([texts[i] for i in missing])
+        EMBEDDING_CACHE.put_many(
+            EMBEDDER.model,
+            [texts[i] for i, embedding in zip(missing, fresh) if embedding is not None],
+            [embedding for embedding in fresh if embedding is not None]
+        )
+        for i, embedding in zip(missing, fresh):
+            embeddings[i] = embedding
+    return embeddings
+
+
+def _commit_source(source: str, chunks: List[Chunk], final: bool) -> None:
+    """Save a generation holding `chunks` for `source`.
+
+    Reloading a newer generation drops rows inserted but not yet saved here;
+    they are re-added from the embedding cache. Only a final commit deletes
+    stored rows that are not in `chunks`.
+    """
+    with index_lock(INDEX_DIR):
+        sync_index()
+        _apply_source(source, chunks, final)
+        save_index()
+
+
+def commit_documents(documents: Dict[str, List[Chunk]]) -> None:
+    """Replace several documents in a single generation.
+
+    Their chunks are expected to be in the embedding cache already, so the
+    index lock is not held while embedding; saving once for the lot avoids
+    rewriting the whole index per document.
+    """
+    with index_lock(INDEX_DIR):
+        sync_index()
+        for source, chunks in documents.items():
+            _apply_source(source, chunks, final=True)
+        save_index()
+
+
+def _apply_source(source: str, chunks: List[Chunk], final: bool) -> None:
+    """Bring the rows stored for `source` in line with `chunks`; call under index_lock."""
+    new_chunks, stale_rows = _diff_source(source, chunks)
+    embeddings = embed_chunks([chunk.text for chunk in new_chunks])
+    embedded = [(chunk, embedding) for chunk, embedding in zip(new_chunks, embeddings) if embedding is not None]
+
+    if final:
+        VECTOR_DB.remove_rows(stale_rows)
+    VECTOR_DB.add_many([chunk.text for chunk, _ in embedded],
+                       [embedding for _, embedding in embedded],
+                       [source] * len(embedded),
+                       pages=[chunk.page for chunk, _ in embedded])
+
+
+def _diff_source(source: str, chunks: List[Chunk]) -> Tuple[List[Chunk], List[int]]:
+    """Chunks not yet stored for `source`, and stored rows no longer in `chunks`."""
+    stored = {}
+    for row in VECTOR_DB.source_rows(source):
+        stored.setdefault(VECTOR_DB.chunks[row], []).append(row)
+    new_chunks: List[Chunk] = []
+    for chunk in chunks:
+        if stored.get(chunk.text):
+            stored[chunk.text].pop()
+        else:
+            new_chunks.append(chunk)
+    stale_rows = [row for rows in stored.values() for row in rows]
+    return new_chunks, stale_rows
+
+
+def delete_document(source: str) -> int:
+    """Remove a document's chunks from the corpus; returns how many were removed."""
+    with index_lock(INDEX_DIR):
+        sync_index()
+        removed = VECTOR_DB.remove_source(source)
+        if removed:
+            save_index()
+    return removed
+
+
+def list_documents() -> List[dict]:
+    """Loaded documents with their chunk counts."""
+    sync_index()
+    return [{'source': source, 'chunks': count} for source, count in sorted(VECTOR_DB.documents().items())]
+
+
+NO_DOCUMENTS_RESPONSE = "No documents have been uploaded yet. Please upload a document first."
+NO_MATCHES_RESPONSE = "I couldn't find any relevant information in the uploaded documents."
+
+
+def retrieve_in_session(query: str, sources: Optional[List[str]], query_embedding: Optional[List[float]],
+                        session_id: Optional[str] = None) -> List[Tuple[str, float, str]]:
+    """retrieve() for a chat turn, building on the session's earlier turns.
+
+    A missing embedding means the embedding service failed or timed out, so
+    only BM25 is used rather than waiting on it twice.
+    """
+    if session_id is None or query_embedding is None:
+        return retrieve(query, sources=sources, query_embedding=query_embedding,
+                        lexical_only=query_embedding is None)
+
+    corpus_version = VECTOR_DB.generation
+    search_embedding, results = SESSION_RETRIEVAL.plan(session_id, query_embedding, corpus_version, sources)
+    if results is None:
+        results = retrieve(query, sources=sources, query_embedding=search_embedding)
+    SESSION_RETRIEVAL.record(session_id, query_embedding, results, corpus_version, sources)
+    return results
+
+
+class ChatTurn:
+    """The steps of answering one chat query, other than embedding it and generating the answer.
+
+    Shared by chat_query and stream_chat_query here and by their asyncio
+    versions in async_rag, which embed and generate their own way. After
+    sync_index(), early_result(), similar_result() and retrieve() run in
+    that order until one returns the final result; if none does, the
+    answer generated from retrieved_chunks goes to finish(). Follow-ups in
+    a session depend on the conversation, so they neither use nor fill the
+    answer cache.
+    """
+
+    def __init__(self, query: str, sources: Optional[List[str]] = None, session_id: Optional[str] = None):
+        self.query = query
+        self.sources = sources
+        self.session_id = session_id
+        self.corpus_version = VECTOR_DB.generation
+        self.follow_up = SESSION_RETRIEVAL.active(session_id)
+        self.query_embedding: Optional[List[float]] = None
+        self.retrieved_chunks: List[Tuple[str, float, str]] = []
+
+    def early_result(self) -> Optional[dict]:
+        """The result if the corpus is empty or the exact question is in the answer cache."""
+        if not VECTOR_DB:
+            return canned_result(NO_DOCUMENTS_RESPONSE)
+        if self.follow_up:
+            return None
+        cached = ANSWER_CACHE.lookup(self.query, self.corpus_version, self.sources)
+        return {**cached, "cached": True} if cached is not None else None
+
+    def similar_result(self, query_embedding: Optional[List[float]]) -> Optional[dict]:
+        """Keep the query's embedding for retrieval; the result if a near-identical question is cached.
+
+        A missing embedding means the embedding service failed or timed out.
+        """
+        self.query_embedding = query_embedding
+        if self.follow_up or query_embedding is None:
+            return None
+        cached = ANSWER_CACHE.lookup_similar(query_embedding, self.corpus_version, self.sources)
+        return {**cached, "cached": True} if cached is not None else None
+
+    def retrieve(self) -> Optional[dict]:
+        """Retrieve the chunks to answer from; the result if none are relevant."""
+        self.retrieved_chunks = retrieve_in_session(self.query, self.sources, self.query_embedding, self.session_id)
+        return None if self.retrieved_chunks else canned_result(NO_MATCHES_RESPONSE)
+
+    def meta(self) -> dict:
         return {
-            "response": "No documents have been uploaded yet. Please upload a document first.",
-            "sources": [],
-            "chunks_used": 0
+            # Extract unique sources
+            "sources": list(set([source for _, _, source in self.retrieved_chunks])),
+            "chunks_used": len(self.retrieved_chunks)
         }
 
-    # Retrieve relevant chunks
-    retrieved_chunks = retrieve(query)
+    def finish(self, response: str) -> dict:
+        """The result for a generated answer, which is cached unless generation failed."""
+        result = {"response": response, **self.meta()}
+        if not self.follow_up and not response.startswith("Error generating response"):
+            ANSWER_CACHE.put(self.query, self.corpus_version, result, self.query_embedding, self.sources)
+        return {**result, "cached": False}
 
-    if not retrieved_chunks:
-        return {
-            "response": "I couldn't find any relevant information in the uploaded documents.",
-            "sources": [],
-            "chunks_used": 0
-        }
 
-    # Generate response
-    response = generate_response(query, retrieved_chunks)
+def canned_result(response: str) -> dict:
+    """A result with a fixed response and no sources."""
+    return {"response": response, "sources": [], "chunks_used": 0, "cached": False}
 
-    # Extract unique sources
-    sources = list(set([source for _, _, source in retrieved_chunks]))
 
-    return {
-        "response": response,
-        "sources": sources,
-        "chunks_used": len(retrieved_chunks)
-    }
+def result_events(result: dict) -> Iterator[dict]:
+    """stream_chat_query's events for a result that needs no generation."""
+    yield {"event": "meta", "sources": result["sources"], "chunks_used": result["chunks_used"],
+           "cached": result["cached"]}
+    yield {"event": "token", "token": result["response"]}
+    yield {"event": "done", "response": result["response"]}
+
+
+def _turn_embedding(query: str) -> Optional[List[float]]:
+    """embed_query(), or None if it failed, so retrieval falls back to BM25 rather than waiting again."""
+    try:
+        return embed_query(query)
+    except Exception as e:
+        print(f"Error embedding query: {e!r}")
+        return None
+
+
+def _prepare_turn(query: str, sources: Optional[List[str]],
+                  session_id: Optional[str]) -> Tuple[ChatTurn, Optional[dict]]:
+    """A ChatTurn up to generation, and its result if it needs none."""
+    sync_index()
+    turn = ChatTurn(query, sources, session_id)
+    result = turn.early_result()
+    if result is None:
+        result = turn.similar_result(_turn_embedding(query))
+    if result is None:
+        result = turn.retrieve()
+    return turn, result
+
+
+def chat_query(query: str, sources: Optional[List[str]] = None, session_id: Optional[str] = None) -> dict:
+    """Process a chat query and return response with metadata.
+
+    If `sources` is given, only those documents are searched. A `session_id`
+    makes retrieval (and, if enabled, generation) build on the session's
+    previous turns. Answers come from the answer cache when the same or a
+    near-identical question was asked against the current corpus; `cached`
+    says which. See ChatTurn for the steps.
+    """
+    turn, result = _prepare_turn(query, sources, session_id)
+    if result is not None:
+        return result
+    return turn.finish(generate_response(query, turn.retrieved_chunks, session_id))
+
+
+def stream_chat_query(query: str, sources: Optional[List[str]] = None,
+                      session_id: Optional[str] = None) -> Iterator[dict]:
+    """Streaming variant of chat_query.
+
+    Yields a 'meta' event with sources, chunks_used and cached, then one
+    'token' event per generated fragment, then a 'done' event carrying the
+    full response. A cached answer arrives as a single token.
+    """
+    turn, result = _prepare_turn(query, sources, session_id)
+    if result is not None:
+        yield from result_events(result)
+        return
+
+    yield {"event": "meta", **turn.meta(), "cached": False}
+
+    tokens = []
+    response_stream = stream_response(query, turn.retrieved_chunks, session_id)
+    try:
+        for token in response_stream:
+            tokens.append(token)
+            yield {"event": "token", "token": token}
+    finally:
+        # Runs on client disconnect too, cancelling the Ollama request
+        response_stream.close()
+
+    yield {"event": "done", "response": turn.finish(''.join(tokens))["response"]}
+
+
+def _collect_metrics() -> list:
+    """Corpus size and cache counters for /metrics, read at scrape time."""
+    embedding_cache = EMBEDDING_CACHE.stats()
+    answer_cache = ANSWER_CACHE.stats()
+    session_retrieval = SESSION_RETRIEVAL.stats()
+    reranker = RERANKER.stats()
+    embedder = EMBEDDER.stats()
+    batcher = QUERY_BATCHER.stats()
+    memory = VECTOR_DB.memory_usage()
+    return [
+        ('rag_vector_store_chunks', 'gauge', 'Live chunks in the vector store.',
+         [('rag_vector_store_chunks', {}, len(VECTOR_DB))]),
+        ('rag_documents', 'gauge', 'Documents in the corpus.', [('rag_documents', {}, len(VECTOR_DB.documents()))]),
+        ('rag_index_generation', 'gauge', 'Generation of the loaded vector index.',
+         [('rag_index_generation', {}, VECTOR_DB.generation)]),
+        ('rag_vector_store_embedding_bytes', 'gauge', 'Bytes of stored embeddings, by storage mode.',
+         [('rag_vector_store_embedding_bytes', {'storage': memory['storage']}, memory['embedding_bytes'])]),
+        ('rag_embedding_vectors_total', 'counter', 'Vectors made by the embedding backend.',
+         [('rag_embedding_vectors_total', {'model': embedder['model']}, embedder['vectors'])]),
+        ('rag_embedding_busy_seconds_total', 'counter', 'Seconds spent in embedding backend calls.',
+         [('rag_embedding_busy_seconds_total', {'model': embedder['model']}, embedder['busy_seconds'])]),
+        ('rag_embedding_cache_entries', 'gauge', 'Embeddings in the embedding cache.',
+         [('rag_embedding_cache_entries', {}, embedding_cache['entries'])]),
+        ('rag_embedding_cache_lookups_total', 'counter', 'Embedding cache lookups by result.',
+         [('rag_embedding_cache_lookups_total', {'result': 'hit'}, embedding_cache['hits']),
+          ('rag_embedding_cache_lookups_total', {'result': 'miss'}, embedding_cache['misses'])]),
+        ('rag_answer_cache_entries', 'gauge', 'Answers in the answer cache.',
+         [('rag_answer_cache_entries', {}, answer_cache['entries'])]),
+        ('rag_answer_cache_lookups_total', 'counter', 'Answer cache lookups by result.',
+         [('rag_answer_cache_lookups_total', {'result': 'hit'}, answer_cache['hits']),
+          ('rag_answer_cache_lookups_total', {'result': 'semantic_hit'}, answer_cache['semantic_hits']),
+          ('rag_answer_cache_lookups_total', {'result': 'miss'}, answer_cache['misses'])]),
+        ('rag_rerank_chunks_total', 'counter',
+         'Chunks the reranker passed to generation, and dropped against a fixed top_n.',
+         [('rag_rerank_chunks_total', {'result': 'passed'}, reranker['passed']),
+          ('rag_rerank_chunks_total', {'result': 'dropped'}, reranker['dropped'])]),
+        ('rag_rerank_budget_exits_total', 'counter', 'Reranks cut short by RERANK_BUDGET_MS.',
+         [('rag_rerank_budget_exits_total', {}, reranker['budget_exits'])]),
+        ('rag_session_retrieval_sessions', 'gauge', 'Chat sessions with retrieval state for follow-ups.',
+         [('rag_session_retrieval_sessions', {}, session_retrieval['sessions'])]),
+        ('rag_session_retrievals_total', 'counter', 'Follow-up retrievals by how the session state was used.',
+         [('rag_session_retrievals_total', {'result': 'reused'}, session_retrieval['reused']),
+          ('rag_session_retrievals_total', {'result': 'blended'}, session_retrieval['blended'])]),
+        ('rag_session_contexts', 'gauge', 'Chat sessions with a generation context kept for their next turn.',
+         [('rag_session_contexts', {}, len(SESSION_CONTEXTS))]),
+        ('rag_query_batcher_queue_depth', 'gauge', 'Query embeddings waiting to be batched.',
+         [('rag_query_batcher_queue_depth', {}, batcher['queue_depth'])]),
+        ('rag_query_batch_size', 'histogram', 'Queries per batched embed call.',
+         [('rag_query_batch_size_bucket', {'le': bound}, count)
+          for bound, count in batcher['batch_size_histogram'].items()]
+         + [('rag_query_batch_size_sum', {}, batcher['dispatched']),
+            ('rag_query_batch_size_count', {}, batcher['batches'])]),
+        ('rag_query_batcher_wait_seconds', 'summary', 'Time queries waited in the batcher before being sent.',
+         [('rag_query_batcher_wait_seconds_sum', {}, batcher['wait_seconds_total']),
+          ('rag_query_batcher_wait_seconds_count', {}, batcher['dispatched'])]),
+        ('rag_query_batcher_wait_seconds_max', 'gauge', 'Longest time a query has waited in the batcher.',
+         [('rag_query_batcher_wait_seconds_max', {}, batcher['wait_seconds_max'])]),
+        ('rag_query_batcher_requests_total', 'counter',
+         'Query embedding requests, by whether they joined an identical queued or in-flight query.',
+         [('rag_query_batcher_requests_total', {'result': 'batched'}, batcher['requests'] - batcher['coalesced']),
+          ('rag_query_batcher_requests_total', {'result': 'coalesced'}, batcher['coalesced'])])
+    ]
+
+
+REGISTRY.register_collector(_collect_metrics)
+
+# Pick up the index from a previous run so the corpus survives restarts
+load_index()
 
 
 def main():
@@ -0,0 +1,201 @@
+"""Latency histograms and counters, rendered in Prometheus text format.
+
+Metrics are kept per process; with several gunicorn/uvicorn workers each
+scrape of /metrics sees the worker that served it, so scrape them per
+worker or sum in Prometheus. Recording is a perf_counter call and a
+bisect under a lock, cheap enough for the chat hot path.
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Seconds; spans a cached query embedding (~1 ms) to a long generation (~1 min)
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# A sample is (metric name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{key}="{value}"' for key, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per value of a single label."""
+
+    def __init__(self, name: str, documentation: str, label: str, buckets: Sequence[float] = STAGE_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self.buckets = tuple(buckets)
+        self._series: Dict[str, List] = {}  # label value -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, label_value: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def collect(self) -> Tuple[str, str, str, List[Sample]]:
+        samples: List[Sample] = []
+        with self._lock:
+            series = {key: list(values) for key, values in self._series.items()}
+        for label_value, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), values):
+                cumulative += count
+                samples.append((self.name + '_bucket', {self.label: label_value, 'le': _format_value(bound)},
+                                cumulative))
+            samples.append((self.name + '_sum', {self.label: label_value}, values[-2]))
+            samples.append((self.name + '_count', {self.label: label_value}, values[-1]))
+        return self.name, 'histogram', self.documentation, samples
+
+
+class Counter:
+    """Monotonic counter."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self._value += amount
+
+    def collect(self) -> Tuple[str, str, str, List[Sample]]:
+        return self.name, 'counter', self.documentation, [(self.name, {}, self._value)]
+
+
+class Registry:
+    """Metrics plus callbacks that report current values (store size, cache stats) at scrape time."""
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, List[Sample]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, str, str, List[Sample]]]]) -> None:
+        """Add a callback returning (name, type, help, samples) families."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        families = [metric.collect() for metric in self._metrics]
+        for collector in self._collectors:
+            try:
+                families.extend(collector())
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+
+        lines = []
+        for name, metric_type, documentation, samples in families:
+            lines.append(f'# HELP {name} {documentation}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            for sample_name, labels, value in samples:
+                lines.append(f'{sample_name}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'rag_stage_seconds',
+    'Time spent per stage: parse and chunk per document, embed per ingestion batch, '
+    'query_embed, search, rerank, prompt and generate per chat query, and prompt_eval, the part of '
+    'generate the language model spent evaluating the prompt.',
+    'stage'
+))
+GENERATED_TOKENS = REGISTRY.register(Counter(
+    'rag_generated_tokens_total', 'Tokens generated by the language model.'))
+GENERATION_SECONDS = REGISTRY.register(Counter(
+    'rag_generation_seconds_total', 'Seconds the language model spent generating those tokens.'))
+PROMPT_TOKENS = REGISTRY.register(Counter(
+    'rag_prompt_tokens_total', 'Prompt tokens evaluated by the language model; cached prefixes are not counted.'))
+
+# Per-request breakdown, only collected inside collect_timings()
+_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar('rag_timings', default=None)
+
+
+class timed:
+    """Context manager recording its duration under `stage`.
+
+    Also adds it to the request's breakdown when collect_timings() is active.
+    """
+    __slots__ = ('stage', 'start')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def observe(stage: str, seconds: float) -> None:
+    """Record a duration measured elsewhere."""
+    STAGE_SECONDS.observe(seconds, stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def record_generation(response) -> None:
+    """Count tokens and generation time from a final Ollama generate response."""
+    eval_count = response.get('eval_count')
+    if eval_count:
+        GENERATED_TOKENS.inc(eval_count)
+        # Ollama reports durations in nanoseconds
+        GENERATION_SECONDS.inc((response.get('eval_duration') or 0) / 1e9)
+    if response.get('prompt_eval_count'):
+        PROMPT_TOKENS.inc(response.get('prompt_eval_count'))
+    if response.get('prompt_eval_duration') is not None:
+        observe('prompt_eval', response.get('prompt_eval_duration') / 1e9)
+
+
+@contextmanager
+def collect_timings() -> Iterator[Dict[str, float]]:
+    """Collect the stage timings of this request into the yielded dict.
+
+    Stages timed in threads started with asyncio.to_thread or in the same
+    thread are included; the dict also gets a 'total'.
+    """
+    timings: Dict[str, float] = {}
+    token = _timings.set(timings)
+    start = time.perf_counter()
+    try:
+        yield timings
+    finally:
+        timings['total'] = time.perf_counter() - start
+        _timings.reset(token)
+
+
+def timings_ms(timings: Dict[str, float]) -> Dict[str, float]:
+    """A breakdown in milliseconds, for JSON responses."""
+    return {stage: round(seconds * 1000, 2) for stage, seconds in timings.items()}
@@ -0,0 +1,168 @@
+"""Prompt assembly for answer generation.
+
+Retrieved chunks overlap their neighbours (see TextChunker), so the top
+results often repeat text. assemble_context() drops chunks that are already
+contained in a better-ranked one, joins overlapping neighbours from the same
+document into one passage, and packs passages, best first, into a token
+budget.
+
+The instructions are the same for every request, so they go in a fixed
+system prompt ahead of everything else: Ollama keeps the KV cache of the
+longest prefix it has already evaluated, and only the context and question
+after it are evaluated again. Within a chat session, generation can instead
+continue from the `context` tokens Ollama returned for the previous turn
+(SessionContexts), which also carries the earlier turns. That is only cheap
+while Ollama still holds the context in one of its cache slots; once it has
+been evicted, the whole conversation is evaluated again.
+"""
+import math
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+from document_processor import count_tokens
+
+SYSTEM_PROMPT = """You are a helpful AI assistant. Answer each question based only on the context information given with it.
+
+Instructions:
+- Answer based only on the provided context
+- If the context doesn't contain relevant information, say "I don't have enough information to answer that question based on the provided documents."
+- Be concise and accurate
+- Use Portuguese if the question is in Portuguese, otherwise use English"""
+
+# Language model tokens per TextChunker token; BPE vocabularies split some longer words
+TOKENS_PER_CHUNK_TOKEN = 1.3
+MIN_MERGE_OVERLAP = 20  # Characters two chunks must share to be joined
+
+Passage = Tuple[str, float, str]  # (text, score, source), like retrieve() results
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate language model tokens in `text`."""
+    return math.ceil(count_tokens(text) * TOKENS_PER_CHUNK_TOKEN)
+
+
+def _overlap(first: str, second: str) -> int:
+    """Length of the longest suffix of `first` that starts `second`, or 0 if under MIN_MERGE_OVERLAP."""
+    probe = second[:MIN_MERGE_OVERLAP]
+    if len(probe) < MIN_MERGE_OVERLAP:
+        return 0
+    # Earlier matches are longer overlaps
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return len(first) - start
+        start = first.find(probe, start + 1)
+    return 0
+
+
+def _merge_pair(better: Passage, worse: Passage) -> Optional[str]:
+    """Text of the two passages as one, or None if they don't overlap."""
+    if worse[0] in better[0]:
+        return better[0]
+    if better[0] in worse[0]:
+        return worse[0]
+    if better[2] != worse[2]:
+        return None
+    overlap = _overlap(better[0], worse[0])
+    if overlap:
+        return better[0] + worse[0][overlap:]
+    overlap = _overlap(worse[0], better[0])
+    if overlap:
+        return worse[0] + better[0][overlap:]
+    return None
+
+
+def merge_passages(retrieved_chunks: Sequence[Passage]) -> List[Passage]:
+    """Deduplicate and join overlapping chunks, keeping relevance order.
+
+    A merged passage takes the place and score of its best-ranked part.
+    """
+    passages: List[Tuple[int, Passage]] = []  # (rank of the best part, passage)
+    for rank, passage in enumerate(retrieved_chunks):
+        i = 0
+        while i < len(passages):
+            kept_rank, kept = passages[i]
+            better, worse = (kept, passage) if kept_rank < rank else (passage, kept)
+            text = _merge_pair(better, worse)
+            if text is None:
+                i += 1
+                continue
+            # The grown passage may now overlap ones already checked, so start over
+            del passages[i]
+            rank, passage = min(rank, kept_rank), (text, better[1], better[2])
+            i = 0
+        passages.append((rank, passage))
+    return [passage for _, passage in sorted(passages, key=lambda item: item[0])]
+
+
+def pack_passages(passages: Sequence[Passage], budget_tokens: int) -> List[Passage]:
+    """The best-ranked passages that fit in budget_tokens.
+
+    Passages that don't fit are skipped in favour of smaller ones further
+    down; the best passage is truncated if it alone is over the budget.
+    """
+    packed: List[Passage] = []
+    remaining = budget_tokens
+    for text, score, source in passages:
+        tokens = estimate_tokens(text)
+        if tokens <= remaining:
+            packed.append((text, score, source))
+            remaining -= tokens
+        elif not packed:
+            cut = text[:int(len(text) * remaining / tokens)]
+            packed.append((cut.rsplit(' ', 1)[0] if ' ' in cut else cut, score, source))
+            remaining = 0
+    return packed
+
+
+def assemble_context(retrieved_chunks: Sequence[Passage], budget_tokens: int) -> List[Passage]:
+    """Passages to put in the prompt: merged, deduplicated and packed into budget_tokens."""
+    return pack_passages(merge_passages(retrieved_chunks), budget_tokens)
+
+
+def build_user_prompt(query: str, passages: Sequence[Passage]) -> str:
+    """The per-request part of the prompt, which follows SYSTEM_PROMPT."""
+    context = '\n'.join(f'- {text}' for text, _, _ in passages)
+    return f"""Context:
+{context}
+
+Question: {query}
+
+Answer:"""
+
+
+class SessionContexts:
+    """Ollama `context` tokens from each chat session's latest turn, least recently used evicted first.
+
+    Per process: a session whose next turn lands on another worker starts a
+    fresh context there.
+    """
+
+    def __init__(self, max_sessions: int = 0):
+        self.max_sessions = max_sessions
+        self._contexts: OrderedDict[str, List[int]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[List[int]]:
+        with self._lock:
+            context = self._contexts.get(session_id)
+            if context is not None:
+                self._contexts.move_to_end(session_id)
+            return context
+
+    def put(self, session_id: str, context: List[int]) -> None:
+        if self.max_sessions <= 0:
+            return
+        with self._lock:
+            self._contexts[session_id] = context
+            self._contexts.move_to_end(session_id)
+            while len(self._contexts) > self.max_sessions:
+                self._contexts.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._contexts.pop(session_id, None)
+
+    def __len__(self) -> int:
+        return len(self._contexts)
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Sequence
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class QueryEmbeddingBatcher:
+    """Coalesce concurrent query embeddings into batched embed calls.
+
+    A request waits at most `window` seconds after the oldest queued one
+    (less if max_batch_size queries arrive first); the queued texts are then
+    sent as a single embed_fn call. A text that is already queued or being
+    embedded joins the existing request instead of adding a new one.
+    """
+
+    def __init__(self, embed_fn: Callable[[List[str]], Sequence[List[float]]], window: float = 0.005,
+                 max_batch_size: int = 32, max_in_flight: int = 4):
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending: "OrderedDict[str, tuple]" = OrderedDict()  # text -> (future, enqueued at)
+        self._in_flight: Dict[str, Future] = {}
+        self._cond = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='query-embed')
+        self._thread = None
+
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.errors = 0
+        self.batch_size_counts = [0] * (len(BATCH_SIZE_BUCKETS) + 1)
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    def submit(self, text: str) -> Future:
+        """Queue a text for embedding; the future resolves to its embedding."""
+        with self._cond:
+            self.requests += 1
+            if text in self._pending:
+                self.coalesced += 1
+                return self._pending[text][0]
+            if text in self._in_flight:
+                self.coalesced += 1
+                return self._in_flight[text]
+
+            future = Future()
+            self._pending[text] = (future, time.monotonic())
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._collect, name='query-batcher', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+            return future
+
+    def embed(self, text: str) -> List[float]:
+        """Blocking submit()."""
+        return self.submit(text).result()
+
+    def _collect(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+
+                # Hold the batch open until the oldest request has waited `window`
+                oldest = next(iter(self._pending.values()))[1]
+                while len(self._pending) < self.max_batch_size:
+                    remaining = oldest + self.window - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+
+                now = time.monotonic()
+                batch = []
+                while self._pending and len(batch) < self.max_batch_size:
+                    text, (future, enqueued) = self._pending.popitem(last=False)
+                    self._in_flight[text] = future
+                    batch.append((text, future))
+                    wait = now - enqueued
+                    self.wait_seconds_total += wait
+                    self.wait_seconds_max = max(self.wait_seconds_max, wait)
+                self.batches += 1
+                self.batch_size_counts[self._bucket(len(batch))] += 1
+
+            self._executor.submit(self._send, batch)
+
+    @staticmethod
+    def _bucket(size: int) -> int:
+        for i, bound in enumerate(BATCH_SIZE_BUCKETS):
+            if size <= bound:
+                return i
+        return len(BATCH_SIZE_BUCKETS)
+
+    def _send(self, batch: List[tuple]) -> None:
+        try:
+            embeddings = self.embed_fn([text for text, _ in batch])
+            results = list(zip(batch, embeddings))
+            error = None
+        except Exception as e:
+            results, error = [], e
+
+        with self._cond:
+            for text, _ in batch:
+                self._in_flight.pop(text, None)
+            if error is not None:
+                self.errors += 1
+
+        # A caller may have cancelled a future it was waiting on
+        if error is not None:
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(error)
+        else:
+            for (_, future), embedding in results:
+                if not future.cancelled():
+                    future.set_result(embedding)
+
+    def stats(self) -> dict:
+        with self._cond:
+            dispatched = self.requests - self.coalesced - len(self._pending)
+            histogram = {}
+            cumulative = 0
+            for bound, count in zip(BATCH_SIZE_BUCKETS + ('+Inf',), self.batch_size_counts):
+                cumulative += count
+                histogram[str(bound)] = cumulative
+            return {
+                'queue_depth': len(self._pending),
+                'in_flight': len(self._in_flight),
+                'requests': self.requests,
+                'coalesced': self.coalesced,
+                'batches': self.batches,
+                'errors': self.errors,
+                'window_ms': self.window * 1000,
+                # Cumulative counts of batches with at most `bound` queries
+                'batch_size_histogram': histogram,
+                'dispatched': dispatched,
+                'wait_seconds_total': self.wait_seconds_total,
+                'wait_seconds_max': self.wait_seconds_max,
+                'avg_wait_ms': round(1000 * self.wait_seconds_total / dispatched, 3) if dispatched else 0.0,
+                'max_wait_ms': round(1000 * self.wait_seconds_max, 3)
+            }
@@ -0,0 +1,124 @@
+"""Lightweight second-stage reranking of retrieval candidates.
+
+There is no cross-encoder. Each candidate in a wide pool (the top 50 of
+hybrid search, say) is scored from what retrieval already has: its
+embedding's cosine similarity to the query, and how much of the query's
+vocabulary it contains. Query terms are weighted by how rare they are
+within the pool, so "the" counts for little and a part number for a lot.
+Chunks are then picked greedily by maximal marginal relevance (MMR), so a
+near-copy of a chunk already picked loses to a chunk that adds something.
+
+Picking stops as soon as the next chunk's relevance falls below
+min_relative_score of the best one, so a question that one chunk answers
+sends one chunk to the model rather than top_n. It also stops when the
+latency budget runs out.
+"""
+import math
+import threading
+import time
+from collections import Counter
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from lexical_index import tokenize
+
+Results = List[Tuple[str, float, str]]  # (chunk, score, source)
+
+
+class Reranker:
+    """MMR reranking with a relative score cutoff; keeps counters of what it passed and dropped."""
+
+    def __init__(self, min_chunks: int = 1, lexical_weight: float = 0.3, mmr_lambda: float = 0.7,
+                 min_relative_score: float = 0.6, budget_ms: float = 10.0):
+        self.min_chunks = min_chunks
+        self.lexical_weight = lexical_weight
+        self.mmr_lambda = mmr_lambda
+        self.min_relative_score = min_relative_score
+        self.budget_ms = budget_ms
+        self.requests = 0
+        self.candidates = 0
+        self.passed = 0
+        self.dropped = 0
+        self.budget_exits = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def lexical_overlap(query: str, texts: Sequence[str]) -> np.ndarray:
+        """Share of the query's terms in each text, terms weighted by their rarity among `texts`.
+
+        A term in every text still gets weight log(2), so full matches beat partial ones.
+        """
+        terms = set(tokenize(query))
+        if not terms or not texts:
+            return np.zeros(len(texts), dtype=np.float32)
+        found = [terms.intersection(tokenize(text)) for text in texts]
+        # Terms no candidate contains can't tell candidates apart, so only the others count
+        document_frequency = Counter(term for present in found for term in present)
+        weights = {term: math.log(1 + len(texts) / count) for term, count in document_frequency.items()}
+        total = sum(weights.values())
+        if not total:
+            return np.zeros(len(texts), dtype=np.float32)
+        return np.array([sum(weights[term] for term in present) / total for present in found], dtype=np.float32)
+
+    def relevance(self, query: str, query_embedding: Optional[Sequence[float]], candidates: Results,
+                  vectors: np.ndarray) -> np.ndarray:
+        """Per-candidate relevance: cosine similarity blended with lexical overlap."""
+        overlap = self.lexical_overlap(query, [text for text, _, _ in candidates])
+        if query_embedding is None:
+            return overlap
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if not norm:
+            return overlap
+        cosine = vectors @ (query_vector / norm)
+        return (1 - self.lexical_weight) * cosine + self.lexical_weight * overlap
+
+    def rerank(self, query: str, query_embedding: Optional[Sequence[float]], candidates: Results,
+               vectors: np.ndarray, max_chunks: int) -> Results:
+        """Up to max_chunks candidates, most relevant first, with relevance as their score.
+
+        `vectors` are the candidates' normalized embeddings, row-aligned with
+        `candidates`.
+        """
+        if not candidates or max_chunks <= 0:
+            return []
+        deadline = time.perf_counter() + self.budget_ms / 1000
+        relevance = self.relevance(query, query_embedding, candidates, vectors)
+        best = float(relevance.max())
+        cutoff = best * self.min_relative_score if best > 0 else -math.inf
+
+        picked: List[int] = []
+        redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)  # Max similarity to a picked chunk
+        available = np.ones(len(candidates), dtype=bool)
+        budget_exit = False
+        while len(picked) < min(max_chunks, len(candidates)):
+            if picked and time.perf_counter() > deadline:
+                budget_exit = True
+                break
+            mmr = self.mmr_lambda * relevance - (1 - self.mmr_lambda) * np.maximum(redundancy, 0)
+            mmr[~available] = -np.inf
+            choice = int(np.argmax(mmr))
+            if len(picked) >= self.min_chunks and relevance[choice] < cutoff:
+                break
+            picked.append(choice)
+            available[choice] = False
+            redundancy = np.maximum(redundancy, vectors @ vectors[choice])
+
+        with self._lock:
+            self.requests += 1
+            self.candidates += len(candidates)
+            self.passed += len(picked)
+            self.dropped += min(max_chunks, len(candidates)) - len(picked)
+            self.budget_exits += budget_exit
+        return [(candidates[i][0], float(relevance[i]), candidates[i][2]) for i in picked]
+
+    def stats(self) -> dict:
+        return {
+            'requests': self.requests,
+            'candidates': self.candidates,
+            'passed': self.passed,
+            'dropped': self.dropped,
+            'budget_exits': self.budget_exits,
+            'mean_chunks': round(self.passed / self.requests, 2) if self.requests else 0.0
+        }
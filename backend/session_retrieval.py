@@ -0,0 +1,108 @@
+import threading
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+Results = List[Tuple[str, float, str]]  # retrieve() results: (chunk, score, source)
+
+
+class _SessionState:
+    __slots__ = ('last_embedding', 'topic', 'results', 'corpus_version', 'sources')
+
+    def __init__(self, last_embedding: np.ndarray, topic: np.ndarray, results: Results,
+                 corpus_version: int, sources: Optional[tuple]):
+        self.last_embedding = last_embedding
+        self.topic = topic
+        self.results = results
+        self.corpus_version = corpus_version
+        self.sources = sources
+
+
+class SessionRetrieval:
+    """Recent retrieval state per chat session, so follow-up questions retrieve in context.
+
+    Each session keeps its last query embedding and results, and a topic
+    vector: a decaying average of its query embeddings. plan() tells a new
+    query either to reuse the last results (it is within reuse_similarity
+    of the last query, on the same corpus version and source filter) or to
+    search with its embedding blended with the topic, so "and the second
+    step?" still lands near what the conversation is about.
+
+    At most max_sessions are kept, least recently used evicted first; each
+    holds two vectors and references to chunks already in the store.
+    """
+
+    def __init__(self, max_sessions: int = 1024, blend_weight: float = 0.3, reuse_similarity: float = 0.92,
+                 topic_decay: float = 0.5):
+        self.max_sessions = max_sessions
+        self.blend_weight = blend_weight
+        self.reuse_similarity = reuse_similarity
+        self.topic_decay = topic_decay
+        self.reused = 0
+        self.blended = 0
+        self._sessions: "OrderedDict[str, _SessionState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    @staticmethod
+    def _sources_key(sources: Optional[Iterable[str]]) -> Optional[tuple]:
+        return tuple(sorted(set(sources))) if sources is not None else None
+
+    def active(self, session_id: Optional[str]) -> bool:
+        """Whether the session has earlier turns to build on."""
+        return session_id is not None and session_id in self._sessions
+
+    def plan(self, session_id: str, query_embedding: Sequence[float], corpus_version: int,
+             sources: Optional[Iterable[str]] = None) -> Tuple[Optional[np.ndarray], Optional[Results]]:
+        """(embedding to search with, None) or (None, results to reuse) for the session's next query."""
+        query = self._normalize(query_embedding)
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None or query is None:
+                return query_embedding, None
+            self._sessions.move_to_end(session_id)
+
+            if state.corpus_version == corpus_version and state.sources == self._sources_key(sources) \
+                    and float(state.last_embedding @ query) >= self.reuse_similarity:
+                self.reused += 1
+                return None, state.results
+
+            self.blended += 1
+            return self._normalize(query + self.blend_weight * state.topic), None
+
+    def record(self, session_id: str, query_embedding: Sequence[float], results: Results, corpus_version: int,
+               sources: Optional[Iterable[str]] = None) -> None:
+        """Remember a turn's query and results; updates the session's topic."""
+        query = self._normalize(query_embedding)
+        if query is None or self.max_sessions <= 0:
+            return
+        with self._lock:
+            state = self._sessions.get(session_id)
+            topic = query if state is None else self._normalize(self.topic_decay * state.topic + query)
+            self._sessions[session_id] = _SessionState(query, topic if topic is not None else query, results,
+                                                       corpus_version, self._sources_key(sources))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def discard(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> dict:
+        return {
+            'sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'reused': self.reused,
+            'blended': self.blended
+        }
@@ -0,0 +1,72 @@
+"""Shared setup: every store in a temporary directory, no Ollama needed.
+
+main.py and app.py read their settings and open their stores at import,
+so the environment is set here before any test module imports them.
+Embeddings come from the stub backend and generation from fake_ollama.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import uuid
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from fake_ollama import FakeOllamaServer  # noqa: E402
+
+WORKDIR = tempfile.mkdtemp(prefix='rag-tests-')
+SERVER = FakeOllamaServer(dim=64)
+SERVER.start_background()
+
+os.environ.update({
+    'OLLAMA_HOST': SERVER.url,
+    'EMBEDDING_BACKEND': 'stub',
+    'EMBEDDING_DIM': '64',
+    'VECTOR_INDEX_DIR': os.path.join(WORKDIR, 'vector_index'),
+    'EMBEDDING_CACHE_PATH': os.path.join(WORKDIR, 'embedding_cache.db'),
+    'DATABASE_URL': f"sqlite:///{os.path.join(WORKDIR, 'chat.db')}"
+})
+
+
+def pytest_sessionfinish(session, exitstatus):
+    SERVER.shutdown()
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(autouse=True, scope='session')
+def in_workdir():
+    """app.py keeps uploads under ./uploads, so tests run from the temporary directory."""
+    cwd = os.getcwd()
+    os.chdir(WORKDIR)
+    yield
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def flask_app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def client(flask_app):
+    return flask_app.test_client()
+
+
+@pytest.fixture
+def register(client):
+    """Registers a new user and returns their Authorization header."""
+    def register_user():
+        username = f'user-{uuid.uuid4().hex[:8]}'
+        client.post('/api/auth/register', json={'username': username, 'password': 'password123'})
+        token = client.post('/api/auth/login', json={'username': username, 'password': 'password123'}).json['token']
+        return {'Authorization': f'Bearer {token}'}
+    return register_user
+
+
+@pytest.fixture
+def auth_headers(register):
+    return register()
@@ -0,0 +1,64 @@
+import numpy as np
+
+from answer_cache import AnswerCache
+from embedding_backends import stub_embedding
+from embedding_cache import EmbeddingCache
+
+RESULT = {'response': 'Weekly.', 'sources': ['pumps.txt'], 'chunks_used': 1}
+
+
+def test_embedding_cache_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'))
+    cache.put_many('model', ['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+
+    reopened = EmbeddingCache(str(tmp_path / 'cache.db'))
+    found = reopened.get_many('model', ['a', 'missing', 'b'])
+    assert np.array_equal(found[0], [1.0, 2.0])
+    assert found[1] is None
+    assert np.array_equal(found[2], [3.0, 4.0])
+    assert reopened.get('other-model', 'a') is None
+    assert (reopened.hits, reopened.misses) == (2, 2)
+
+
+def test_embedding_cache_hits_are_read_only(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / 'cache.db'))
+    cache.put('model', 'a', [1.0])
+    changes = cache._conn.total_changes
+    assert cache.get('model', 'a') is not None
+    assert cache._conn.total_changes == changes
+
+
+def test_embedding_cache_evicts_by_shared_size(tmp_path):
+    # Two workers on one file, each inserting fewer rows than the limit
+    first = EmbeddingCache(str(tmp_path / 'cache.db'), max_entries=10)
+    second = EmbeddingCache(str(tmp_path / 'cache.db'), max_entries=10)
+    first.put_many('model', [f'first {i}' for i in range(6)], [[float(i)] for i in range(6)])
+    second.put_many('model', [f'second {i}' for i in range(6)], [[float(i)] for i in range(6)])
+    assert second.stats()['entries'] == 9
+    # The oldest rows go first
+    assert first.get('model', 'first 0') is None
+    assert second.get('model', 'second 5') is not None
+
+
+def test_answer_cache_matches_normalized_and_similar_questions():
+    cache = AnswerCache(similarity_threshold=0.95)
+    embedding = stub_embedding('How often are pumps checked?', 64)
+    cache.put('How often are pumps checked?', 1, RESULT, embedding)
+
+    assert cache.lookup('  how often are PUMPS checked ', 1) == RESULT
+    assert cache.lookup_similar(embedding + 0.01 * stub_embedding('noise', 64), 1) == RESULT
+    assert cache.lookup_similar(stub_embedding('Who greases the valves?', 64), 1) is None
+
+
+def test_answer_cache_is_scoped_to_corpus_and_sources():
+    cache = AnswerCache()
+    cache.put('How often are pumps checked?', 1, RESULT, None, ['pumps.txt'])
+    assert cache.lookup('How often are pumps checked?', 2, ['pumps.txt']) is None
+    assert cache.lookup('How often are pumps checked?', 1) is None
+    assert cache.lookup('How often are pumps checked?', 1, ['pumps.txt']) == RESULT
+
+
+def test_answer_cache_expires_entries():
+    cache = AnswerCache(ttl_seconds=-1)
+    cache.put('How often are pumps checked?', 1, RESULT, None)
+    assert cache.lookup('How often are pumps checked?', 1) is None
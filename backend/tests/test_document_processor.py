@@ -0,0 +1,72 @@
+import random
+
+import pytest
+
+from document_processor import DocumentProcessor, TextChunker, count_tokens
+
+
+def sample_text(sentences=200, seed=0):
+    rng = random.Random(seed)
+    words = ['pump', 'valve', 'pressure', 'seal', 'operator', 'shift', 'check', 'filter', 'log', 'safety']
+    return ' '.join(' '.join(rng.choice(words) for _ in range(rng.randint(4, 18))).capitalize() + '.'
+                    for _ in range(sentences))
+
+
+@pytest.mark.parametrize('size, overlap', [(200, 20), (500, 50), (120, 60)])
+def test_spans_cover_text_in_order(size, overlap):
+    text = sample_text()
+    spans = list(TextChunker(size, overlap).spans(text))
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for (start, end), (next_start, next_end) in zip(spans, spans[1:]):
+        # Neighbours overlap by at most `overlap` and leave no gap
+        assert start < next_start <= end
+        assert end - next_start <= overlap
+        assert end < next_end
+    for start, end in spans:
+        assert end - start <= size
+        assert text[start:end] == text[start:end].strip()
+
+
+def test_chunks_end_at_sentences_when_possible():
+    text = sample_text()
+    spans = list(TextChunker(300, 30).spans(text))
+    for start, end in spans[:-1]:
+        chunk = text[start:end]
+        if '.' in chunk[len(chunk) // 2:]:
+            assert chunk.endswith('.')
+
+
+def test_token_unit_sizes():
+    text = sample_text()
+    spans = list(TextChunker(64, 8, unit='tokens').spans(text))
+    assert all(count_tokens(text[start:end]) <= 64 for start, end in spans)
+    assert all(count_tokens(text[next_start:end]) <= 8 for (_, end), (next_start, _) in zip(spans, spans[1:]))
+
+
+def test_streamed_segments_match_whole_text():
+    pages = [sample_text(30, seed) for seed in range(5)]
+    streamed = list(DocumentProcessor.iter_chunks(enumerate(pages, 1), 250, 25))
+    assert [chunk.text for chunk in streamed] == DocumentProcessor.chunk_text(' '.join(pages), 250, 25)
+
+    # Each chunk is labelled with the page it starts on
+    offset, page_starts = 0, []
+    for page in pages:
+        page_starts.append(offset)
+        offset += len(page) + 1
+    joined = ' '.join(pages)
+    position = 0
+    for chunk in streamed:
+        start = joined.index(chunk.text, position)
+        assert chunk.page == max(number for number, page_start in enumerate(page_starts, 1) if page_start <= start)
+        position = start + 1
+
+
+def test_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        TextChunker(100, 60)
+    with pytest.raises(ValueError):
+        TextChunker(0, 0)
+    with pytest.raises(ValueError):
+        TextChunker(100, 10, unit='words')
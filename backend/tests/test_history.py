@@ -0,0 +1,55 @@
+from datetime import datetime, timedelta
+
+from database import ChatMessage, db
+
+
+def pages(client, url, headers, limit):
+    """Follow X-Next-Cursor from the first page to the last."""
+    result, cursor = [], None
+    while True:
+        query = {'limit': limit, 'before': cursor} if cursor else {'limit': limit}
+        response = client.get(url, headers=headers, query_string=query)
+        assert response.status_code == 200
+        result.append(response.json)
+        cursor = response.headers.get('X-Next-Cursor')
+        if not cursor:
+            return result
+
+
+def test_sessions_page_newest_first(client, auth_headers):
+    created = [client.post('/api/history', headers=auth_headers).json['id'] for _ in range(7)]
+
+    result = pages(client, '/api/history', auth_headers, limit=3)
+    assert [len(page) for page in result] == [3, 3, 1]
+    listed = [session['id'] for page in result for session in page]
+    assert sorted(listed) == sorted(created)
+    stamps = [session['created_at'] for page in result for session in page]
+    assert stamps == sorted(stamps, reverse=True)
+
+
+def test_messages_page_back_in_time(flask_app, client, auth_headers):
+    session_id = client.post('/api/history', headers=auth_headers).json['id']
+    start = datetime(2024, 1, 1)
+    with flask_app.app_context():
+        # Pairs of messages share a timestamp, so pages must break ties on id
+        db.session.add_all([ChatMessage(session_id=session_id, role='user', content=f'message {i}',
+                                        created_at=start + timedelta(seconds=i // 2)) for i in range(11)])
+        db.session.commit()
+
+    result = pages(client, f'/api/history/{session_id}', auth_headers, limit=4)
+    assert [len(page) for page in result] == [4, 4, 3]
+    # Each page is chronological; later pages hold older messages
+    contents = [message['content'] for page in reversed(result) for message in page]
+    assert contents == [f'message {i}' for i in range(11)]
+
+
+def test_sessions_are_private(client, auth_headers, register):
+    session_id = client.post('/api/history', headers=auth_headers).json['id']
+    other_user = register()
+    assert client.get(f'/api/history/{session_id}', headers=other_user).status_code == 404
+    assert client.get('/api/history', headers=other_user).json == []
+
+
+def test_invalid_cursor(client, auth_headers):
+    response = client.get('/api/history', headers=auth_headers, query_string={'before': 'not-a-cursor'})
+    assert response.status_code == 400
@@ -0,0 +1,90 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import IngestionJob, db
+from ingestion_queue import IngestionQueue, QueueFullError
+
+
+@pytest.fixture
+def queue(flask_app):
+    """A queue whose jobs stay queued, for counting against the limits."""
+    ingestion_queue = IngestionQueue(flask_app, max_workers=1, max_pending=3, max_pending_per_user=2, job_timeout=60)
+    ingestion_queue._executor.submit = lambda *args: None
+    with flask_app.app_context():
+        IngestionJob.query.delete()
+        db.session.commit()
+        yield ingestion_queue
+        IngestionJob.query.delete()
+        db.session.commit()
+
+
+def submit(queue, user_id):
+    return queue.submit(user_id, 'doc.txt', '/nonexistent/staged', '/nonexistent/upload')
+
+
+def test_per_user_limit(queue):
+    submit(queue, 1)
+    submit(queue, 1)
+    with pytest.raises(QueueFullError, match='maximum number of uploads'):
+        submit(queue, 1)
+    assert submit(queue, 2).status == 'queued'
+
+
+def test_global_limit(queue):
+    for user_id in (1, 2, 3):
+        submit(queue, user_id)
+    with pytest.raises(QueueFullError, match='Too many documents'):
+        submit(queue, 4)
+
+
+def test_finished_jobs_free_their_slots(queue):
+    first = submit(queue, 1)
+    submit(queue, 1)
+    queue._update(first.id, status='completed')
+    submit(queue, 1)
+
+
+def test_stale_jobs_are_failed_and_their_files_removed(queue, tmp_path):
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    for status in ('queued', 'processing'):
+        db.session.add(IngestionJob(user_id=1, filename='lost.txt', status=status,
+                                    created_at=long_ago, started_at=long_ago if status == 'processing' else None))
+    db.session.commit()
+    # Orphaned jobs don't hold slots even before they are cleaned up
+    submit(queue, 1)
+    submit(queue, 1)
+    IngestionJob.query.filter_by(filename='doc.txt').delete()
+    db.session.commit()
+
+    old_file, new_file = tmp_path / 'old-lost.txt', tmp_path / 'new-doc.txt'
+    old_file.write_text('lost')
+    new_file.write_text('waiting')
+    os.utime(old_file, (time.time() - 3600,) * 2)
+
+    assert queue.fail_stale_jobs(str(tmp_path)) == 2
+    assert {job.status for job in IngestionJob.query.all()} == {'failed'}
+    assert not old_file.exists()
+    assert new_file.exists()
+
+
+def test_job_runs_to_completion(flask_app, tmp_path):
+    import main
+
+    ingestion_queue = IngestionQueue(flask_app, max_workers=1)
+    staged, upload = tmp_path / 'staged-manual.txt', tmp_path / 'manual.txt'
+    staged.write_text('Check the pump pressure before every shift. ' * 40)
+
+    with flask_app.app_context():
+        job_id = ingestion_queue.submit(1, 'queue-manual.txt', str(staged), str(upload)).id
+    ingestion_queue._executor.shutdown(wait=True)
+
+    with flask_app.app_context():
+        job = db.session.get(IngestionJob, job_id)
+        assert (job.status, job.progress) == ('completed', 100)
+        assert job.to_dict()['stages']['embed']['items'] > 0
+    assert upload.exists() and not staged.exists()
+    assert main.VECTOR_DB.documents()['queue-manual.txt'] > 0
+    assert main.delete_document('queue-manual.txt') > 0
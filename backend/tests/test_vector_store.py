@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+
+from embedding_backends import stub_embedding
+from vector_store import VectorStore
+
+DOCUMENTS = {
+    'pumps.txt': ['Pumps are checked weekly for pressure.', 'Pump seals are replaced yearly.'],
+    'valves.txt': ['Valves are greased every month.', 'Stuck valves are reported to the supervisor.'],
+    'filters.txt': ['Filters are cleaned after every shift.']
+}
+
+
+def embed(text):
+    return stub_embedding(text, 64)
+
+
+def fill(store):
+    for source, chunks in DOCUMENTS.items():
+        store.add_many(chunks, [embed(chunk) for chunk in chunks], [source] * len(chunks),
+                       pages=list(range(1, len(chunks) + 1)))
+
+
+@pytest.mark.parametrize('storage', ['float32', 'float16', 'int8'])
+def test_save_load_round_trip(tmp_path, storage):
+    store = VectorStore(storage=storage)
+    fill(store)
+    assert store.save(str(tmp_path)) == 1
+
+    loaded = VectorStore(storage=storage)
+    assert loaded.load(str(tmp_path))
+    assert loaded.generation == 1
+    assert loaded.documents() == {source: len(chunks) for source, chunks in DOCUMENTS.items()}
+    assert [(loaded.chunks[row], loaded.sources[row], loaded.pages[row]) for row in loaded.live_rows()] == \
+        [(store.chunks[row], store.sources[row], store.pages[row]) for row in store.live_rows()]
+
+    for chunks in DOCUMENTS.values():
+        for chunk in chunks:
+            best, similarity, _ = loaded.search(embed(chunk), top_n=1, exact=True)[0]
+            assert best == chunk
+            assert similarity == pytest.approx(1.0, abs=0.02)
+    assert loaded.lexical_search('greased', top_n=1)[0][2] == 'valves.txt'
+
+
+def test_removed_source_stays_removed_after_reload(tmp_path):
+    store = VectorStore()
+    fill(store)
+    assert store.remove_source('valves.txt') == 2
+    assert store.remove_source('valves.txt') == 0
+    store.save(str(tmp_path))
+
+    loaded = VectorStore()
+    loaded.load(str(tmp_path))
+    assert len(loaded) == 3
+    assert 'valves.txt' not in loaded.documents()
+    results = loaded.search(embed(DOCUMENTS['valves.txt'][0]), top_n=5, exact=True)
+    assert all(source != 'valves.txt' for _, _, source in results)
+    assert loaded.lexical_search('greased valves') == []
+
+
+def test_search_restricted_to_sources(tmp_path):
+    store = VectorStore()
+    fill(store)
+    results = store.search(embed(DOCUMENTS['pumps.txt'][0]), top_n=5, sources=['filters.txt'], exact=True)
+    assert [source for _, _, source in results] == ['filters.txt']
+
+
+def test_refresh_picks_up_another_writers_generation(tmp_path):
+    writer, reader = VectorStore(), VectorStore()
+    fill(writer)
+    writer.save(str(tmp_path))
+    assert reader.refresh(str(tmp_path))
+    assert not reader.refresh(str(tmp_path))
+
+    writer.add('Belts are inspected daily.', embed('Belts are inspected daily.'), 'belts.txt')
+    writer.save(str(tmp_path))
+    assert reader.refresh(str(tmp_path))
+    assert reader.generation == 2
+    assert reader.documents()['belts.txt'] == 1
+
+
+def test_add_many_rejects_mismatched_dimensions():
+    store = VectorStore()
+    fill(store)
+    with pytest.raises(ValueError):
+        store.add_many(['short'], [np.ones(8)], ['short.txt'])
@@ -0,0 +1,678 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+import numpy as np
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from lexical_index import BM25Index
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads in this process are serialised
+    fcntl = None
+
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = '.lock'
+
+STORAGE_DTYPES = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}
+SCORE_BLOCK_ROWS = 4096  # Quantized rows decoded at a time when scoring; small enough to stay in cache
+
+
+def quantize(vectors: np.ndarray, storage: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode normalized float32 rows for `storage`; int8 also returns each row's scale."""
+    if storage == 'int8':
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return vectors.astype(STORAGE_DTYPES[storage]), None
+
+
+class VectorStore:
+    """Contiguous float32 embedding matrix with parallel chunk/source/page lists.
+
+    Rows are L2-normalized on insert, so cosine similarity against a query
+    is a single matrix-vector product. A saved store is reloaded as a
+    read-only memory map; the first insert afterwards copies it to the heap.
+
+    Deleting rows only clears their bit in an alive mask, so removing a
+    document never rebuilds the matrix; dead rows are dropped on save.
+
+    Saving remaps the written generation, so every process serving the same
+    index directory shares one page-cache copy of the embeddings; refresh()
+    picks up generations saved by other processes.
+
+    Once the store holds ann_min_rows chunks, an approximate index built by
+    ann_factory (e.g. IVFIndex) answers unfiltered searches; smaller stores
+    and source-filtered or exact searches use the brute-force scan.
+
+    A BM25 inverted index over the chunk text is kept row-aligned with the
+    embeddings; hybrid_search() fuses both rankings so exact codes and
+    acronyms are found even when their embeddings are not close.
+
+    `storage` picks the in-memory precision: 'float32', 'float16' (half
+    the memory) or 'int8' with a float32 scale per row (about a quarter).
+    Quantized stores score rescore_factor times as many candidates as asked
+    for, then rerank those on full-precision vectors. These are saved with
+    each generation and memory-mapped, so they cost page cache only for the
+    rows a query touches. A rescore_factor of 0 drops them altogether.
+
+    Quantized rows are decoded to float32 a block at a time for scoring,
+    since numpy has no BLAS path for either type. For int8 that costs
+    little: brute-force search over 5k x 768 takes about 1.8 ms p50 against
+    0.85 ms for float32. numpy converts float16 far more slowly, so the same
+    search takes about 11 ms, and the gap grows with the corpus (115 ms
+    against 15 ms at 50k rows). int8 is the better way to save memory;
+    float16 suits stores large enough that the ANN index scores only a few
+    lists per query. See benchmarks/bench_quantization.py.
+    """
+
+    def __init__(self, initial_capacity: int = 1024, ann_factory: Optional[Callable[[], object]] = None,
+                 ann_min_rows: int = 50_000, storage: str = 'float32', rescore_factor: int = 4):
+        if storage not in STORAGE_DTYPES:
+            raise ValueError(f"Unknown embedding storage: {storage}")
+        self.initial_capacity = initial_capacity
+        self.ann_factory = ann_factory
+        self.ann_min_rows = ann_min_rows
+        self.storage = storage
+        self.rescore_factor = rescore_factor
+        # Quantized stores keep full-precision rows for rescoring: the first
+        # _exact_saved_rows come from the saved generation, later ones from _exact_tail
+        self.keeps_exact = storage != 'float32' and rescore_factor > 0
+        self.ann = None
+        self.lexical = BM25Index()
+        self.generation = 0
+        self._manifest_stamp = None
+        self.dim = None
+        self.chunks: List[str] = []
+        self.sources: List[str] = []
+        self.pages: List[Optional[int]] = []
+        self._embeddings = None
+        self._scales = None  # int8 storage: each row's dequantization scale
+        self._exact_saved = None
+        self._exact_saved_rows = 0
+        self._exact_tail = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows_by_source: Dict[str, List[int]] = {}
+        self._size = 0
+        self._deleted = 0
+        # Ingestion threads mutate the store while request threads search it
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._size - self._deleted
+
+    def __iter__(self) -> Iterator[Tuple[str, np.ndarray, str]]:
+        for i in self.live_rows():
+            yield self.chunks[i], self.vectors(np.array([i]))[0], self.sources[i]
+
+    @property
+    def embeddings(self) -> np.ndarray:
+        """View of the populated embedding rows as stored, including deleted ones."""
+        if self._embeddings is None:
+            return np.empty((0, self.dim or 0), dtype=STORAGE_DTYPES[self.storage])
+        return self._embeddings[:self._size]
+
+    def vectors(self, rows) -> np.ndarray:
+        """Normalized float32 vectors for `rows` (an index array or slice), decoded from storage."""
+        stored = self._embeddings[rows]
+        if self.storage == 'float32':
+            return np.asarray(stored)
+        vectors = stored.astype(np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Similarity of `query` to `rows` (every populated row if None) at the stored precision."""
+        if self.storage == 'float32':
+            return (self.embeddings if rows is None else self._embeddings[rows]) @ query
+
+        # Decode in blocks so scoring never materialises a float32 copy of the matrix.
+        # The float16 -> float32 conversion dominates float16 search time (see the class docstring)
+        count = self._size if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        decoded = np.empty((min(count, SCORE_BLOCK_ROWS), self.dim), dtype=np.float32)
+        for start in range(0, count, SCORE_BLOCK_ROWS):
+            stop = min(start + SCORE_BLOCK_ROWS, count)
+            block = slice(start, stop) if rows is None else rows[start:stop]
+            buffer = decoded[:stop - start]
+            buffer[...] = self._embeddings[block]
+            scores[start:stop] = buffer @ query
+            if self._scales is not None:
+                scores[start:stop] *= self._scales[block]
+        return scores
+
+    def _exact_vectors(self, rows: np.ndarray) -> np.ndarray:
+        """Full-precision vectors for rescoring; rows saved without them are decoded instead."""
+        vectors = np.empty((len(rows), self.dim), dtype=np.float32)
+        saved = rows < self._exact_saved_rows
+        if saved.any():
+            vectors[saved] = (self._exact_saved[rows[saved]] if self._exact_saved is not None
+                              else self.vectors(rows[saved]))
+        if not saved.all():
+            vectors[~saved] = self._exact_tail[rows[~saved] - self._exact_saved_rows]
+        return vectors
+
+    def memory_usage(self) -> dict:
+        """Bytes held by the embedding matrix, against what float32 storage would take."""
+        rows = self._size
+        dim = self.dim or 0
+        stored = rows * dim * np.dtype(STORAGE_DTYPES[self.storage]).itemsize
+        if self._scales is not None:
+            stored += rows * 4
+        float32 = rows * dim * 4
+        return {
+            'storage': self.storage,
+            'rescore_factor': self.rescore_factor if self.keeps_exact else 0,
+            'embedding_bytes': stored,
+            'float32_bytes': float32,
+            'saved_bytes': float32 - stored
+        }
+
+    @staticmethod
+    def normalize(vectors: np.ndarray) -> np.ndarray:
+        """L2-normalize rows, leaving zero vectors as zeros."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    def live_rows(self) -> np.ndarray:
+        """Row ids that have not been deleted."""
+        if not self._deleted:
+            return np.arange(self._size)
+        return np.flatnonzero(self._alive[:self._size])
+
+    def _reserve(self, extra: int) -> None:
+        """Grow the embedding matrix so it can hold `extra` more rows."""
+        needed = self._size + extra
+        capacity = 0 if self._embeddings is None else self._embeddings.shape[0]
+        if needed <= capacity:
+            return
+
+        new_capacity = max(self.initial_capacity, capacity * 2, needed)
+        grown = np.empty((new_capacity, self.dim), dtype=STORAGE_DTYPES[self.storage])
+        alive = np.zeros(new_capacity, dtype=bool)
+        if self._size:
+            grown[:self._size] = self._embeddings[:self._size]
+            alive[:self._size] = self._alive[:self._size]
+        self._embeddings = grown
+        self._alive = alive
+        if self.storage == 'int8':
+            scales = np.ones(new_capacity, dtype=np.float32)
+            if self._size:
+                scales[:self._size] = self._scales[:self._size]
+            self._scales = scales
+
+    def _append_exact(self, vectors: np.ndarray) -> None:
+        """Keep full-precision copies of rows added since the last load."""
+        tail_rows = self._size - self._exact_saved_rows
+        capacity = 0 if self._exact_tail is None else len(self._exact_tail)
+        if tail_rows + len(vectors) > capacity:
+            grown = np.empty((max(self.initial_capacity, capacity * 2, tail_rows + len(vectors)), self.dim),
+                             dtype=np.float32)
+            if tail_rows:
+                grown[:tail_rows] = self._exact_tail[:tail_rows]
+            self._exact_tail = grown
+        self._exact_tail[tail_rows:tail_rows + len(vectors)] = vectors
+
+    def add(self, chunk: str, embedding: Sequence[float], source: str) -> None:
+        """Add a single chunk with its embedding."""
+        self.add_many([chunk], [embedding], [source])
+
+    def add_many(self, chunks: Sequence[str], embeddings, sources: Sequence[str],
+                 pages: Optional[Sequence[Optional[int]]] = None) -> None:
+        """Add several chunks at once; all sequences must line up.
+
+        `pages` optionally gives the page number each chunk starts on.
+        """
+        with self._lock:
+            if not len(chunks):
+                return
+
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            if vectors.ndim != 2 or vectors.shape[0] != len(chunks) or len(sources) != len(chunks):
+                raise ValueError("chunks, embeddings and sources must have matching lengths")
+
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            start = self._size
+            vectors = self.normalize(vectors)
+            self._reserve(len(chunks))
+            stored, scales = quantize(vectors, self.storage)
+            self._embeddings[start:start + len(chunks)] = stored
+            if scales is not None:
+                self._scales[start:start + len(chunks)] = scales
+            if self.keeps_exact:
+                self._append_exact(vectors)
+            self._alive[start:start + len(chunks)] = True
+            self.chunks.extend(chunks)
+            self.sources.extend(sources)
+            self.pages.extend(pages if pages is not None else [None] * len(chunks))
+            self.lexical.add(start, chunks)
+            for row, source in enumerate(sources, start):
+                self._rows_by_source.setdefault(source, []).append(row)
+            self._size += len(chunks)
+
+            if self.ann is not None and len(self) <= 4 * self.ann.trained_rows:
+                self.ann.add(np.arange(start, self._size), vectors)
+            else:
+                # Train once the corpus is big enough, and retrain after it has grown 4x
+                self._build_ann()
+
+    def _build_ann(self) -> None:
+        """Train a fresh approximate index over the live rows, if the store is large enough."""
+        if self.ann_factory is None or len(self) < self.ann_min_rows:
+            self.ann = None
+            return
+
+        rows = self.live_rows()
+        ann = self.ann_factory()
+        # Train on a sample and assign rows in blocks, so quantized rows are never all decoded at once
+        sample = rows
+        if len(rows) > ann.max_train_rows:
+            sample = np.sort(np.random.default_rng(ann.seed).choice(rows, ann.max_train_rows, replace=False))
+        ann.train(self.vectors(sample), total_rows=len(rows))
+        for start in range(0, len(rows), SCORE_BLOCK_ROWS):
+            block = rows[start:start + SCORE_BLOCK_ROWS]
+            ann.add(block, self.vectors(block))
+        self.ann = ann
+
+    def remove_rows(self, rows: Iterable[int]) -> int:
+        """Mark rows as deleted; returns how many were live."""
+        with self._lock:
+            removed = {row for row in rows if self._alive[row]}
+            if not removed:
+                return 0
+
+            self._alive[list(removed)] = False
+            self._deleted += len(removed)
+            self.lexical.remove(list(removed))
+            for source in {self.sources[row] for row in removed}:
+                remaining = [row for row in self._rows_by_source[source] if row not in removed]
+                if remaining:
+                    self._rows_by_source[source] = remaining
+                else:
+                    del self._rows_by_source[source]
+            return len(removed)
+
+    def remove_source(self, source: str) -> int:
+        """Delete every chunk of a source document; returns the number removed."""
+        return self.remove_rows(self._rows_by_source.get(source, []))
+
+    def source_rows(self, source: str) -> List[int]:
+        """Live row ids belonging to a source document."""
+        return list(self._rows_by_source.get(source, []))
+
+    def documents(self) -> Dict[str, int]:
+        """Chunk counts per live source document."""
+        return {source: len(rows) for source, rows in self._rows_by_source.items()}
+
+    def clear(self) -> None:
+        """Remove all chunks and release the embedding matrix."""
+        with self._lock:
+            self.dim = None
+            self.chunks = []
+            self.sources = []
+            self.pages = []
+            self._embeddings = None
+            self._scales = None
+            self._exact_saved = None
+            self._exact_saved_rows = 0
+            self._exact_tail = None
+            self._alive = np.zeros(0, dtype=bool)
+            self._rows_by_source = {}
+            self._size = 0
+            self._deleted = 0
+            self.ann = None
+            self.lexical = BM25Index()
+
+    def search(self, query_embedding: Sequence[float], top_n: int = 5,
+               sources: Optional[Iterable[str]] = None, exact: bool = False,
+               nprobe: Optional[int] = None) -> List[Tuple[str, float, str]]:
+        """Return the top_n (chunk, similarity, source) tuples for a query.
+
+        If `sources` is given, only chunks from those documents are scored.
+        `exact` forces a brute-force scan even when an approximate index
+        exists; `nprobe` overrides the index's recall/latency setting.
+        """
+        with self._lock:
+            rows, scores = self._vector_search(query_embedding, top_n, sources, exact, nprobe)
+            return self._results(rows, scores)
+
+    def _vector_search(self, query_embedding: Sequence[float], top_n: int, sources: Optional[Iterable[str]] = None,
+                       exact: bool = False, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_n (rows, similarities) for search(); call with the lock held."""
+        if not len(self) or top_n <= 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        query = self.normalize(np.asarray(query_embedding, dtype=np.float32))
+        if query.shape[-1] != self.dim:
+            raise ValueError(f"Query dimension {query.shape[-1]} does not match store dimension {self.dim}")
+
+        if not self.keeps_exact:
+            return self._first_pass(query, top_n, sources, exact, nprobe)
+
+        # Rerank a wider quantized first pass on full-precision vectors
+        rows, _ = self._first_pass(query, top_n * self.rescore_factor, sources, exact, nprobe)
+        scores = self._exact_vectors(rows) @ query
+        top = np.argsort(-scores, kind='stable')[:top_n]
+        return rows[top], scores[top]
+
+    def _first_pass(self, query: np.ndarray, top_n: int, sources: Optional[Iterable[str]],
+                    exact: bool, nprobe: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_n (rows, similarities) at the stored precision."""
+        if self.ann is not None and sources is None and not exact:
+            alive = self._alive[:self._size] if self._deleted else None
+            top_rows, top_scores = self.ann.search(lambda rows: self._scores(query, rows), query, top_n,
+                                                   alive, nprobe)
+            if len(top_rows) >= min(top_n, len(self)):
+                return top_rows, top_scores
+            # Too few candidates in the probed lists; fall through to the exact scan
+
+        if sources is not None:
+            rows = np.array(sorted(row for source in set(sources) for row in self._rows_by_source.get(source, [])),
+                            dtype=np.int64)
+            scores = self._scores(query, rows)
+        elif self._deleted:
+            rows = self.live_rows()
+            scores = self._scores(query)[rows]
+        else:
+            rows = None
+            scores = self._scores(query)
+
+        if top_n < len(scores):
+            top = np.argpartition(-scores, top_n - 1)[:top_n]
+        else:
+            top = np.arange(len(scores))
+        top = top[np.argsort(-scores[top], kind='stable')]
+        top_rows = top if rows is None else rows[top]
+        return top_rows, scores[top]
+
+    def _results(self, rows: np.ndarray, scores: np.ndarray) -> List[Tuple[str, float, str]]:
+        return [(self.chunks[row], float(score), self.sources[row]) for row, score in zip(rows, scores)]
+
+    def _lexical_search(self, query: str, top_n: int,
+                        sources: Optional[Iterable[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_n (rows, BM25 scores); call with the lock held."""
+        alive = self._alive[:self._size] if self._deleted else None
+        allowed = None
+        if sources is not None:
+            allowed = np.zeros(self._size, dtype=bool)
+            allowed[[row for source in set(sources) for row in self._rows_by_source.get(source, [])]] = True
+        return self.lexical.search(query, top_n, alive, allowed)
+
+    def lexical_search(self, query: str, top_n: int = 5,
+                       sources: Optional[Iterable[str]] = None) -> List[Tuple[str, float, str]]:
+        """Return the top_n (chunk, BM25 score, source) tuples for a query string."""
+        with self._lock:
+            return self._results(*self._lexical_search(query, top_n, sources))
+
+    def hybrid_search(self, query: str, query_embedding: Optional[Sequence[float]], top_n: int = 5,
+                      sources: Optional[Iterable[str]] = None, candidates: int = 50,
+                      rrf_k: int = 60) -> List[Tuple[str, float, str]]:
+        """Fuse BM25 and vector rankings with reciprocal-rank fusion.
+
+        The top `candidates` of each ranking contribute 1 / (rrf_k + rank) per
+        row; the fused score is returned. Without a query embedding this is
+        a BM25-only search.
+        """
+        with self._lock:
+            return self._results(*self._hybrid_search(query, query_embedding, top_n, sources, candidates, rrf_k))
+
+    def hybrid_candidates(self, query: str, query_embedding: Optional[Sequence[float]], top_n: int = 50,
+                          sources: Optional[Iterable[str]] = None, candidates: int = 50,
+                          rrf_k: int = 60) -> Tuple[List[Tuple[str, float, str]], np.ndarray]:
+        """hybrid_search() results plus their normalized float32 embeddings, for a reranking stage."""
+        with self._lock:
+            rows, scores = self._hybrid_search(query, query_embedding, top_n, sources, candidates, rrf_k)
+            vectors = self.vectors(rows) if len(rows) else np.empty((0, self.dim or 0), dtype=np.float32)
+            return self._results(rows, scores), vectors
+
+    def _hybrid_search(self, query: str, query_embedding: Optional[Sequence[float]], top_n: int,
+                       sources: Optional[Iterable[str]], candidates: int,
+                       rrf_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Top_n (rows, fused scores) for hybrid_search(); call with the lock held."""
+        if query_embedding is None:
+            return self._lexical_search(query, top_n, sources)
+
+        fused: Dict[int, float] = {}
+        for rows, _ in (self._vector_search(query_embedding, max(candidates, top_n), sources),
+                        self._lexical_search(query, max(candidates, top_n), sources)):
+            for rank, row in enumerate(rows.tolist(), start=1):
+                fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank)
+
+        top = sorted(fused.items(), key=lambda item: -item[1])[:top_n]
+        return (np.array([row for row, _ in top], dtype=np.int64),
+                np.array([score for _, score in top], dtype=np.float32))
+
+    def save(self, directory: str) -> int:
+        """Atomically write the store to `directory` and return the new generation.
+
+        Each generation gets its own embedding and chunk files; the manifest is
+        swapped in last with os.replace, so readers never see a partial index.
+        The store is then reloaded from the new files, dropping its private
+        copy of the matrix in favour of the shared memory map.
+        """
+        with self._lock:
+            os.makedirs(directory, exist_ok=True)
+            generation = self.generation + 1
+            embeddings_file = f'embeddings-{generation}.npy'
+            chunks_file = f'chunks-{generation}.json'
+
+            # Deleted rows are compacted away in the written generation
+            rows = self.live_rows()
+            with _atomic_open(os.path.join(directory, embeddings_file), 'wb') as f:
+                np.save(f, np.ascontiguousarray(self.embeddings[rows]))
+
+            scales_file = None
+            if self._scales is not None:
+                scales_file = f'scales-{generation}.npy'
+                with _atomic_open(os.path.join(directory, scales_file), 'wb') as f:
+                    np.save(f, self._scales[rows])
+
+            exact_file = None
+            if self.keeps_exact:
+                exact_file = f'exact-{generation}.npy'
+                with _atomic_open(os.path.join(directory, exact_file), 'wb') as f:
+                    np.save(f, self._exact_vectors(rows))
+
+            with _atomic_open(os.path.join(directory, chunks_file), 'w') as f:
+                json.dump({
+                    'chunks': [self.chunks[row] for row in rows],
+                    'sources': [self.sources[row] for row in rows],
+                    'pages': [self.pages[row] for row in rows]
+                }, f)
+
+            lexical_file = f'lexical-{generation}.npz'
+            with _atomic_open(os.path.join(directory, lexical_file), 'wb') as f:
+                np.savez(f, **self.lexical.state(rows, self._size))
+
+            ann_file = None
+            if self.ann is not None:
+                ann_file = f'ann-{generation}.npz'
+                with _atomic_open(os.path.join(directory, ann_file), 'wb') as f:
+                    np.savez(f, **self.ann.state(rows, self._size))
+
+            with _atomic_open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+                json.dump({
+                    'generation': generation,
+                    'count': len(self),
+                    'dim': self.dim,
+                    'storage': self.storage,
+                    'embeddings': embeddings_file,
+                    'scales': scales_file,
+                    'exact': exact_file,
+                    'chunks': chunks_file,
+                    'ann': ann_file,
+                    'lexical': lexical_file
+                }, f)
+
+            _remove_stale_files(directory, keep={MANIFEST_FILE, LOCK_FILE, embeddings_file, chunks_file,
+                                                  ann_file, lexical_file, scales_file, exact_file})
+            self.load(directory)
+            return generation
+
+    def load(self, directory: str) -> bool:
+        """Replace the store contents with the index saved in `directory`.
+
+        Embeddings are memory-mapped rather than read, so loading is O(1) in
+        the corpus size. An index saved with a different storage mode is
+        re-encoded in memory, and written in this store's mode on the next
+        save. Returns False if there is no saved index.
+        """
+        with self._lock:
+            manifest_path = os.path.join(directory, MANIFEST_FILE)
+            if not os.path.exists(manifest_path):
+                return False
+
+            stamp = _file_stamp(manifest_path)
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+
+            with open(os.path.join(directory, manifest['chunks']), 'r', encoding='utf-8') as f:
+                sidecar = json.load(f)
+
+            self.clear()
+            if manifest['count']:
+                self._load_embeddings(directory, manifest)
+                self.dim = manifest['dim']
+                self.chunks = sidecar['chunks']
+                self.sources = sidecar['sources']
+                self.pages = sidecar.get('pages') or [None] * len(self.sources)
+                self._size = manifest['count']
+                self._alive = np.ones(self._size, dtype=bool)
+                for row, source in enumerate(self.sources):
+                    self._rows_by_source.setdefault(source, []).append(row)
+                self._load_ann(directory, manifest.get('ann'))
+                if manifest.get('lexical'):
+                    with np.load(os.path.join(directory, manifest['lexical'])) as state:
+                        self.lexical.load_state(state)
+                else:
+                    # Saved before the lexical index existed
+                    self.lexical.add(0, self.chunks)
+            self.generation = manifest['generation']
+            self._manifest_stamp = stamp
+            return True
+
+    def _load_embeddings(self, directory: str, manifest: dict) -> None:
+        """Map the saved embedding files, converting them if they were saved in another storage mode."""
+        def mapped(name: Optional[str]) -> Optional[np.ndarray]:
+            return np.load(os.path.join(directory, name), mmap_mode='r') if name else None
+
+        saved_storage = manifest.get('storage', 'float32')
+        embeddings, scales, exact = mapped(manifest['embeddings']), mapped(manifest.get('scales')), \
+            mapped(manifest.get('exact'))
+        if exact is None and saved_storage == 'float32':
+            exact = embeddings
+
+        if saved_storage == self.storage:
+            self._embeddings, self._scales = embeddings, scales
+        else:
+            vectors = exact if exact is not None else embeddings.astype(np.float32)
+            if exact is None and scales is not None:
+                vectors *= scales[:, None]
+            self._embeddings, self._scales = quantize(np.asarray(vectors, dtype=np.float32), self.storage)
+
+        if self.keeps_exact:
+            # Without saved full-precision rows, rescoring decodes the quantized ones
+            self._exact_saved = exact
+            self._exact_saved_rows = manifest['count']
+
+    def refresh(self, directory: str) -> bool:
+        """Reload if another process saved a newer generation; True if it did.
+
+        Costs one stat() when nothing changed, so it is cheap to call per request.
+        """
+        manifest_path = os.path.join(directory, MANIFEST_FILE)
+        try:
+            stamp = _file_stamp(manifest_path)
+        except FileNotFoundError:
+            return False
+        if stamp == self._manifest_stamp:
+            return False
+
+        with self._lock:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                generation = json.load(f)['generation']
+            if generation == self.generation:
+                self._manifest_stamp = stamp
+                return False
+            return self.load(directory)
+
+    def _load_ann(self, directory: str, ann_file: Optional[str]) -> None:
+        """Restore the saved approximate index, or train one if it is missing."""
+        if self.ann_factory is None or len(self) < self.ann_min_rows:
+            return
+        if not ann_file:
+            self._build_ann()
+            return
+
+        with np.load(os.path.join(directory, ann_file)) as state:
+            ann = self.ann_factory()
+            unassigned = ann.load_state(state)
+        if len(unassigned):
+            ann.add(unassigned, self.vectors(unassigned))
+        self.ann = ann
+
+
+_process_lock = threading.Lock()
+
+
+@contextmanager
+def index_lock(directory: str):
+    """Exclusive lock on an index directory, across threads and processes.
+
+    Writers hold it from refresh() through save(), so concurrent ingestions
+    in different workers never build on the same generation.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _process_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _file_stamp(path: str) -> tuple:
+    """Identity of a file's current contents; os.replace always changes it."""
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def _atomic_open(path: str, mode: str):
+    """Write to a temporary file and move it over `path` once fully flushed."""
+    tmp_path = f'{path}.tmp'
+    encoding = None if 'b' in mode else 'utf-8'
+    try:
+        with open(tmp_path, mode, encoding=encoding) as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _remove_stale_files(directory: str, keep: set) -> None:
+    """Delete index files from older generations or interrupted saves."""
+    for name in os.listdir(directory):
+        if name in keep or not (name.startswith(('embeddings-', 'chunks-', 'ann-', 'lexical-', 'scales-', 'exact-')) or name.endswith('.tmp')):
+            continue
+        try:
+            os.unlink(os.path.join(directory, name))
+        except OSError as e:
+            # Another process may still have the old generation mapped (Windows)
+            print(f"Could not remove stale index file {name}: {e}")
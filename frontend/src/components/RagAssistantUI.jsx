@@ -16,6 +16,7 @@ import { API_BASE_URL } from "../config";
 const RagAssistantUI = ({ sessionId }) => {
   const [isDarkTheme, setIsDarkTheme] = useState(true);
   const [messages, setMessages] = useState([]);
+  const [olderCursor, setOlderCursor] = useState(null);
   const [inputText, setInputText] = useState("");
   const [isTyping, setIsTyping] = useState(false);
   const [isUploading, setIsUploading] = useState(false);
@@ -64,9 +65,11 @@ const RagAssistantUI = ({ sessionId }) => {
     }
   }, [sessionId]);
 
-  const fetchMessages = async (id) => {
+  // Loads the latest page; with a cursor, prepends the page of older messages before it
+  const fetchMessages = async (id, cursor = null) => {
     try {
-      const res = await fetch(`${API_BASE_URL}/history/${id}`, {
+      const query = cursor ? `?before=${encodeURIComponent(cursor)}` : '';
+      const res = await fetch(`${API_BASE_URL}/history/${id}${query}`, {
         headers: {
           'Authorization': `Bearer ${token}`,
           'ngrok-skip-browser-warning': 'true'
@@ -74,12 +77,14 @@ const RagAssistantUI = ({ sessionId }) => {
       });
       if (res.ok) {
         const data = await res.json();
-        setMessages(data.map((msg, idx) => ({
-          id: idx,
+        const page = data.map((msg) => ({
+          id: `history-${msg.id}`,
           text: msg.content,
           sender: msg.role === 'assistant' ? 'bot' : 'user',
           timestamp: new Date(msg.created_at)
-        })));
+        }));
+        setMessages(prev => cursor ? [...page, ...prev] : page);
+        setOlderCursor(res.headers.get('X-Next-Cursor'));
       }
     } catch (err) {
       console.error("Failed to fetch messages", err);
@@ -500,6 +505,16 @@ const RagAssistantUI = ({ sessionId }) => {
         <div
           className="flex-1 overflow-y-auto px-4 py-6 space-y-4 custom-scrollbar"
         >
+          {sessionId && olderCursor && (
+            <div className="flex justify-center">
+              <button
+                onClick={() => fetchMessages(sessionId, olderCursor)}
+                className="text-sm text-gray-400 hover:text-white px-3 py-1 rounded-lg hover:bg-white/5 transition-colors"
+              >
+                Load earlier messages
+              </button>
+            </div>
+          )}
           {messages.map((message, index) => (
             <div
               key={message.id}
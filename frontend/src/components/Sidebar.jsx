@@ -6,6 +6,7 @@ import { API_BASE_URL } from '../config';
 
 const Sidebar = ({ currentSessionId, onSelectSession, onNewChat }) => {
     const [sessions, setSessions] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
     const { token, logout, user } = useAuth();
     const navigate = useNavigate();
 
@@ -13,9 +14,11 @@ const Sidebar = ({ currentSessionId, onSelectSession, onNewChat }) => {
         fetchHistory();
     }, [currentSessionId]); // Refresh when session changes
 
-    const fetchHistory = async () => {
+    // Without a cursor this reloads the first page; with one it appends the next page
+    const fetchHistory = async (cursor = null) => {
         try {
-            const res = await fetch(`${API_BASE_URL}/history`, {
+            const query = cursor ? `?before=${encodeURIComponent(cursor)}` : '';
+            const res = await fetch(`${API_BASE_URL}/history${query}`, {
                 headers: {
                     'Authorization': `Bearer ${token}`,
                     'ngrok-skip-browser-warning': 'true'
@@ -23,7 +26,8 @@ const Sidebar = ({ currentSessionId, onSelectSession, onNewChat }) => {
             });
             if (res.ok) {
                 const data = await res.json();
-                setSessions(data);
+                setSessions(prev => cursor ? [...prev, ...data] : data);
+                setNextCursor(res.headers.get('X-Next-Cursor'));
             }
         } catch (err) {
             console.error("Failed to fetch history", err);
@@ -102,6 +106,14 @@ const Sidebar = ({ currentSessionId, onSelectSession, onNewChat }) => {
                         </button>
                     </div>
                 ))}
+                {nextCursor && (
+                    <button
+                        onClick={() => fetchHistory(nextCursor)}
+                        className="w-full text-gray-400 hover:text-white text-sm py-2 rounded-lg hover:bg-white/5 transition-colors"
+                    >
+                        Load more
+                    </button>
+                )}
             </div>
 
             <div className="p-4 border-t border-white/10 bg-black/20">